@@ -0,0 +1,83 @@
+# benchmarks/bench_consultas.py
+"""
+Benchmark del costo en Python de preparar las consultas frecuentes de core.repo.
+
+No necesita base de datos. Por cada consulta mide, en microsegundos por llamada:
+  - armado: construir el select() con joins y columnas (lo que antes se hacía en
+    cada refresco de pantalla),
+  - clave: calcular la clave de caché de la sentencia prearmada, que es lo único
+    que hace SQLAlchemy en cada execute para encontrar la forma compilada,
+  - compilación: compilar a SQL de PostgreSQL (solo la primera vez, o si la
+    caché de sentencias compiladas la descartó).
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_consultas
+    python -m benchmarks.bench_consultas --repeticiones 5000 --json resultados.json
+"""
+import sys
+import json
+import time
+import argparse
+
+REPETICIONES = 2000
+
+
+def _casos(repo):
+    # (nombre, función que arma la sentencia, argumentos)
+    return [
+        ("list_inventory_rows", repo._inventory_rows_stmt, (False,)),
+        ("get_available_inventory", repo._available_inventory_stmt, ()),
+        ("list_dispatches_history", repo._dispatches_history_stmt, ()),
+        ("list_dispatches_history (orden cliente, página 2)", repo._dispatches_history_stmt, (True, False, (("client", False), ("date", True)))),
+        ("report_production_period", repo._report_production_stmt, (True, True)),
+        ("report_dispatches_detailed", repo._report_dispatches_stmt, (True, True, True)),
+        ("report_by_lot_range", repo._report_lots_stmt, (True,)),
+    ]
+
+
+def _por_llamada(fn, n):
+    """Microsegundos promedio por llamada de fn()."""
+    t0 = time.perf_counter()
+    for _ in range(n): fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def correr(n):
+    from sqlalchemy.dialects import postgresql
+    from core import repo
+    dialecto = postgresql.dialect()
+    resultados = []
+    for nombre, armar, args in _casos(repo):
+        stmt = armar(*args)
+        resultados.append({
+            "consulta": nombre,
+            "armado_us": round(_por_llamada(lambda: armar.__wrapped__(*args), n), 1),
+            "clave_us": round(_por_llamada(stmt._generate_cache_key, n), 1),
+            "compilacion_us": round(_por_llamada(lambda: stmt.compile(dialect=dialecto), max(1, n // 10)), 1),
+        })
+    return resultados
+
+
+def _imprimir(resultados):
+    cols = ["consulta", "armado_us", "clave_us", "compilacion_us"]
+    anchos = {c: max(len(c), *(len(str(r[c])) for r in resultados)) for c in cols}
+    print("  ".join(c.ljust(anchos[c]) for c in cols))
+    for r in resultados:
+        print("  ".join(str(r[c]).ljust(anchos[c]) for c in cols))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Costo por llamada de armar las consultas de core.repo.")
+    parser.add_argument("--repeticiones", type=int, default=REPETICIONES)
+    parser.add_argument("--json", help="Guardar resultados en este archivo JSON.")
+    args = parser.parse_args(argv)
+
+    resultados = correr(args.repeticiones)
+    _imprimir(resultados)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+# benchmarks/bench_tablas.py
+"""
+Benchmark headless del llenado de tablas Qt.
+
+Ejecuta las pantallas con QT_QPA_PLATFORM=offscreen y un repositorio falso
+(benchmarks/stub_repo.py), por lo que no necesita pantalla ni base de datos.
+Mide por cada caso:
+  - tiempo de llenado de la tabla,
+  - latencia por tecla del filtro de búsqueda (promedio y máximo),
+  - memoria pico (tracemalloc para objetos Python y RSS del proceso).
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_tablas                # 1k, 10k y 100k filas
+    python -m benchmarks.bench_tablas --rows 1000 5000
+    python -m benchmarks.bench_tablas --json resultados.json
+
+Cada tamaño corre en un subproceso propio para que la memoria pico no se mezcle.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tracemalloc
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+TAMANOS = [1_000, 10_000, 100_000]
+TECLAS = "12"  # Texto que se "escribe" letra por letra en los filtros
+
+
+def _rss_pico_mb():
+    try:
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reporta KB, macOS reporta bytes
+        return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+    except ImportError:
+        return None
+
+
+def _medir(fn):
+    """Ejecuta fn y devuelve (segundos, pico_python_mb)."""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    fn()
+    dt = time.perf_counter() - t0
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return dt, pico / (1024 * 1024)
+
+
+def _medir_teclas(line_edit, texto=TECLAS):
+    """Simula escribir texto en un QLineEdit y mide cada tecla (textChanged síncrono)."""
+    tiempos = []
+    line_edit.clear()
+    for i in range(1, len(texto) + 1):
+        t0 = time.perf_counter()
+        line_edit.setText(texto[:i])
+        tiempos.append(time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    line_edit.clear()
+    tiempos.append(time.perf_counter() - t0)
+    return sum(tiempos) / len(tiempos), max(tiempos)
+
+
+def _silenciar_dialogos(QtWidgets):
+    """Evita que un QMessageBox modal bloquee el benchmark."""
+    for name in ("information", "warning", "critical"):
+        setattr(QtWidgets.QMessageBox, name, staticmethod(lambda *a, **k: None))
+    QtWidgets.QMessageBox.question = staticmethod(lambda *a, **k: QtWidgets.QMessageBox.No)
+
+
+def correr_tamano(n_rows):
+    from benchmarks import stub_repo
+    stub = stub_repo.install(n_rows)
+
+    from PySide6 import QtWidgets
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    _silenciar_dialogos(QtWidgets)
+
+    from screens.inventario import InventarioScreen
+    from screens.reportes import ReportesScreen
+    from screens.despacho import ProductSelectorDialog
+
+    resultados = []
+
+    def caso(nombre, fn, line_edit=None):
+        dt, pico = _medir(fn)
+        app.processEvents()
+        fila = {"caso": nombre, "filas": n_rows, "llenado_s": round(dt, 4), "pico_py_mb": round(pico, 2)}
+        if line_edit is not None:
+            prom, peor = _medir_teclas(line_edit)
+            fila["tecla_prom_ms"] = round(prom * 1000, 2)
+            fila["tecla_max_ms"] = round(peor * 1000, 2)
+        resultados.append(fila)
+
+    from core.snapshot import InventorySnapshot
+
+    inv = InventarioScreen()
+    existencias = stub.list_inventory_rows(mostrar_agotados=True)
+    historial = stub.list_dispatches_history()
+    caso("InventorySnapshot (construcción)", lambda: setattr(inv, "snapshot", InventorySnapshot(existencias)))
+    caso("InventorySnapshot.por_tipo", inv.snapshot.por_tipo)
+    inv.data_historial = historial
+    caso("InventarioScreen._llenar_existencias", inv._llenar_existencias, inv.search_exist)
+    caso("InventarioScreen._llenar_historial", lambda: inv._llenar_historial(historial), inv.search_hist)
+
+    # Las búsquedas corren en un hilo (cancelables): se mide el llenado con los datos ya traídos
+    rep = ReportesScreen()
+    caso("ReportesScreen._mostrar_prod", lambda: rep._mostrar_prod(stub.report_production_period()))
+    caso("ReportesScreen._mostrar_disp", lambda: rep._mostrar_disp(stub.report_dispatches_detailed()))
+    caso("ReportesScreen._mostrar_lotes", lambda: rep._mostrar_lotes(stub.report_by_lot_range()))
+
+    dlg = ProductSelectorDialog()
+    caso("ProductSelectorDialog._populate", dlg._populate, dlg.search)
+
+    rss = _rss_pico_mb()
+    for fila in resultados:
+        fila["rss_pico_mb"] = round(rss, 1) if rss is not None else None
+    return resultados
+
+
+def _imprimir(resultados):
+    cols = ["caso", "filas", "llenado_s", "tecla_prom_ms", "tecla_max_ms", "pico_py_mb", "rss_pico_mb"]
+    anchos = {c: max(len(c), *(len(str(r.get(c, "-"))) for r in resultados)) for c in cols}
+    print("  ".join(c.ljust(anchos[c]) for c in cols))
+    for r in resultados:
+        print("  ".join(str(r.get(c, "-")).ljust(anchos[c]) for c in cols))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark headless de llenado de tablas.")
+    parser.add_argument("--rows", type=int, nargs="+", default=TAMANOS, help="Cantidades de filas a probar.")
+    parser.add_argument("--json", help="Guardar resultados en este archivo JSON.")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)  # uso interno (subproceso)
+    args = parser.parse_args(argv)
+
+    if args.single:
+        print(json.dumps(correr_tamano(args.single)))
+        return
+
+    resultados = []
+    for n in args.rows:
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_tablas", "--single", str(n)],
+            capture_output=True, text=True, env={**os.environ, "QT_QPA_PLATFORM": "offscreen"}
+        )
+        if proc.returncode != 0:
+            print(f"Falló el caso de {n} filas:\n{proc.stderr}", file=sys.stderr)
+            continue
+        resultados.extend(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    if resultados: _imprimir(resultados)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# benchmarks/stub_repo.py
+"""
+Repositorio falso para los benchmarks de interfaz.
+
+Expone las mismas funciones que core.repo que usan las pantallas, pero
+devuelve filas generadas en memoria (sin base de datos). Se instala con
+install(n_rows) ANTES de importar cualquier pantalla.
+"""
+import sys
+import types
+import random
+from datetime import date, timedelta
+
+from core.rows import InventoryRow, AvailableLot, ClientRow, StockBalanceRow
+
+TIPOS = ["Tablas", "Tablones", "Paletas", "Machihembrado"]
+CALIDADES = ["Tipo 1", "Tipo 2", "Tipo 3", "Tipo 4"]
+ESTADOS = ["DISPONIBLE", "DISPONIBLE", "DISPONIBLE", "AGOTADO", "BAJA"]
+FACTORES = {"Tablas": 30, "Tablones": 20, "Paletas": 10, "Machihembrado": 5}
+
+
+def _gen_inventory(n, rnd):
+    base = date(2024, 1, 1)
+    rows = []
+    for i in range(n):
+        tipo = rnd.choice(TIPOS)
+        status = rnd.choice(ESTADOS)
+        qty = 0.0 if status != "DISPONIBLE" else float(rnd.randint(1, 60) * 10)
+        rows.append(InventoryRow(
+            id=i + 1, sku=f"{tipo.upper()}-{rnd.randint(10000, 99999)}", nro_lote=str(i % 1000),
+            product_name=tipo, quantity=qty, unit="pzas",
+            largo=8.0, ancho=30.0, espesor=5.0, piezas=int(qty),
+            quality=rnd.choice(CALIDADES), prod_date=base + timedelta(days=i % 700),
+            status=status, obs="", drying="Sí", planing="No", impregnated="No",
+            factor=FACTORES[tipo], bultos=int(qty // FACTORES[tipo])
+        ))
+    return rows
+
+
+def _gen_dispatches(n, rnd, clients):
+    base = date(2024, 1, 1)
+    rows = []
+    for i in range(n):
+        tipo = rnd.choice(TIPOS)
+        qty = float(rnd.randint(1, 20) * 10)
+        rows.append({
+            "id": i + 1, "date": base + timedelta(days=i % 700), "client": rnd.choice(clients).name,
+            "product": tipo, "lote": str(i % 1000), "sku": f"{tipo.upper()}-{rnd.randint(10000, 99999)}",
+            "quantity": qty, "guide": f"G{i:07d}", "obs": "", "type": tipo, "bultos": int(qty // FACTORES[tipo])
+        })
+    return rows
+
+
+def build(n_rows, seed=1234):
+    """Crea el módulo falso con n_rows filas por tabla."""
+    rnd = random.Random(seed)
+    clients = [ClientRow(id=i + 1, name=f"Cliente {i:05d}", document_id=f"J-{i:08d}",
+                         phone="", email="", address="", is_active=True)
+               for i in range(max(10, n_rows // 100))]
+    inventory = _gen_inventory(n_rows, rnd)
+    dispatches = _gen_dispatches(n_rows, rnd, clients)
+    available = [AvailableLot(r.id, 1, r.sku, r.nro_lote, r.product_name, r.quantity, r.prod_date, r.quality, r.status, r.factor, r.bultos)
+                 for r in inventory if r.status == "DISPONIBLE"]
+
+    mod = types.ModuleType("core.repo")
+    mod.INVENTARIO_ORDEN = (("created_at", True),)
+    mod.list_inventory_rows = lambda mostrar_agotados=False, orden=None: inventory if mostrar_agotados else [r for r in inventory if r.quantity > 0]
+    mod.HISTORIAL_PAGINA = 200
+    mod.HISTORIAL_ORDEN = (("date", True),)
+    mod.list_dispatches_history = lambda search=None, after=None, limit=None, orden=None: dispatches[:limit] if limit else dispatches
+    mod.get_available_inventory = lambda: available
+    mod.CLIENTES_PAGINA = 100
+    mod.list_clients = lambda solo_activos=True, search=None, order="name", after=None, limit=None: clients[:limit] if limit else clients
+    mod.REPORTE_PROD_ORDEN = (("fecha", False),)
+    mod.REPORTE_DESP_ORDEN = (("fecha", True),)
+    mod.get_measures_by_type = lambda ptype: []
+    mod.get_conversion_factors = lambda: dict(FACTORES)
+    mod.report_production_period = lambda *a, **k: [
+        {"fecha": r.prod_date, "lote": r.nro_lote, "sku": r.sku, "producto": r.product_name,
+         "cantidad": r.quantity, "piezas_iniciales": r.piezas, "bultos": r.piezas / r.factor,
+         "status": r.status, "quality": r.quality}
+        for r in inventory]
+    mod.report_dispatches_detailed = lambda *a, **k: [
+        {"fecha": r["date"], "guia": r["guide"], "cliente": r["client"], "producto": r["product"],
+         "lote": r["lote"], "sku": r["sku"], "cantidad": r["quantity"], "obs": r["obs"],
+         "bultos": r["quantity"] / FACTORES[r["product"]]}
+        for r in dispatches]
+    mod.report_by_lot_range = lambda *a, **k: [
+        {"lote": r.nro_lote, "sku": r.sku, "producto": r.product_name, "fecha_prod": r.prod_date,
+         "stock_actual": r.quantity, "bultos": r.quantity / r.factor, "estado": r.status}
+        for r in inventory]
+    mod.stock_as_of = lambda *a, **k: [
+        StockBalanceRow(r.id, r.nro_lote, r.sku, r.product_name, r.quantity, r.bultos) for r in inventory]
+    mod.kardex_page = lambda *a, **k: ([], None)
+    return mod
+
+
+def install(n_rows, seed=1234):
+    """Reemplaza core.repo en sys.modules por el repositorio falso."""
+    import core
+    mod = build(n_rows, seed)
+    sys.modules["core.repo"] = mod
+    core.repo = mod
+    return mod
@@ -0,0 +1,132 @@
+# core/audit.py
+"""
+Bitácora de auditoría (tabla audit_logs) escrita en segundo plano.
+
+record() solo encola el evento y vuelve enseguida, así que la transacción del
+usuario nunca espera la escritura de la bitácora. Un hilo escritor junta los
+eventos y los inserta en lotes (un único INSERT de varias filas) cuando se
+acumulan LOTE eventos o pasan INTERVALO segundos. Si la base no responde, los
+eventos se reintentan en la vuelta siguiente (hasta MAX_PENDIENTES). Si lo
+que falla es un evento (restricción o dato inválido), el lote se inserta de a
+una fila y solo ese evento se descarta, con un aviso.
+flush() vacía la cola; se llama al cerrar la aplicación.
+"""
+import json
+import queue
+import atexit
+import threading
+from datetime import datetime, timezone
+
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError, InterfaceError, IntegrityError, DataError
+
+from .db import engine
+from .models import AuditLog
+
+LOTE = 200
+INTERVALO = 2.0          # Segundos máximos que un evento espera en la cola
+MAX_PENDIENTES = 10000   # Con la base caída se conservan solo los más recientes
+
+# Acciones registradas (audit_logs.action)
+LOGIN = "LOGIN"
+LOGIN_FAILED = "LOGIN_FAILED"
+INVENTORY_EDIT = "INVENTORY_EDIT"
+INVENTORY_WRITE_OFF = "INVENTORY_WRITE_OFF"
+DISPATCH_CREATE = "DISPATCH_CREATE"
+CLIENT_CREATE = "CLIENT_CREATE"
+CLIENT_UPDATE = "CLIENT_UPDATE"
+CLIENT_TOGGLE = "CLIENT_TOGGLE"
+ACCIONES = (LOGIN, LOGIN_FAILED, INVENTORY_EDIT, INVENTORY_WRITE_OFF, DISPATCH_CREATE, CLIENT_CREATE, CLIENT_UPDATE, CLIENT_TOGGLE)
+
+_cola = queue.Queue()
+_lock = threading.Lock()
+_hilo = None
+_actor = None
+
+
+def set_actor(user_id):
+    """Usuario de la sesión; se usa como actor de los eventos siguientes."""
+    global _actor
+    _actor = user_id
+
+
+def current_actor():
+    return _actor
+
+
+def record(action, object_type=None, object_id=None, details=None, actor_id=None):
+    """Encola un evento de auditoría. No toca la base ni lanza errores de escritura."""
+    _cola.put({
+        "actor_id": actor_id if actor_id is not None else _actor,
+        "action": action, "object_type": object_type,
+        "object_id": None if object_id is None else str(object_id),
+        "occurred_at": datetime.now(timezone.utc),
+        # Decimal, date, ... se guardan como texto
+        "details": json.loads(json.dumps(details or {}, default=str)),
+    })
+    _iniciar()
+
+
+def _iniciar():
+    global _hilo
+    with _lock:
+        if _hilo is None or not _hilo.is_alive():
+            _hilo = threading.Thread(target=_bucle, name="audit-writer", daemon=True)
+            _hilo.start()
+
+
+def _escribir(lote):
+    """Inserta el lote. False solo si la base no responde (el lote se reintenta)."""
+    try:
+        with engine.begin() as conn:
+            try:
+                with conn.begin_nested():
+                    conn.execute(insert(AuditLog).values(lote))
+            except (IntegrityError, DataError):
+                # Algún evento no se puede guardar: de a uno, descartando solo los inválidos
+                for ev in lote:
+                    try:
+                        with conn.begin_nested():
+                            conn.execute(insert(AuditLog).values(ev))
+                    except (IntegrityError, DataError) as e:
+                        print(f"Advertencia: evento de bitácora descartado ({ev['action']}): {e.orig}")
+        return True
+    except (OperationalError, InterfaceError) as e:
+        print(f"Advertencia: no se pudo escribir la bitácora ({len(lote)} eventos): {e}")
+        return False
+    except Exception as e:
+        # Un error que no es de conexión se repetiría en cada intento: el lote se descarta
+        print(f"Advertencia: lote de bitácora descartado ({len(lote)} eventos): {e}")
+        return True
+
+
+def _bucle():
+    pendientes = []
+    while True:
+        avisos = []
+        try:
+            ev = _cola.get(timeout=INTERVALO)
+            while True:
+                # Los threading.Event son pedidos de flush(): se avisan después de escribir
+                (avisos if isinstance(ev, threading.Event) else pendientes).append(ev)
+                if len(pendientes) >= LOTE: break
+                ev = _cola.get_nowait()
+        except queue.Empty:
+            pass
+        while pendientes:
+            lote = pendientes[:LOTE]
+            if not _escribir(lote): break
+            del pendientes[:LOTE]
+        del pendientes[:-MAX_PENDIENTES]
+        for a in avisos: a.set()
+
+
+def flush(timeout=5.0):
+    """Espera (hasta 'timeout' segundos) a que se escriban los eventos encolados."""
+    if _hilo is None or not _hilo.is_alive(): return
+    listo = threading.Event()
+    _cola.put(listo)
+    listo.wait(timeout)
+
+
+atexit.register(flush)
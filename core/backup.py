@@ -0,0 +1,247 @@
+# core/backup.py
+"""
+Comandos de respaldo con las herramientas cliente de PostgreSQL (pg_dump).
+
+Localiza los binarios (ruta configurada, variable PG_BIN, PATH o la carpeta
+de instalación típica de Windows) y arma la línea de comando a partir de
+db.DATABASE_URL. La ejecución la hace la pantalla con QProcess para no
+bloquear la interfaz.
+"""
+import os
+import glob
+import shutil
+import subprocess
+from datetime import datetime
+
+from sqlalchemy.engine import make_url
+
+FORMATOS = {
+    "custom": "c",      # Un archivo comprimido, restaurable en paralelo con pg_restore -j
+    "directory": "d",   # Una carpeta con un archivo por tabla; permite pg_dump -j
+    "plain": "p",       # SQL plano (compatible con los respaldos anteriores)
+}
+EXTENSIONES = {"custom": ".dump", "directory": "", "plain": ".sql", "copy": ""}  # copy: core.copy_backup
+
+
+def find_pg_tool(name, configured=None):
+    """Ruta del ejecutable 'name' (pg_dump, pg_restore, psql) o None si no se encuentra."""
+    exe = name + (".exe" if os.name == "nt" else "")
+    candidatos = []
+    if configured:
+        candidatos.append(configured if os.path.basename(configured).lower() == exe.lower() else os.path.join(configured, exe))
+    if os.environ.get("PG_BIN"):
+        candidatos.append(os.path.join(os.environ["PG_BIN"], exe))
+    for c in candidatos:
+        if os.path.isfile(c): return c
+    en_path = shutil.which(name)
+    if en_path: return en_path
+    if os.name == "nt":
+        # Instalación estándar: C:\Program Files\PostgreSQL\<versión>\bin (la más nueva primero)
+        bases = [os.environ.get("ProgramFiles", r"C:\Program Files"), os.environ.get("ProgramFiles(x86)", "")]
+        encontrados = [p for b in bases if b for p in glob.glob(os.path.join(b, "PostgreSQL", "*", "bin", exe))]
+        encontrados.sort(key=lambda p: _version(p), reverse=True)
+        if encontrados: return encontrados[0]
+    return None
+
+
+def _version(path):
+    v = os.path.basename(os.path.dirname(os.path.dirname(path)))
+    try: return float(v)
+    except ValueError: return 0.0
+
+
+def connection_args(url=None):
+    """(argumentos de conexión, entorno) para las herramientas de PostgreSQL."""
+    if url is None:
+        from core.db import DATABASE_URL as url
+    u = make_url(url)
+    args = ["-h", u.host or "localhost", "-p", str(u.port or 5432), "-U", u.username or "postgres"]
+    env = os.environ.copy()
+    env["PGPASSWORD"] = u.password or ""  # Sin contraseña: acceso confiable local
+    return args, env, u.database
+
+
+def pg_dump_command(pg_dump, path, formato="custom", jobs=1, compresion=6, url=None, snapshot=None):
+    """(programa, argumentos, entorno) de pg_dump para el formato elegido."""
+    if formato not in FORMATOS: raise ValueError(f"Formato de respaldo desconocido: {formato}")
+    conn, env, dbname = connection_args(url)
+    args = conn + ["-F", FORMATOS[formato], "-f", path, "-v", "--no-password"]
+    if snapshot: args += ["--snapshot", snapshot]
+    if formato != "plain":
+        args += ["-Z", str(max(0, min(9, int(compresion))))]
+    if formato == "directory" and jobs > 1:
+        args += ["-j", str(int(jobs))]
+    return pg_dump, args + [dbname], env
+
+
+def pg_restore_command(pg_restore, path, jobs=1, url=None):
+    """
+    (programa, argumentos, entorno) de pg_restore para un respaldo custom o directorio.
+    pg_restore carga primero los datos y después crea índices y restricciones (en paralelo con -j).
+    """
+    if path.lower().endswith(".sql"):
+        raise ValueError("Los respaldos en SQL plano se restauran con psql, no con pg_restore.")
+    conn, env, dbname = connection_args(url)
+    args = conn + ["-d", dbname, "--clean", "--if-exists", "--no-owner", "-v", "--no-password"]
+    if jobs > 1: args += ["-j", str(int(jobs))]
+    return pg_restore, args + [path], env
+
+
+_PASOS_TABLA = ("contents of table", "contenido de la tabla",          # pg_dump -v
+                "processing data for table", "procesando datos de la tabla")  # pg_restore -v
+
+
+def parse_progress(line):
+    """Nombre de la tabla si la línea de pg_dump/pg_restore -v indica que empezó a copiarla."""
+    # pg_dump: dumping contents of table "public.inventory"
+    if any(p in line for p in _PASOS_TABLA):
+        return line.rsplit(" ", 1)[-1].strip().strip('"')
+    return None
+
+
+# ---------- VERIFICACIÓN ----------
+def backup_tables(cur):
+    """Tablas de core.models que existen en la base (en orden de dependencias)."""
+    from .models import Base
+    nombres = [t.name for t in Base.metadata.sorted_tables]
+    cur.execute("SELECT tablename FROM pg_tables WHERE schemaname = 'public'")
+    existentes = {r[0] for r in cur.fetchall()}
+    return [t for t in nombres if t in existentes]
+
+
+def table_stats(cur, tablas=None, progress=None):
+    """
+    {tabla: {'rows', 'checksum'}}. La suma de verificación es la suma de los md5 de
+    cada fila en texto: no depende del orden físico y usa memoria constante.
+    """
+    tablas = tablas or backup_tables(cur)
+    stats = {}
+    for i, t in enumerate(tablas):
+        if progress: progress(t, i, len(tablas))
+        cur.execute(f"SELECT count(*), coalesce(sum(('x' || substr(md5(x::text), 1, 15))::bit(60)::bigint), 0)::text FROM {t} x")
+        n, suma = cur.fetchone()
+        stats[t] = {"rows": n, "checksum": suma}
+    return stats
+
+
+def verify_stats(esperado, progress=None):
+    """Compara table_stats() de la base actual con los del manifest. Devuelve las diferencias."""
+    from .db import engine
+    raw = engine.raw_connection()
+    try:
+        actual = table_stats(raw.cursor(), list(esperado), progress)
+    finally:
+        raw.rollback(); raw.close()
+    clave = lambda st: st and (st["rows"], st["checksum"])
+    return {t: (esperado[t], actual.get(t)) for t in esperado if clave(esperado[t]) != clave(actual.get(t))}
+
+
+class SnapshotExportado:
+    """
+    Transacción REPEATABLE READ que publica su foto (pg_export_snapshot) para pg_dump --snapshot:
+    la marca de agua y los conteos del manifest corresponden exactamente a lo que se volcó.
+    Debe quedar abierta hasta que pg_dump termine.
+    """
+    def __init__(self):
+        from .db import engine
+        self.raw = engine.raw_connection()
+        self.raw.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        self.cur = self.raw.cursor()
+        self.cur.execute("SELECT pg_export_snapshot()")
+        self.id = self.cur.fetchone()[0]
+
+    def cerrar(self):
+        try:
+            self.raw.rollback()
+            self.raw.set_session(isolation_level="DEFAULT", readonly=False)
+        finally:
+            self.raw.close()
+
+
+# ---------- RESPALDOS AUTOMÁTICOS ----------
+def _baja_prioridad():
+    """Argumentos de subprocess para correr una herramienta con prioridad baja."""
+    if os.name == "nt":
+        return {"creationflags": subprocess.BELOW_NORMAL_PRIORITY_CLASS | subprocess.CREATE_NO_WINDOW}
+    return {"preexec_fn": lambda: os.nice(10)}
+
+
+def run_full_backup(path, pg_dump=None, compresion=6, marca=True):
+    """
+    Respaldo completo sincrónico (para hilos en segundo plano): pg_dump formato custom
+    sobre una foto exportada o, sin pg_dump, la copia interna por COPY. Devuelve el manifest.
+    marca=False no mueve la marca de agua: rotate() puede borrar ese respaldo y los
+    incrementales tienen que seguir partiendo de un completo que el usuario conserva.
+    """
+    from . import incremental, copy_backup
+    if not pg_dump:
+        return copy_backup.export_full(path, compresion, marca=marca)
+
+    snap = SnapshotExportado()
+    try:
+        wm = incremental.watermark_from_cursor(snap.cur)
+        programa, args, env = pg_dump_command(pg_dump, path, "custom", compresion=compresion, snapshot=snap.id)
+        proc = subprocess.Popen([programa] + args, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, **_baja_prioridad())
+        # Los conteos se calculan mientras pg_dump trabaja, sobre la misma foto
+        stats = table_stats(snap.cur)
+        _, err = proc.communicate()
+    finally:
+        snap.cerrar()
+    if proc.returncode != 0:
+        if os.path.exists(path): os.remove(path)
+        raise RuntimeError(err.decode("utf-8", errors="ignore")[-2000:])
+    manifest = incremental.write_full_manifest(path, wm, "custom", stats, sha256=incremental._sha256(path))
+    if marca: incremental.save_watermark(wm)
+    return manifest
+
+
+def verify_backup(path, manifest, pg_restore=None):
+    """(ok, mensaje): sha256 de los archivos y, si hay pg_restore, lectura del índice del archivo."""
+    from . import incremental
+    if manifest.get("dump_format") == "copy":
+        malos = incremental.verify_segments(path, manifest)
+        return (not malos, "Archivos dañados: " + ", ".join(malos) if malos else "Verificado")
+    if manifest.get("sha256") and incremental._sha256(path) != manifest["sha256"]:
+        return False, "La suma sha256 del archivo no coincide"
+    if pg_restore:
+        proc = subprocess.run([pg_restore, "-l", path], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, **_baja_prioridad())
+        if proc.returncode != 0:
+            return False, "pg_restore no pudo leer el archivo: " + proc.stderr.decode("utf-8", errors="ignore")[-500:]
+    return True, "Verificado"
+
+
+def _fecha_respaldo(nombre, prefijo):
+    try:
+        return datetime.strptime(nombre[len(prefijo):len(prefijo) + 16], "%Y-%m-%d_%H-%M")
+    except ValueError:
+        return None
+
+
+def rotate(carpeta, prefijo, diarios=7, semanales=4):
+    """
+    Conserva el último respaldo de cada uno de los 'diarios' días más recientes y el último
+    de cada una de las 'semanales' semanas más recientes; borra el resto. Devuelve lo borrado.
+    """
+    respaldos = []
+    for nombre in os.listdir(carpeta):
+        if not nombre.startswith(prefijo) or nombre.endswith(".manifest.json"): continue
+        fecha = _fecha_respaldo(nombre, prefijo)
+        if fecha: respaldos.append((fecha, os.path.join(carpeta, nombre)))
+    respaldos.sort(reverse=True)
+
+    conservar, dias, semanas = set(), [], []
+    for fecha, ruta in respaldos:
+        dia, semana = fecha.date(), fecha.isocalendar()[:2]
+        if dia not in dias and len(dias) < diarios:
+            dias.append(dia); conservar.add(ruta)
+        if semana not in semanas and len(semanas) < semanales:
+            semanas.append(semana); conservar.add(ruta)
+
+    borrados = []
+    for _, ruta in respaldos:
+        if ruta in conservar: continue
+        if os.path.isdir(ruta): shutil.rmtree(ruta, ignore_errors=True)
+        else: os.remove(ruta)
+        if os.path.exists(ruta + ".manifest.json"): os.remove(ruta + ".manifest.json")
+        borrados.append(ruta)
+    return borrados
@@ -0,0 +1,128 @@
+# core/backup_scheduler.py
+"""
+Respaldos automáticos programados dentro de la aplicación.
+
+Un QTimer revisa cada minuto si llegó alguna de las horas configuradas
+(QSettings 'backup/auto_*'). Si el usuario está trabajando (hubo teclado o
+mouse en los últimos minutos) el respaldo se posterga hasta que la app quede
+inactiva, con un límite. El trabajo corre en un hilo de prioridad mínima:
+respaldo completo, verificación del archivo y rotación de copias diarias y
+semanales. El último resultado queda guardado y se emite con 'resultado'.
+Solo un respaldo exitoso da por cumplido el turno: si falla, se vuelve a
+intentar pasados REINTENTO minutos.
+"""
+from datetime import datetime, timedelta
+import os
+
+from PySide6 import QtCore, QtWidgets
+
+from . import backup
+
+PREFIJO = "auto_astillados_"
+INACTIVIDAD = timedelta(minutes=2)    # Sin uso de teclado/mouse durante este tiempo = inactivo
+MAX_POSTERGAR = timedelta(hours=1)    # Pasado este tiempo se respalda aunque haya actividad
+REINTENTO = timedelta(minutes=15)     # Espera antes de reintentar un respaldo que falló
+
+
+def _settings():
+    return QtCore.QSettings("TrabajoDeGradoSistemas", "OpenCode")
+
+
+def last_result():
+    """(fecha iso, ok, mensaje) del último intento de respaldo automático, o None."""
+    s = _settings()
+    cuando = s.value("backup/auto_last_try", "") or s.value("backup/auto_last_at", "")
+    if not cuando: return None
+    return cuando, s.value("backup/auto_last_ok", "false") == "true", s.value("backup/auto_last_msg", "")
+
+
+class _Trabajo(QtCore.QThread):
+    listo = QtCore.Signal(bool, str)
+
+    def __init__(self, carpeta, diarios, semanales, parent=None):
+        super().__init__(parent)
+        self.carpeta, self.diarios, self.semanales = carpeta, diarios, semanales
+
+    def run(self):
+        try:
+            s = _settings()
+            pg_bin = s.value("backup/pg_bin", "")
+            pg_dump = backup.find_pg_tool("pg_dump", pg_bin)
+            pg_restore = backup.find_pg_tool("pg_restore", pg_bin)
+            os.makedirs(self.carpeta, exist_ok=True)
+            nombre = PREFIJO + datetime.now().strftime("%Y-%m-%d_%H-%M") + (".dump" if pg_dump else "")
+            ruta = os.path.join(self.carpeta, nombre)
+            # Sin mover la marca de los incrementales: la rotación borra estos respaldos
+            manifest = backup.run_full_backup(ruta, pg_dump, int(s.value("backup/compression", 6)), marca=False)
+            ok, msg = backup.verify_backup(ruta, manifest, pg_restore)
+            if not ok:
+                self.listo.emit(False, f"{nombre}: {msg}"); return
+            borrados = backup.rotate(self.carpeta, PREFIJO, self.diarios, self.semanales)
+            self.listo.emit(True, f"{nombre} verificado" + (f", {len(borrados)} copia(s) antigua(s) eliminada(s)" if borrados else ""))
+        except Exception as e:
+            self.listo.emit(False, str(e))
+
+
+class BackupScheduler(QtCore.QObject):
+    resultado = QtCore.Signal(bool, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._trabajo = None
+        self._ultima_actividad = datetime.now()
+        app = QtWidgets.QApplication.instance()
+        if app: app.installEventFilter(self)
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self._tick)
+        self.timer.start(60 * 1000)
+
+    def eventFilter(self, obj, event):
+        if event.type() in (QtCore.QEvent.KeyPress, QtCore.QEvent.MouseButtonPress, QtCore.QEvent.Wheel):
+            self._ultima_actividad = datetime.now()
+        return False
+
+    def _turno_pendiente(self, ahora, s):
+        """Hora programada más reciente de hoy que todavía no se respaldó, o None."""
+        ultima = s.value("backup/auto_last_at", "")
+        ultima = datetime.fromisoformat(ultima) if ultima else datetime.min
+        pendiente = None
+        for h in str(s.value("backup/auto_times", "02:00")).split(","):
+            try:
+                hh, mm = (int(x) for x in h.strip().split(":"))
+            except ValueError:
+                continue
+            turno = ahora.replace(hour=hh, minute=mm, second=0, microsecond=0)
+            if turno <= ahora and turno > ultima and (pendiente is None or turno > pendiente):
+                pendiente = turno
+        return pendiente
+
+    def _tick(self):
+        s = _settings()
+        if self._trabajo is not None or s.value("backup/auto_enabled", "false") != "true": return
+        carpeta = s.value("backup/auto_dir", "")
+        if not carpeta: return
+        ahora = datetime.now()
+        turno = self._turno_pendiente(ahora, s)
+        if turno is None: return
+        intento = s.value("backup/auto_last_try", "")
+        if intento and s.value("backup/auto_last_ok", "false") != "true" and ahora - datetime.fromisoformat(intento) < REINTENTO: return
+        # Se espera a que la app esté inactiva, salvo que ya se haya postergado demasiado
+        if ahora - self._ultima_actividad < INACTIVIDAD and ahora - turno < MAX_POSTERGAR: return
+        self.run_now(carpeta, int(s.value("backup/keep_daily", 7)), int(s.value("backup/keep_weekly", 4)))
+
+    def run_now(self, carpeta, diarios=7, semanales=4):
+        if self._trabajo is not None: return
+        self._trabajo = _Trabajo(carpeta, diarios, semanales, self)
+        self._trabajo.listo.connect(self._terminado)
+        self._trabajo.start(QtCore.QThread.LowestPriority)
+
+    def _terminado(self, ok, msg):
+        self._trabajo.wait(); self._trabajo.deleteLater(); self._trabajo = None
+        s = _settings()
+        ahora = datetime.now().isoformat(timespec="minutes")
+        # auto_last_at marca el turno como cumplido: un fallo solo registra el intento
+        if ok: s.setValue("backup/auto_last_at", ahora)
+        s.setValue("backup/auto_last_try", ahora)
+        s.setValue("backup/auto_last_ok", "true" if ok else "false")
+        s.setValue("backup/auto_last_msg", msg)
+        self.resultado.emit(ok, msg)
@@ -0,0 +1,40 @@
+# core/cancel.py
+"""
+Cancelación de consultas largas (reportes).
+
+La pantalla crea un CancelToken y lo pasa a la función de core.repo, que lo
+asocia a la conexión donde corre la consulta. cancel() se llama desde el hilo
+de la interfaz: pide al servidor que interrumpa la sentencia en curso
+(connection.cancel() de psycopg2, lo mismo que pg_cancel_backend), la
+transacción se deshace y la conexión vuelve al pool. La función del reporte
+termina entonces con QueryCancelled y sus resultados parciales se descartan.
+"""
+import threading
+
+
+class QueryCancelled(Exception):
+    """La consulta se canceló a pedido del usuario."""
+
+
+class CancelToken:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conn = None
+        self.cancelled = False
+
+    def attach(self, dbapi_conn):
+        """Conexión (psycopg2) de la consulta en curso; si ya se canceló, no se empieza."""
+        with self._lock:
+            if self.cancelled: raise QueryCancelled()
+            self._conn = dbapi_conn
+
+    def detach(self):
+        with self._lock: self._conn = None
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            conn = self._conn
+        if conn is not None:
+            try: conn.cancel()
+            except Exception as e: print(f"Advertencia: no se pudo cancelar la consulta: {e}")
@@ -0,0 +1,161 @@
+# core/client_index.py
+"""
+Índice en memoria de los clientes activos para el selector de DespachoScreen.
+
+Cada cliente aporta palabras (las del nombre y su documento, con y sin la
+letra V/J/E/G) a una lista ordenada: una búsqueda por prefijo es un bisect,
+así que responde en microsegundos aunque haya miles de clientes. Si el
+prefijo no alcanza (errores de tipeo, texto en medio de una palabra) se
+completa con trigramas del nombre.
+
+Los clientes salen de la caché local de datos de referencia (core.refcache):
+load_cached() llena el índice con lo guardado en disco, sin esperar a la base,
+y refresh() revalida la caché y aplica solo los clientes creados o modificados
+desde la versión que ya tiene el índice, de modo que los cambios hechos en otra
+pantalla o en otra estación se incorporan sin recargar todo. Desde la interfaz
+se usa refresh_background(): aplica lo que ya está en la caché y revalida en un
+hilo, sin esperar al servidor.
+"""
+import re
+import heapq
+import bisect
+import threading
+import unicodedata
+from collections import Counter
+
+from . import refcache
+from .rows import ClientRow
+
+UMBRAL_TRIGRAMAS = 0.5   # Fracción mínima de trigramas de la consulta presentes en el nombre
+
+
+def normalize(texto):
+    """Minúsculas, sin acentos ni signos de puntuación."""
+    texto = unicodedata.normalize("NFD", (texto or "").lower())
+    texto = "".join(c for c in texto if unicodedata.category(c) != "Mn")
+    return re.sub(r"[^\w\s]", "", texto)
+
+
+def _palabras(c):
+    res = set(normalize(c.name).split())
+    if c.document_id:
+        res.add(normalize(c.document_id))                        # v12345678
+        res.add(normalize(c.document_id.split("-", 1)[-1]))      # 12345678
+    res.discard("")
+    return res
+
+
+def _trigramas(texto):
+    t = f"  {texto} "
+    return {t[i:i + 3] for i in range(len(t) - 2)}
+
+
+class ClientIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lock_carga = threading.Lock()   # Una sola recarga a la vez (precarga y pantalla)
+        self.clientes = {}        # id -> ClientRow
+        self._nombres = {}        # id -> nombre normalizado (orden de los resultados)
+        self._palabras = []       # Lista ordenada de (palabra, id)
+        self._trigramas = {}      # trigrama -> set(id)
+        self._version = None      # Versión de la caché (core.refcache) ya aplicada
+        self.cargado = False
+
+    # ---------- ACTUALIZACIÓN ----------
+    def _quitar(self, cid):
+        c = self.clientes.pop(cid, None)
+        if c is None: return
+        del self._nombres[cid]
+        for p in _palabras(c):
+            i = bisect.bisect_left(self._palabras, (p, cid))
+            if i < len(self._palabras) and self._palabras[i] == (p, cid): del self._palabras[i]
+        for t in _trigramas(normalize(c.name)):
+            ids = self._trigramas.get(t)
+            if ids: ids.discard(cid)
+
+    def upsert(self, c):
+        """Agrega o reemplaza un cliente; los inactivos se quitan del índice."""
+        with self._lock:
+            self._quitar(c.id)
+            if not c.is_active: return
+            self.clientes[c.id] = c; self._nombres[c.id] = normalize(c.name)
+            for p in _palabras(c): bisect.insort(self._palabras, (p, c.id))
+            for t in _trigramas(normalize(c.name)): self._trigramas.setdefault(t, set()).add(c.id)
+
+    def remove(self, cid):
+        with self._lock: self._quitar(cid)
+
+    def load_cached(self):
+        """Arranque: llena el índice con lo guardado en disco (sin consultar la base)."""
+        with self._lock_carga:
+            if not self.cargado: self._aplicar(refcache.shared())
+
+    def apply_cached(self):
+        """Trae al índice lo que la caché ya tiene (sin consultar la base). Devuelve la cantidad de clientes actualizados."""
+        with self._lock_carga: return self._aplicar(refcache.shared())
+
+    def refresh(self):
+        """Revalida la caché de referencia y trae al índice lo que cambió. Devuelve la cantidad de clientes actualizados."""
+        # La consulta al servidor va fuera de _lock_carga: apply_cached() no la espera
+        try: refcache.shared().revalidate()
+        finally: n = self.apply_cached()   # Sin servidor, al menos lo que ya estaba en disco
+        return n
+
+    def refresh_background(self):
+        """Para la interfaz: aplica lo guardado ya mismo y revalida en un hilo que al terminar aplica los cambios."""
+        self.apply_cached()
+        refcache.revalidate_background(lambda cambios: self.apply_cached())
+
+    def _aplicar(self, cache):
+        version = cache.version(refcache.CLIENTES)
+        if version is None or (self.cargado and version == self._version): return 0
+        if self.cargado and version > self._version:
+            filas = list(map(ClientRow._make, cache.changed_since(refcache.CLIENTES, self._version)))
+            for c in filas: self.upsert(c)
+        else:
+            # Primera carga (o la caché se recargó completa): se arma el índice de una vez
+            filas = cache.clients()
+            with self._lock:
+                self.clientes.clear(); self._nombres.clear(); self._trigramas.clear()
+                self._palabras = sorted((p, c.id) for c in filas for p in _palabras(c))
+                for c in filas:
+                    self.clientes[c.id] = c; self._nombres[c.id] = normalize(c.name)
+                    for t in _trigramas(normalize(c.name)): self._trigramas.setdefault(t, set()).add(c.id)
+            self.cargado = True
+        self._version = version
+        return len(filas)
+
+    # ---------- BÚSQUEDA ----------
+    def _por_prefijo(self, palabra):
+        i = bisect.bisect_left(self._palabras, (palabra,))
+        ids = set()
+        while i < len(self._palabras) and self._palabras[i][0].startswith(palabra):
+            ids.add(self._palabras[i][1]); i += 1
+        return ids
+
+    def search(self, texto, limit=20):
+        """Clientes cuyo nombre/documento empiezan con cada palabra del texto; si faltan, por trigramas."""
+        consulta = normalize(texto).split()
+        if not consulta: return []
+        with self._lock:
+            ids = None
+            for palabra in consulta:
+                encontrados = self._por_prefijo(palabra)
+                ids = encontrados if ids is None else ids & encontrados
+                if not ids: break
+            res = [self.clientes[i] for i in heapq.nsmallest(limit, ids or (), key=self._nombres.__getitem__)]
+            if len(res) < limit:
+                trig = _trigramas(" ".join(consulta))
+                votos = Counter(i for t in trig for i in self._trigramas.get(t, ()))
+                vistos = {c.id for c in res}
+                minimo = UMBRAL_TRIGRAMAS * len(trig)
+                res += [self.clientes[i] for i, n in votos.most_common() if n >= minimo and i not in vistos][:limit - len(res)]
+            return res
+
+
+_compartido = ClientIndex()
+
+
+def shared():
+    """Índice único de la aplicación (lo llenan la precarga y DespachoScreen)."""
+    return _compartido
@@ -0,0 +1,147 @@
+# core/copy_backup.py
+"""
+Respaldo completo sin pg_dump: COPY de cada tabla por psycopg2.
+
+Para equipos sin los binarios cliente de PostgreSQL. Cada tabla se vuelca con
+copy_expert('COPY ... TO STDOUT') directo a un archivo comprimido (zstd si
+está instalado 'zstandard', si no gzip), así que la memoria usada no depende
+del tamaño de la tabla. El esquema se guarda desde core.models.Base.metadata
+(schema.sql con las tablas, indexes.sql con los índices) y el manifest.json
+es compatible con la cadena de incrementales (core.incremental).
+
+La restauración recrea las tablas, carga los datos con COPY FROM STDIN y
+recién después crea los índices y vuelve a aplicar las migraciones.
+"""
+import os
+import gzip
+import json
+import uuid
+from datetime import datetime
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable, CreateIndex
+
+from .db import engine
+from .models import Base
+from . import backup, incremental, migrations
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+DUMP_FORMAT = "copy"
+
+
+def _abrir(ruta, modo, nivel=6):
+    """Archivo binario comprimido según la extensión (.zst o .gz)."""
+    if ruta.endswith(".zst"):
+        if modo == "wb":
+            return zstandard.ZstdCompressor(level=max(1, nivel * 2)).stream_writer(open(ruta, "wb"), closefd=True)
+        return zstandard.ZstdDecompressor().stream_reader(open(ruta, "rb"), closefd=True)
+    return gzip.open(ruta, modo, compresslevel=nivel) if modo == "wb" else gzip.open(ruta, modo)
+
+
+def _ddl():
+    """(sentencias de tablas, sentencias de índices) desde Base.metadata."""
+    dialecto = postgresql.dialect()
+    tablas = [str(CreateTable(t).compile(dialect=dialecto)).strip() for t in Base.metadata.sorted_tables]
+    indices = [str(CreateIndex(i).compile(dialect=dialecto)).strip()
+               for t in Base.metadata.sorted_tables for i in sorted(t.indexes, key=lambda i: i.name or "")]
+    return tablas, indices
+
+
+def _escribir_sql(ruta, sentencias):
+    with open(ruta, "w", encoding="utf-8") as f:
+        f.write(";\n\n".join(sentencias) + (";\n" if sentencias else ""))
+
+
+def _leer_sql(ruta):
+    with open(ruta, encoding="utf-8") as f:
+        return [s.strip() for s in f.read().split(";\n") if s.strip()]
+
+
+# ---------- RESPALDO ----------
+def export_full(dest_dir, compresion=6, progress=None, marca=True):
+    """
+    Vuelca todas las tablas de core.models a dest_dir. Devuelve el manifest.
+    marca=False no mueve la marca de agua de los incrementales (respaldos automáticos).
+    """
+    os.makedirs(dest_dir, exist_ok=False)
+    tablas_ddl, indices_ddl = _ddl()
+    _escribir_sql(os.path.join(dest_dir, "schema.sql"), tablas_ddl)
+    _escribir_sql(os.path.join(dest_dir, "indexes.sql"), indices_ddl)
+    ext = ".csv.zst" if ZSTD_AVAILABLE else ".csv.gz"
+
+    raw = engine.raw_connection()
+    try:
+        raw.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        cur = raw.cursor()
+        wm = incremental.watermark_from_cursor(cur)
+        nombres = backup.backup_tables(cur)
+        tablas = {}
+        for i, t in enumerate(nombres):
+            if progress: progress(t, i, len(nombres))
+            archivo = t + ext
+            ruta = os.path.join(dest_dir, archivo)
+            with _abrir(ruta, "wb", compresion) as f:
+                # COPY (SELECT ...) también sirve para tablas particionadas
+                cur.copy_expert(f"COPY (SELECT * FROM {t}) TO STDOUT WITH (FORMAT csv, HEADER)", f)
+            cur.execute("SELECT column_name FROM information_schema.columns WHERE table_schema = 'public' AND table_name = %s ORDER BY ordinal_position", (t,))
+            info = {"file": archivo, "columns": [r[0] for r in cur.fetchall()], "sha256": incremental._sha256(ruta)}
+            info.update(backup.table_stats(cur, [t])[t])
+            tablas[t] = info
+    finally:
+        raw.rollback()
+        raw.set_session(isolation_level="DEFAULT", readonly=False)
+        raw.close()
+
+    manifest = {"format": incremental.FORMATO, "kind": "full", "id": uuid.uuid4().hex,
+                "created_at": datetime.now().isoformat(), "dump_format": DUMP_FORMAT,
+                "file": os.path.basename(dest_dir.rstrip("/\\")), "until": wm, "tables": tablas}
+    with open(os.path.join(dest_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, default=str)
+    if marca: incremental.save_watermark(wm)
+    return manifest
+
+
+# ---------- RESTAURACIÓN ----------
+def restore_full(path, progress=None):
+    """Reemplaza las tablas con el respaldo de 'path' en una sola transacción. Devuelve el manifest."""
+    manifest = incremental.read_manifest(path)
+    if not manifest or manifest.get("dump_format") != DUMP_FORMAT:
+        raise ValueError(f"{path} no es un respaldo por COPY.")
+    malos = incremental.verify_segments(path, manifest)
+    if malos: raise ValueError(f"Archivos dañados en el respaldo: {', '.join(malos)}")
+
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        # Se borran en orden inverso de dependencias y se recrean sin índices secundarios
+        for t in reversed(list(manifest["tables"])):
+            cur.execute(f"DROP TABLE IF EXISTS {t} CASCADE")
+        for sql in _leer_sql(os.path.join(path, "schema.sql")):
+            cur.execute(sql)
+        total = len(manifest["tables"])
+        for i, (t, info) in enumerate(manifest["tables"].items()):
+            if progress: progress(t, i, total)
+            cols = ", ".join(f'"{c}"' for c in info["columns"])
+            with _abrir(os.path.join(path, info["file"]), "rb") as f:
+                cur.copy_expert(f"COPY {t} ({cols}) FROM STDIN WITH (FORMAT csv, HEADER)", f)
+            if "id" in info["columns"]:
+                cur.execute(f"SELECT setval(pg_get_serial_sequence('{t}', 'id'), coalesce(max(id), 0) + 1, false) FROM {t} "
+                            f"WHERE pg_get_serial_sequence('{t}', 'id') IS NOT NULL")
+        if progress: progress("índices", total, total)
+        for sql in _leer_sql(os.path.join(path, "indexes.sql")):
+            cur.execute(sql)
+        # Índices, particiones y datos base que agregan las migraciones (todas son idempotentes)
+        for _, sentencias in migrations.MIGRATIONS:
+            for sql in sentencias: cur.execute(sql)
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+    return manifest
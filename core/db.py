@@ -1,18 +1,32 @@
 # db.py
+import os
+
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
-from screens.inventario import InventarioScreen
 from .models import Base
 
-import core.repo as repo
-
-# Ajusta esta URL con tus credenciales y base
-DATABASE_URL = "postgresql+psycopg2://postgres@localhost:5432/astillados_db"
+# Ajusta esta URL con tus credenciales y base (o define ASTILLADOS_DATABASE_URL)
+DATABASE_URL = os.environ.get("ASTILLADOS_DATABASE_URL") or "postgresql+psycopg2://postgres@localhost:5432/astillados_db"
 
-engine = create_engine(DATABASE_URL, future=True)
+# connect_timeout: si el servidor no responde, los hilos (login, precarga) no quedan colgados
+engine = create_engine(DATABASE_URL, future=True, connect_args={"connect_timeout": 10})
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
+# Reportes, historial y exportaciones: motor aparte, de solo lectura, con su propio pool y
+# límite de tiempo por consulta, para que un reporte anual no deje sin conexiones a las
+# pantallas de registro y despacho. ASTILLADOS_REPORTS_URL puede apuntar a una réplica o a
+# un rol de solo lectura; sin ella se usa la misma base con conexiones separadas.
+REPORTS_DATABASE_URL = os.environ.get("ASTILLADOS_REPORTS_URL") or DATABASE_URL
+REPORTS_TIMEOUT_MS = int(os.environ.get("ASTILLADOS_REPORTS_TIMEOUT_MS") or 120000)
+REPORTS_OPTIONS = f"-c default_transaction_read_only=on -c statement_timeout={REPORTS_TIMEOUT_MS}"
+
+report_engine = create_engine(
+    REPORTS_DATABASE_URL, future=True, pool_size=2, max_overflow=2, pool_pre_ping=True,
+    connect_args={"connect_timeout": 10, "options": REPORTS_OPTIONS},
+)
+ReportSession = sessionmaker(bind=report_engine, autoflush=False, autocommit=False)
+
 def create_tables():
     """Crear tablas definidas en models.Base (solo en desarrollo/inicialización)."""
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
@@ -0,0 +1,254 @@
+# core/incremental.py
+"""
+Respaldos lógicos incrementales por marcas de agua (watermarks).
+
+Un respaldo completo (pg_dump) deja registrada la marca de agua del momento
+en que empezó: el id máximo de cada tabla y la hora del servidor. Cada
+incremental exporta solo las filas nuevas (id mayor) o modificadas (fecha de
+cambio posterior) desde la marca anterior, como segmentos CSV comprimidos
+(COPY ... TO STDOUT) más un manifest.json, y avanza la marca.
+
+La restauración aplica el completo con pg_restore y después cada incremental
+en orden con INSERT ... ON CONFLICT (id) DO UPDATE, así que repetir filas
+entre respaldos no causa problemas. Las filas borradas físicamente no se
+propagan (inventario y clientes usan bajas lógicas).
+"""
+import os
+import gzip
+import json
+import uuid
+import hashlib
+import subprocess
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from .db import engine
+
+FORMATO = "astillados-incremental"
+WATERMARK_KEY = "backup:watermark"
+
+# Tabla -> expresión con la fecha del último cambio (None: solo se agregan filas).
+# Orden de dependencias (claves foráneas) para poder aplicar los segmentos.
+TABLAS = {
+    "clients": "coalesce(updated_at, created_at)",
+    "products": "coalesce(updated_at, created_at)",
+    "inventory": "coalesce(updated_at, created_at)",
+    "dispatches": None,   # Sin columnas de fecha de registro: solo por id
+    "movements": "performed_at",
+    "audit_logs": "occurred_at",
+}
+
+# Clave de ON CONFLICT cuando no es solo id (movements está particionada por performed_at)
+CONFLICTO = {"movements": "id, performed_at"}
+
+# Solapamiento con el respaldo anterior: cubre transacciones que estaban en curso
+# cuando se tomó la marca (sus filas tienen una hora anterior pero aún no eran visibles).
+MARGEN = timedelta(minutes=5)
+
+
+# ---------- MARCAS DE AGUA ----------
+def current_watermark(conn=None):
+    """{'ts': hora del servidor, 'ids': {tabla: id máximo}} vista desde la transacción actual."""
+    if conn is None:
+        with engine.connect() as c: return current_watermark(c)
+    ts = conn.execute(text("SELECT transaction_timestamp()")).scalar()
+    ids = {t: conn.execute(text(f"SELECT coalesce(max(id), 0) FROM {t}")).scalar() for t in TABLAS}
+    return {"ts": ts.isoformat(), "ids": ids}
+
+
+def watermark_from_cursor(cur):
+    """Igual que current_watermark() sobre un cursor psycopg2 (p. ej. el de una foto exportada)."""
+    cur.execute("SELECT transaction_timestamp()")
+    ts = cur.fetchone()[0]
+    ids = {}
+    for t in TABLAS:
+        cur.execute(f"SELECT coalesce(max(id), 0) FROM {t}")
+        ids[t] = cur.fetchone()[0]
+    return {"ts": ts.isoformat(), "ids": ids}
+
+
+def read_watermark():
+    with engine.connect() as conn:
+        v = conn.execute(text("SELECT value FROM settings WHERE key = :k"), {"k": WATERMARK_KEY}).scalar()
+    return json.loads(v) if v else None
+
+
+def save_watermark(wm):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO settings (key, value, description) VALUES (:k, :v, 'Marca de agua del último respaldo') "
+            "ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value"
+        ), {"k": WATERMARK_KEY, "v": json.dumps(wm)})
+
+
+def write_full_manifest(backup_path, wm, formato, tablas=None, sha256=None):
+    """
+    Manifest al lado de un respaldo completo (<respaldo>.manifest.json) para encadenar
+    incrementales. 'tablas' son los conteos y sumas de verificación de backup.table_stats().
+    """
+    manifest = {"format": FORMATO, "kind": "full", "id": uuid.uuid4().hex, "created_at": datetime.now().isoformat(),
+                "dump_format": formato, "file": os.path.basename(backup_path.rstrip("/\\")), "until": wm,
+                "tables": tablas or {}}
+    if sha256: manifest["sha256"] = sha256
+    with open(backup_path.rstrip("/\\") + ".manifest.json", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+# ---------- EXPORTACIÓN ----------
+def _cambios_sql(tabla, ts_col):
+    cond = "id > %(id)s" + (f" OR {ts_col} > %(ts)s" if ts_col else "")
+    return f"SELECT * FROM {tabla} WHERE {cond} ORDER BY id"
+
+
+def _sha256(path, bloque=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(bloque), b""): h.update(chunk)
+    return h.hexdigest()
+
+
+def export_incremental(dest_dir, since=None, compresion=6, progress=None):
+    """
+    Exporta los cambios desde 'since' (por defecto la marca guardada) a dest_dir.
+    Devuelve el manifest. progress(tabla, i, total) se llama antes de cada tabla.
+    """
+    since = since or read_watermark()
+    if not since: raise ValueError("No hay respaldo base: genere primero un respaldo completo.")
+    os.makedirs(dest_dir, exist_ok=False)
+    desde_ts = (datetime.fromisoformat(since["ts"]) - MARGEN).isoformat()
+
+    raw = engine.raw_connection()
+    try:
+        raw.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        cur = raw.cursor()
+        # Misma foto para la marca nueva, los conteos y los COPY
+        cur.execute("SELECT transaction_timestamp()")
+        nueva = {"ts": cur.fetchone()[0].isoformat(), "ids": {}}
+        tablas = {}
+        for i, (tabla, ts_col) in enumerate(TABLAS.items()):
+            if progress: progress(tabla, i, len(TABLAS))
+            cur.execute(f"SELECT coalesce(max(id), 0) FROM {tabla}")
+            nueva["ids"][tabla] = cur.fetchone()[0]
+            params = {"id": since["ids"].get(tabla, 0), "ts": desde_ts}
+            sql = cur.mogrify(_cambios_sql(tabla, ts_col), params).decode()
+            cur.execute(f"SELECT count(*) FROM ({sql}) s")
+            filas = cur.fetchone()[0]
+            archivo = f"{tabla}.csv.gz"
+            ruta = os.path.join(dest_dir, archivo)
+            with gzip.open(ruta, "wt", encoding="utf-8", compresslevel=compresion) as gz:
+                cur.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER)", gz)
+            cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name = %s ORDER BY ordinal_position", (tabla,))
+            tablas[tabla] = {"file": archivo, "rows": filas, "sha256": _sha256(ruta), "columns": [r[0] for r in cur.fetchall()]}
+    finally:
+        raw.rollback()
+        raw.set_session(isolation_level="DEFAULT", readonly=False)  # La conexión vuelve al pool
+        raw.close()
+
+    manifest = {"format": FORMATO, "kind": "incremental", "id": uuid.uuid4().hex,
+                "created_at": datetime.now().isoformat(), "since": since, "until": nueva, "tables": tablas}
+    with open(os.path.join(dest_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, default=str)
+    save_watermark(nueva)
+    return manifest
+
+
+# ---------- RESTAURACIÓN ----------
+def read_manifest(path):
+    """Manifest de un incremental (carpeta) o de un respaldo completo (archivo o carpeta de pg_dump)."""
+    p = path.rstrip("/\\")
+    for cand in (os.path.join(p, "manifest.json"), p + ".manifest.json", p):
+        if os.path.isfile(cand) and cand.endswith(".json"):
+            with open(cand, encoding="utf-8") as f:
+                m = json.load(f)
+            if m.get("format") == FORMATO: return m
+    return None
+
+
+def order_chain(full_manifest, incrementales):
+    """Ordena [(ruta, manifest)] de incrementales siguiendo la cadena desde el completo."""
+    pendientes = list(incrementales)
+    cadena, actual = [], full_manifest["until"]
+    while pendientes:
+        sig = next(((r, m) for r, m in pendientes if m["since"] == actual), None)
+        if sig is None:
+            raise ValueError("Los incrementales no forman una cadena continua desde el respaldo completo.")
+        cadena.append(sig); pendientes.remove(sig); actual = sig[1]["until"]
+    return cadena
+
+
+def find_chain(full_manifest, carpeta):
+    """Incrementales dentro de 'carpeta' que continúan la cadena del completo, en orden."""
+    disponibles = []
+    for nombre in sorted(os.listdir(carpeta)):
+        ruta = os.path.join(carpeta, nombre)
+        m = read_manifest(ruta) if os.path.isdir(ruta) else None
+        if m and m["kind"] == "incremental": disponibles.append((ruta, m))
+    cadena, actual = [], full_manifest["until"]
+    while True:
+        sig = next(((r, m) for r, m in disponibles if m["since"] == actual), None)
+        if sig is None: return cadena
+        cadena.append(sig); actual = sig[1]["until"]
+
+
+def verify_segments(path, manifest=None):
+    """Lista de segmentos cuyo sha256 no coincide con el manifest (vacía si todo está bien)."""
+    manifest = manifest or read_manifest(path)
+    return [t for t, info in manifest["tables"].items()
+            if _sha256(os.path.join(path, info["file"])) != info["sha256"]]
+
+
+def apply_incremental(path, raw=None, progress=None):
+    """Aplica un incremental (upsert por id) en una sola transacción."""
+    manifest = read_manifest(path)
+    if not manifest or manifest["kind"] != "incremental": raise ValueError(f"{path} no es un respaldo incremental.")
+    malos = verify_segments(path, manifest)
+    if malos: raise ValueError(f"Segmentos malos en {path}: {', '.join(malos)}")
+    propia = raw is None
+    raw = raw or engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        for i, (tabla, info) in enumerate(manifest["tables"].items()):
+            if progress: progress(tabla, i, len(manifest["tables"]))
+            if not info["rows"]: continue
+            cols = ", ".join(f'"{c}"' for c in info["columns"])
+            upd = ", ".join(f'"{c}" = EXCLUDED."{c}"' for c in info["columns"] if c != "id")
+            cur.execute(f"CREATE TEMP TABLE _inc (LIKE {tabla} INCLUDING DEFAULTS) ON COMMIT DROP")
+            with gzip.open(os.path.join(path, info["file"]), "rt", encoding="utf-8") as f:
+                cur.copy_expert(f"COPY _inc ({cols}) FROM STDIN WITH (FORMAT csv, HEADER)", f)
+            cur.execute(f"INSERT INTO {tabla} ({cols}) SELECT {cols} FROM _inc ON CONFLICT ({CONFLICTO.get(tabla, 'id')}) DO UPDATE SET {upd}")
+            if cur.rowcount != info["rows"]:
+                raise ValueError(f"{tabla}: se aplicaron {cur.rowcount} filas, el manifest indica {info['rows']}.")
+            cur.execute("DROP TABLE _inc")
+            # Las secuencias deben quedar por encima de los ids restaurados
+            cur.execute(f"SELECT setval(pg_get_serial_sequence('{tabla}', 'id'), coalesce(max(id), 0) + 1, false) FROM {tabla} WHERE pg_get_serial_sequence('{tabla}', 'id') IS NOT NULL")
+        cur.execute(
+            "INSERT INTO settings (key, value, description) VALUES (%s, %s, 'Marca de agua del último respaldo') "
+            "ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value", (WATERMARK_KEY, json.dumps(manifest["until"])))
+        if propia: raw.commit()
+    except Exception:
+        if propia: raw.rollback()
+        raise
+    finally:
+        if propia: raw.close()
+    return manifest
+
+
+def restore_chain(full_path, incrementales, pg_restore, progress=None):
+    """
+    Restaura un respaldo completo con pg_restore (--clean) y aplica encima sus incrementales en orden.
+    Pensado para scripts; la pantalla de respaldo usa QProcess para el paso de pg_restore.
+    """
+    from . import backup
+    full = read_manifest(full_path)
+    if not full or full["kind"] != "full": raise ValueError("Falta el manifest del respaldo completo.")
+    cadena = order_chain(full, [(p, read_manifest(p)) for p in incrementales])
+
+    programa, args, env = backup.pg_restore_command(pg_restore, full_path)
+    proc = subprocess.run([programa] + args, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"pg_restore falló:\n{proc.stderr[-2000:]}")
+    for ruta, _ in cadena:
+        apply_incremental(ruta, progress=progress)
+    return [m for _, m in cadena]
@@ -0,0 +1,192 @@
+# core/migrations.py
+"""
+Cambios de esquema para bases de datos ya existentes.
+
+create_tables() solo crea tablas nuevas; no agrega índices ni datos a tablas
+que ya existen. Cada migración es una lista de sentencias SQL idempotentes
+que se ejecuta una sola vez, dentro de su propia transacción, y queda
+registrada en la tabla settings con la clave 'migration:<id>'.
+"""
+from sqlalchemy import text
+from .db import engine
+
+MIGRATIONS = [
+    ("0001_product_factors", [
+        """CREATE TABLE IF NOT EXISTS product_factors (
+            product_name TEXT PRIMARY KEY,
+            pieces_per_bundle INTEGER NOT NULL CONSTRAINT ck_product_factors_positive CHECK (pieces_per_bundle > 0),
+            updated_at TIMESTAMPTZ DEFAULT now()
+        )""",
+        """INSERT INTO product_factors (product_name, pieces_per_bundle) VALUES
+            ('Tablas', 30), ('Tablones', 20), ('Paletas', 10), ('Machihembrado', 5)
+           ON CONFLICT (product_name) DO NOTHING""",
+    ]),
+    # Filtros de los respaldos incrementales (id > marca OR fecha de cambio > marca)
+    ("0002_backup_watermark_indexes", [
+        "CREATE INDEX IF NOT EXISTS ix_clients_changed_at ON clients ((coalesce(updated_at, created_at)))",
+        "CREATE INDEX IF NOT EXISTS ix_products_changed_at ON products ((coalesce(updated_at, created_at)))",
+        "CREATE INDEX IF NOT EXISTS ix_inventory_changed_at ON inventory ((coalesce(updated_at, created_at)))",
+        "CREATE INDEX IF NOT EXISTS ix_movements_performed_at ON movements (performed_at)",
+        "CREATE INDEX IF NOT EXISTS ix_audit_logs_occurred_at ON audit_logs (occurred_at)",
+    ]),
+    # movements particionada por mes de performed_at (ver core/partitions.py).
+    # El bloque no hace nada si la tabla ya está particionada.
+    ("0003_movements_partitioned", [
+        """DO $$
+        DECLARE
+            m date;
+            hasta date;
+        BEGIN
+            IF (SELECT relkind FROM pg_class WHERE oid = 'movements'::regclass) = 'p' THEN RETURN; END IF;
+            ALTER TABLE movements RENAME TO movements_legacy;
+            ALTER SEQUENCE IF EXISTS movements_id_seq OWNED BY NONE;
+            CREATE SEQUENCE IF NOT EXISTS movements_id_seq;
+            CREATE TABLE movements (
+                id INTEGER NOT NULL DEFAULT nextval('movements_id_seq'),
+                inventory_id INTEGER REFERENCES inventory(id) ON DELETE SET NULL,
+                product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+                change_quantity NUMERIC(18,6) NOT NULL,
+                movement_type VARCHAR NOT NULL,
+                reference TEXT,
+                performed_by INTEGER REFERENCES users(id) ON DELETE SET NULL,
+                performed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                notes TEXT,
+                PRIMARY KEY (id, performed_at)
+            ) PARTITION BY RANGE (performed_at);
+            ALTER SEQUENCE movements_id_seq OWNED BY movements.id;
+            CREATE TABLE movements_default PARTITION OF movements DEFAULT;
+
+            m := date_trunc('month', coalesce((SELECT min(performed_at) FROM movements_legacy), now()))::date;
+            hasta := (date_trunc('month', now()) + interval '3 months')::date;
+            WHILE m <= hasta LOOP
+                EXECUTE format('CREATE TABLE %I PARTITION OF movements FOR VALUES FROM (%L) TO (%L)',
+                               'movements_' || to_char(m, 'YYYY_MM'), m, (m + interval '1 month')::date);
+                m := (m + interval '1 month')::date;
+            END LOOP;
+
+            INSERT INTO movements (id, inventory_id, product_id, change_quantity, movement_type, reference, performed_by, performed_at, notes)
+            SELECT id, inventory_id, product_id, change_quantity, movement_type::text, reference, performed_by, coalesce(performed_at, now()), notes
+            FROM movements_legacy;
+            PERFORM setval('movements_id_seq', coalesce((SELECT max(id) FROM movements), 0) + 1, false);
+            DROP TABLE movements_legacy;
+        END $$""",
+        "CREATE INDEX IF NOT EXISTS idx_movements_product_time ON movements (product_id, performed_at DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_movements_performed_at ON movements (performed_at)",
+    ]),
+    # Fotos periódicas de existencias para stock_as_of() (ver core/repo.py)
+    ("0004_stock_snapshots", [
+        """CREATE TABLE IF NOT EXISTS stock_snapshots (
+            id SERIAL PRIMARY KEY,
+            taken_at TIMESTAMPTZ NOT NULL,
+            inventory_id INTEGER REFERENCES inventory(id) ON DELETE SET NULL,
+            product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+            quantity NUMERIC(18,6) NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS ix_stock_snapshots_taken_at ON stock_snapshots (taken_at, inventory_id)",
+    ]),
+    # Kardex por lote: recorrido por (inventory_id, performed_at, id) para la paginación por clave
+    ("0005_movements_inventory_time", [
+        "CREATE INDEX IF NOT EXISTS ix_movements_inventory_time ON movements (inventory_id, performed_at, id)",
+    ]),
+    # Bitácora de auditoría (core/audit.py): details en JSONB con índice GIN para filtrar con @>
+    ("0006_audit_logs_jsonb", [
+        """DO $$
+        BEGIN
+            IF (SELECT data_type FROM information_schema.columns
+                WHERE table_schema = 'public' AND table_name = 'audit_logs' AND column_name = 'details') <> 'jsonb' THEN
+                ALTER TABLE audit_logs ALTER COLUMN details TYPE JSONB USING details::jsonb;
+            END IF;
+        END $$""",
+        "CREATE INDEX IF NOT EXISTS ix_audit_logs_details ON audit_logs USING gin (details)",
+        "CREATE INDEX IF NOT EXISTS ix_audit_logs_time ON audit_logs (occurred_at DESC, id DESC)",
+    ]),
+    # Lista de clientes paginada por clave (orden) y búsqueda por prefijo (text_pattern_ops sirve a LIKE 'x%')
+    ("0007_clients_search_indexes", [
+        "CREATE INDEX IF NOT EXISTS ix_clients_lower_name ON clients (lower(name), id)",
+        "CREATE INDEX IF NOT EXISTS ix_clients_lower_name_prefix ON clients (lower(name) text_pattern_ops)",
+        "CREATE INDEX IF NOT EXISTS ix_clients_document_id ON clients ((coalesce(document_id, '')), id)",
+        "CREATE INDEX IF NOT EXISTS ix_clients_document_id_prefix ON clients (lower(document_id) text_pattern_ops)",
+        "CREATE INDEX IF NOT EXISTS ix_clients_document_number_prefix ON clients (split_part(document_id, '-', 2) text_pattern_ops)",
+    ]),
+    # Lote único. Los lotes repetidos que pudieran existir (de antes del control en la app) se
+    # renombran '<lote>-DUP<id>' y se anota en obs, para poder crear el índice sin perder datos.
+    ("0008_inventory_unique_lot", [
+        """UPDATE inventory i SET nro_lote = i.nro_lote || '-DUP' || i.id,
+                  obs = trim(coalesce(i.obs, '') || ' | [Lote repetido: ' || i.nro_lote || ']')
+           WHERE EXISTS (SELECT 1 FROM inventory o WHERE o.nro_lote = i.nro_lote AND o.id < i.id)""",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_inventory_nro_lote ON inventory (nro_lote)",
+        "CREATE INDEX IF NOT EXISTS ix_products_name ON products (name)",
+    ]),
+    # Claves de idempotencia de la cola local de escrituras (core.offline)
+    ("0009_applied_requests", [
+        """CREATE TABLE IF NOT EXISTS applied_requests (
+               key VARCHAR(36) PRIMARY KEY,
+               kind TEXT NOT NULL,
+               result_id INTEGER,
+               applied_at TIMESTAMPTZ DEFAULT now())""",
+    ]),
+    # Historial de despachos por páginas (keyset sobre date, id)
+    ("0010_dispatches_date_id", [
+        "CREATE INDEX IF NOT EXISTS ix_dispatches_date_id ON dispatches (date DESC, id DESC)",
+    ]),
+    # Orden desde los encabezados de las tablas: una página ordenada por estas columnas se
+    # lee del índice en lugar de ordenar todas las filas (mismas expresiones que core.repo).
+    ("0011_sortable_columns", [
+        "CREATE INDEX IF NOT EXISTS ix_dispatches_guide_id ON dispatches ((coalesce(transport_guide, '')), id)",
+        "CREATE INDEX IF NOT EXISTS ix_dispatches_quantity_id ON dispatches ((coalesce(quantity, 0)), id)",
+        "CREATE INDEX IF NOT EXISTS ix_inventory_created_at_id ON inventory (created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_inventory_prod_date_id ON inventory (prod_date, id)",
+        "CREATE INDEX IF NOT EXISTS ix_inventory_quantity_id ON inventory (quantity, id)",
+        "CREATE INDEX IF NOT EXISTS ix_clients_phone ON clients ((coalesce(phone, '')), id)",
+        "CREATE INDEX IF NOT EXISTS ix_clients_lower_email ON clients ((lower(coalesce(email, ''))), id)",
+    ]),
+    # Caché local de datos de referencia (core.refcache): un contador por tabla que cada alta o
+    # cambio incrementa y copia en la fila. El UPDATE deja bloqueada la fila del contador hasta
+    # el commit, así que las versiones se confirman en orden y "ref_version > guardada" no
+    # saltea cambios de transacciones que terminan más tarde.
+    ("0012_reference_versions", [
+        "CREATE TABLE IF NOT EXISTS ref_versions (tabla TEXT PRIMARY KEY, version BIGINT NOT NULL DEFAULT 0)",
+        "INSERT INTO ref_versions (tabla) VALUES ('clients'), ('predefined_measures'), ('product_factors') ON CONFLICT (tabla) DO NOTHING",
+        """CREATE OR REPLACE FUNCTION bump_ref_version() RETURNS trigger AS $$
+           BEGIN
+               UPDATE ref_versions SET version = version + 1 WHERE tabla = TG_TABLE_NAME RETURNING version INTO NEW.ref_version;
+               RETURN NEW;
+           END $$ LANGUAGE plpgsql""",
+        "ALTER TABLE clients ADD COLUMN IF NOT EXISTS ref_version BIGINT NOT NULL DEFAULT 0",
+        "DROP TRIGGER IF EXISTS trg_clients_ref_version_ins ON clients",
+        "CREATE TRIGGER trg_clients_ref_version_ins BEFORE INSERT ON clients FOR EACH ROW EXECUTE PROCEDURE bump_ref_version()",
+        "DROP TRIGGER IF EXISTS trg_clients_ref_version_upd ON clients",
+        "CREATE TRIGGER trg_clients_ref_version_upd BEFORE UPDATE ON clients FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE PROCEDURE bump_ref_version()",
+        "ALTER TABLE predefined_measures ADD COLUMN IF NOT EXISTS ref_version BIGINT NOT NULL DEFAULT 0",
+        "DROP TRIGGER IF EXISTS trg_predefined_measures_ref_version_ins ON predefined_measures",
+        "CREATE TRIGGER trg_predefined_measures_ref_version_ins BEFORE INSERT ON predefined_measures FOR EACH ROW EXECUTE PROCEDURE bump_ref_version()",
+        "DROP TRIGGER IF EXISTS trg_predefined_measures_ref_version_upd ON predefined_measures",
+        "CREATE TRIGGER trg_predefined_measures_ref_version_upd BEFORE UPDATE ON predefined_measures FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE PROCEDURE bump_ref_version()",
+        "ALTER TABLE product_factors ADD COLUMN IF NOT EXISTS ref_version BIGINT NOT NULL DEFAULT 0",
+        "DROP TRIGGER IF EXISTS trg_product_factors_ref_version_ins ON product_factors",
+        "CREATE TRIGGER trg_product_factors_ref_version_ins BEFORE INSERT ON product_factors FOR EACH ROW EXECUTE PROCEDURE bump_ref_version()",
+        "DROP TRIGGER IF EXISTS trg_product_factors_ref_version_upd ON product_factors",
+        "CREATE TRIGGER trg_product_factors_ref_version_upd BEFORE UPDATE ON product_factors FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE PROCEDURE bump_ref_version()",
+        "CREATE INDEX IF NOT EXISTS ix_clients_ref_version ON clients (ref_version)",
+    ]),
+]
+
+
+def apply_migrations():
+    """Aplica las migraciones pendientes. Devuelve la lista de ids aplicados."""
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT, description TEXT)"))
+        done = {r[0] for r in conn.execute(text("SELECT key FROM settings WHERE key LIKE 'migration:%'"))}
+
+    applied = []
+    for mig_id, statements in MIGRATIONS:
+        if f"migration:{mig_id}" in done: continue
+        with engine.begin() as conn:
+            for sql in statements:
+                conn.execute(text(sql))
+            conn.execute(
+                text("INSERT INTO settings (key, value, description) VALUES (:k, now()::text, 'Migración de esquema')"),
+                {"k": f"migration:{mig_id}"}
+            )
+        applied.append(mig_id)
+    return applied
@@ -1,9 +1,10 @@
 # core/models.py
 from sqlalchemy import (
-    Column, Integer, String, Text, Boolean, Date, DateTime, Numeric, ForeignKey, JSON
+    Column, Integer, BigInteger, String, Text, Boolean, Date, DateTime, Numeric, ForeignKey, CheckConstraint, Index
 )
 from datetime import datetime, date
 from sqlalchemy.sql import func
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -29,6 +30,8 @@ class Client(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
     updated_at = Column(DateTime(timezone=True), onupdate=datetime.utcnow)
+    ref_version = Column(BigInteger, nullable=False, server_default="0")   # Caché local (core.refcache)
+    __table_args__ = (Index("ix_clients_ref_version", "ref_version"),)
 
 class Product(Base):
     __tablename__ = "products"
@@ -41,6 +44,17 @@ class Product(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Un producto por tipo (Tablas, Paletas, ...): create_product_with_inventory lo busca por nombre
+    __table_args__ = (Index("ix_products_name", "name"),)
+
+class ProductFactor(Base):
+    """Piezas por bulto de cada tipo de producto (se une a products por nombre)."""
+    __tablename__ = "product_factors"
+    product_name = Column(Text, primary_key=True)
+    pieces_per_bundle = Column(Integer, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    ref_version = Column(BigInteger, nullable=False, server_default="0")
+    __table_args__ = (CheckConstraint("pieces_per_bundle > 0", name="ck_product_factors_positive"),)
 
 class Inventory(Base):
     __tablename__ = "inventory"
@@ -72,6 +86,15 @@ class Inventory(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    # El número de lote es único: los registros duplicados los rechaza la base (ON CONFLICT)
+    __table_args__ = (
+        Index("ux_inventory_nro_lote", "nro_lote", unique=True),
+        # Orden desde los encabezados de la tabla de existencias (migración 0011)
+        Index("ix_inventory_created_at_id", "created_at", "id"),
+        Index("ix_inventory_prod_date_id", "prod_date", "id"),
+        Index("ix_inventory_quantity_id", "quantity", "id"),
+    )
+
     product = relationship("Product", backref="inventory_items")
     dispatches = relationship("Dispatch", back_populates="inventory_item")
 
@@ -90,6 +113,8 @@ class Dispatch(Base):
     # Relaciones
     inventory_item = relationship("Inventory", back_populates="dispatches")
     client = relationship("Client")
+    # Historial paginado por clave (date, id), del más reciente al más antiguo
+    __table_args__ = (Index("ix_dispatches_date_id", date.desc(), id.desc()),)
 
 class Movement(Base):
     __tablename__ = "movements"
@@ -100,9 +125,35 @@ class Movement(Base):
     movement_type = Column(String, nullable=False) 
     reference = Column(Text)
     performed_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"))
-    performed_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Clave de partición (movements se particiona por mes, ver core/partitions.py);
+    # en la base la clave primaria es (id, performed_at)
+    performed_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     notes = Column(Text)
 
+class StockSnapshot(Base):
+    """Saldo de cada lote al instante taken_at (movimientos con performed_at anterior)."""
+    __tablename__ = "stock_snapshots"
+    id = Column(Integer, primary_key=True)
+    taken_at = Column(DateTime(timezone=True), nullable=False)
+    inventory_id = Column(Integer, ForeignKey("inventory.id", ondelete="SET NULL"))
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    quantity = Column(Numeric(18,6), nullable=False)
+    __table_args__ = (Index("ix_stock_snapshots_taken_at", "taken_at", "inventory_id"),)
+
+class AppliedRequest(Base):
+    """Pedidos de la cola local (core.offline) ya aplicados: la clave evita aplicarlos dos veces."""
+    __tablename__ = "applied_requests"
+    key = Column(String(36), primary_key=True)
+    kind = Column(String, nullable=False)
+    result_id = Column(Integer)
+    applied_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class RefVersion(Base):
+    """Versión de cada tabla de referencia; la incrementa un trigger en cada alta o cambio (migración 0012)."""
+    __tablename__ = "ref_versions"
+    tabla = Column(Text, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
 class Setting(Base):
     __tablename__ = "settings"
     key = Column(String, primary_key=True)
@@ -117,7 +168,8 @@ class AuditLog(Base):
     object_type = Column(String)
     object_id = Column(String)
     occurred_at = Column(DateTime(timezone=True), server_default=func.now())
-    details = Column(JSON)
+    details = Column(JSONB)   # Filtrable con @> gracias al índice GIN
+    __table_args__ = (Index("ix_audit_logs_details", "details", postgresql_using="gin"),)
 
 # Busca la clase PredefinedMeasure al final del archivo y déjala así:
 
@@ -129,4 +181,5 @@ class PredefinedMeasure(Base):
     largo = Column(Numeric(10, 2))
     ancho = Column(Numeric(10, 2))
     espesor = Column(Numeric(10, 2))
-    is_active = Column(Boolean, default=True) # <--- NUEVO CAMPO
\ No newline at end of file
+    is_active = Column(Boolean, default=True) # <--- NUEVO CAMPO
+    ref_version = Column(BigInteger, nullable=False, server_default="0")
\ No newline at end of file
@@ -0,0 +1,192 @@
+# core/offline.py
+"""
+Cola local de escrituras: registros de producción y despachos.
+
+enqueue() guarda el pedido en un diario SQLite del equipo (RUTA) con una clave
+de idempotencia generada aquí (uuid4) y vuelve enseguida: la pantalla nunca
+espera a la red. Un hilo sincronizador envía los pendientes al servidor en
+lotes de LOTE pedidos (repo.apply_offline_batch, una transacción por lote) y
+marca cada uno como "done" o "conflict" (stock insuficiente, lote ya
+registrado con otros datos). Si el servidor no responde, los pedidos quedan
+pendientes y se reintenta cada REINTENTO segundos.
+
+La clave se guarda también en el servidor (tabla applied_requests, migración
+0009), así que reenviar un lote que se cortó antes de marcarse localmente no
+duplica nada. Los conflictos quedan en el diario hasta que el usuario los
+reintenta o los descarta (screens/cola.py).
+"""
+import os
+import json
+import uuid
+import sqlite3
+import threading
+from datetime import datetime
+
+RUTA = os.path.join(os.path.expanduser("~"), ".astillados", "cola_escrituras.sqlite3")
+LOTE = 50
+REINTENTO = 15.0       # Segundos entre intentos mientras el servidor no responde
+CONSERVAR_DIAS = 7     # Los pedidos aplicados se borran del diario pasado este tiempo
+
+REGISTRO = "registration"
+DESPACHO = "dispatch"
+
+PENDIENTE = "pending"
+HECHO = "done"
+CONFLICTO = "conflict"
+
+
+class Journal:
+    """Diario SQLite de pedidos. Seguro para usar desde varios hilos."""
+
+    def __init__(self, ruta=RUTA):
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        # WAL + FULL: cada pedido queda en disco al volver de add(), sin bloquear las lecturas
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS pedidos (
+            key TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            message TEXT,
+            result_id INTEGER)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_pedidos_status ON pedidos (status, created_at)")
+
+    def _sql(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def add(self, kind, payload):
+        key = str(uuid.uuid4())
+        self._sql("INSERT INTO pedidos (key, kind, payload, created_at) VALUES (?, ?, ?, ?)",
+                  (key, kind, json.dumps(payload, default=str), datetime.now().isoformat(sep=" ", timespec="seconds")))
+        return key
+
+    def pending(self, limit=LOTE):
+        """[(key, kind, payload)] en el orden en que se cargaron."""
+        filas = self._sql("SELECT key, kind, payload FROM pedidos WHERE status = ? ORDER BY created_at, rowid LIMIT ?",
+                          (PENDIENTE, limit))
+        return [(k, kind, json.loads(p)) for k, kind, p in filas]
+
+    def mark(self, resultados):
+        """Guarda {key: (estado, mensaje, result_id)} en una sola transacción local."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "UPDATE pedidos SET status = ?, message = ?, result_id = ?, attempts = attempts + 1 WHERE key = ?",
+                    [(st, msg, rid, k) for k, (st, msg, rid) in resultados.items()])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK"); raise
+
+    def counts(self):
+        return dict(self._sql("SELECT status, count(*) FROM pedidos GROUP BY status"))
+
+    def conflicts(self):
+        """[(key, kind, payload, created_at, message)] de los pedidos rechazados por el servidor."""
+        filas = self._sql("SELECT key, kind, payload, created_at, message FROM pedidos WHERE status = ? ORDER BY created_at",
+                          (CONFLICTO,))
+        return [(k, kind, json.loads(p), t, msg) for k, kind, p, t, msg in filas]
+
+    def retry(self, key):
+        self._sql("UPDATE pedidos SET status = ?, message = NULL WHERE key = ? AND status = ?", (PENDIENTE, key, CONFLICTO))
+
+    def discard(self, key):
+        self._sql("DELETE FROM pedidos WHERE key = ? AND status = ?", (key, CONFLICTO))
+
+    def purge(self, dias=CONSERVAR_DIAS):
+        self._sql("DELETE FROM pedidos WHERE status = ? AND created_at < datetime('now', 'localtime', ?)",
+                  (HECHO, f"-{int(dias)} days"))
+
+
+class Synchronizer:
+    """Hilo que envía los pedidos pendientes; on_change(counts) se llama tras cada lote."""
+
+    def __init__(self, journal, on_change=None):
+        self.journal = journal
+        self.on_change = on_change
+        self.ultimo_error = None
+        self._evento = threading.Event()
+        self._hilo = None
+
+    def start(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            self._hilo = threading.Thread(target=self._bucle, name="offline-sync", daemon=True)
+            self._hilo.start()
+        self.wake()
+
+    def wake(self):
+        self._evento.set()
+
+    def _bucle(self):
+        self.journal.purge()
+        while True:
+            self._evento.wait(REINTENTO)
+            self._evento.clear()
+            # Mientras salgan lotes completos hay más pendientes: seguir sin esperar
+            while self.push() == LOTE: pass
+
+    def push(self):
+        """Envía un lote. Devuelve la cantidad de pedidos enviados (0 si no hay o falló la conexión)."""
+        from . import repo
+        pedidos = self.journal.pending(LOTE)
+        if not pedidos: return 0
+        try:
+            resultados = repo.apply_offline_batch(pedidos)
+        except Exception as e:
+            self.ultimo_error = str(e)
+            print(f"Advertencia: cola local sin sincronizar ({len(pedidos)} pendientes): {e}")
+            self._avisar()
+            return 0
+        self.ultimo_error = None
+        self.journal.mark(resultados)
+        self._avisar()
+        return len(pedidos)
+
+    def _avisar(self):
+        if self.on_change:
+            try: self.on_change(self.journal.counts())
+            except Exception as e: print(f"Advertencia: aviso de la cola local: {e}")
+
+
+_lock = threading.Lock()
+_journal = None
+_sync = None
+
+
+def journal():
+    """Diario único de la aplicación (se abre al primer uso)."""
+    global _journal
+    with _lock:
+        if _journal is None: _journal = Journal()
+        return _journal
+
+
+def synchronizer():
+    global _sync
+    j = journal()
+    with _lock:
+        if _sync is None: _sync = Synchronizer(j)
+        return _sync
+
+
+def start(on_change=None):
+    """Arranca el sincronizador (MainScreen). on_change recibe {estado: cantidad}."""
+    s = synchronizer()
+    if on_change is not None: s.on_change = on_change
+    s.start()
+    return s
+
+
+def enqueue(kind, payload):
+    """Guarda el pedido en el diario local y despierta al sincronizador. Devuelve la clave."""
+    from . import audit
+    payload = dict(payload, actor_id=audit.current_actor())
+    key = journal().add(kind, payload)
+    synchronizer().start()
+    return key
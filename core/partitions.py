@@ -0,0 +1,136 @@
+# core/partitions.py
+"""
+Particiones mensuales de las tablas de historial (movements).
+
+La migración 0003 convierte movements en una tabla particionada por rango de
+performed_at, con una partición por mes (movements_AAAA_MM) y una partición
+por defecto para fechas fuera de rango. maintain() se ejecuta al iniciar la
+app: crea las particiones de los próximos meses y, si se configuró una
+retención, archiva las más antiguas (COPY a un CSV comprimido) y las separa
+de la tabla, para que las consultas recientes, el VACUUM y los respaldos
+trabajen solo con los meses vigentes.
+
+Restricción: el stock a una fecha y el kardex (core.repo) se calculan con los
+movimientos entre la foto de existencias más cercana y la fecha pedida. Sin los
+meses archivados esos cálculos darían saldos erróneos, así que el límite se
+guarda en settings (archived_until) y core.repo rechaza con un error los rangos
+que lo necesitan. Las fechas anteriores al límite solo se consultan
+restaurando los CSV archivados.
+"""
+import os
+import gzip
+from datetime import date
+
+from sqlalchemy import text
+
+from .db import engine
+
+# Tabla particionada -> columna de fecha (clave de partición)
+PARTICIONADAS = {"movements": "performed_at"}
+
+
+def _clave_archivo(tabla):
+    return f"partitions:archived_until:{tabla}"
+
+
+def archived_until(conn, tabla):
+    """Primer día con movimientos disponibles (lo anterior se archivó), o None si no se archivó nada."""
+    valor = conn.execute(text("SELECT value FROM settings WHERE key = :k"), {"k": _clave_archivo(tabla)}).scalar()
+    return date.fromisoformat(valor) if valor else None
+
+
+def _mes(d, delta=0):
+    m = d.year * 12 + d.month - 1 + delta
+    return date(m // 12, m % 12 + 1, 1)
+
+
+def partition_name(tabla, mes):
+    return f"{tabla}_{mes:%Y_%m}"
+
+
+def is_partitioned(conn, tabla):
+    return conn.execute(text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:t)"), {"t": tabla}).scalar() or False
+
+
+def list_partitions(conn, tabla):
+    """{primer día del mes: nombre} de las particiones mensuales adjuntas."""
+    filas = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:t)"), {"t": tabla}).scalars()
+    res = {}
+    for nombre in filas:
+        try:
+            y, m = nombre[len(tabla) + 1:].split("_")
+            res[date(int(y), int(m), 1)] = nombre
+        except ValueError:
+            continue  # Partición por defecto u otras
+    return res
+
+
+def create_partition(conn, tabla, mes):
+    """
+    Crea la partición del mes. Si la partición por defecto ya tiene filas de ese mes,
+    se la separa, se mueven las filas y se la vuelve a adjuntar (PostgreSQL no permite
+    crear una partición que solape datos del DEFAULT).
+    """
+    col = PARTICIONADAS[tabla]
+    nombre, desde, hasta = partition_name(tabla, mes), mes, _mes(mes, 1)
+    default = f"{tabla}_default"
+    rango = {"d": desde, "h": hasta}
+    ocupado = conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {col} >= :d AND {col} < :h)"), rango).scalar()
+    if ocupado:
+        conn.execute(text(f"ALTER TABLE {tabla} DETACH PARTITION {default}"))
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {nombre} PARTITION OF {tabla} FOR VALUES FROM ('{desde}') TO ('{hasta}')"))
+    if ocupado:
+        conn.execute(text(f"INSERT INTO {tabla} SELECT * FROM {default} WHERE {col} >= :d AND {col} < :h"), rango)
+        conn.execute(text(f"DELETE FROM {default} WHERE {col} >= :d AND {col} < :h"), rango)
+        conn.execute(text(f"ALTER TABLE {tabla} ATTACH PARTITION {default} DEFAULT"))
+    return nombre
+
+
+def archive_partition(tabla, mes, carpeta=None):
+    """
+    Separa la partición del mes. Con 'carpeta' la vuelca antes a <carpeta>/<partición>.csv.gz
+    y la elimina; sin carpeta queda como tabla independiente (fuera de las consultas).
+    """
+    nombre = partition_name(tabla, mes)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+        raw = engine.raw_connection()
+        try:
+            with gzip.open(os.path.join(carpeta, f"{nombre}.csv.gz"), "wb") as f:
+                raw.cursor().copy_expert(f"COPY {nombre} TO STDOUT WITH (FORMAT csv, HEADER)", f)
+            raw.rollback()
+        finally:
+            raw.close()
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {tabla} DETACH PARTITION {nombre}"))
+        if carpeta: conn.execute(text(f"DROP TABLE {nombre}"))
+        # Fechas ISO: el máximo como texto es el mes más reciente archivado
+        conn.execute(text("INSERT INTO settings (key, value, description) VALUES (:k, :v, 'Movimientos archivados antes de esta fecha') "
+                          "ON CONFLICT (key) DO UPDATE SET value = greatest(settings.value, EXCLUDED.value)"),
+                     {"k": _clave_archivo(tabla), "v": _mes(mes, 1).isoformat()})
+    return nombre
+
+
+def maintain(meses_futuros=3, retener_meses=0, carpeta_archivo=None, hoy=None):
+    """
+    Crea las particiones hasta 'meses_futuros' adelante y archiva las anteriores a
+    'retener_meses' (0 = conservar todo). Devuelve {'creadas': [...], 'archivadas': [...]}.
+    """
+    hoy = hoy or date.today()
+    actual = _mes(hoy)
+    res = {"creadas": [], "archivadas": []}
+    for tabla in PARTICIONADAS:
+        with engine.begin() as conn:
+            if not is_partitioned(conn, tabla): continue
+            existentes = list_partitions(conn, tabla)
+            for i in range(meses_futuros + 1):
+                mes = _mes(actual, i)
+                if mes not in existentes:
+                    res["creadas"].append(create_partition(conn, tabla, mes))
+        if retener_meses:
+            limite = _mes(actual, -retener_meses)
+            for mes in sorted(m for m in existentes if m < limite):
+                res["archivadas"].append(archive_partition(tabla, mes, carpeta_archivo))
+    return res
@@ -0,0 +1,122 @@
+# core/prefetch.py
+"""
+Precarga de datos mientras la pantalla de login está visible.
+
+start() calienta el pool de conexiones y trae en un hilo las consultas de la
+primera pantalla (existencias, historial de despachos, clientes activos y
+lotes disponibles). Antes de conectarse llena el índice de clientes con la
+caché local (core.refcache), así el selector funciona aunque el enlace sea
+lento; después revalida esa caché. Al construir MainScreen las pantallas toman esos datos con
+get(clave) en lugar de consultar; después main.py llama a clear() y las
+actualizaciones siguientes vuelven a ir a la base.
+
+Con la primera conexión se aplican las migraciones pendientes (una sola espera
+si el servidor no responde); wait() no deja construir MainScreen antes de que
+terminen. Las tareas de mantenimiento que recibe start() (particiones, etc.) corren en el
+mismo hilo después de las consultas: no demoran la ventana de login ni la
+pantalla principal, y si no hay conexión no se intentan.
+"""
+import time
+import threading
+
+VIGENCIA = 300        # Segundos que un dato precargado se considera actual
+CONEXIONES = 2        # Conexiones que se abren por adelantado en el pool
+
+# clave -> consulta (recibe core.repo); las mismas que hacen las pantallas al abrir
+_CONSULTAS = {
+    "inventory_rows": lambda repo: repo.list_inventory_rows(mostrar_agotados=False),
+    "dispatches_history": lambda repo: repo.list_dispatches_history(),
+    "clients_active": lambda repo: repo.list_clients(solo_activos=True, limit=repo.CLIENTES_PAGINA),
+    "available_lots": lambda repo: repo.get_available_inventory(),
+    # Revalida la caché local de referencia (clientes, medidas, piezas por bulto) y con ella
+    # el índice en memoria del selector de clientes de DespachoScreen (core.client_index)
+    "client_index": lambda repo: _indice_clientes(),
+}
+
+
+def _indice_clientes():
+    from .client_index import shared
+    return shared().refresh()
+
+_lock = threading.Lock()
+_datos = {}
+_hilo = None
+_esquema = threading.Event()   # Migraciones aplicadas (o descartadas por falta de conexión)
+_listo = threading.Event()     # Consultas terminadas (el mantenimiento puede seguir)
+
+
+def start(mantenimiento=()):
+    """
+    Lanza la precarga en segundo plano (una sola vez).
+    mantenimiento: [(descripción, fn)] que corren al final, en orden, en el mismo hilo.
+    """
+    global _hilo
+    with _lock:
+        if _hilo is not None: return
+        _hilo = threading.Thread(target=_precargar, args=(list(mantenimiento),), name="prefetch", daemon=True)
+        _hilo.start()
+
+
+def _precargar(mantenimiento):
+    try:
+        if not _consultar(): return
+    finally:
+        _esquema.set(); _listo.set()
+    for descripcion, fn in mantenimiento:
+        try:
+            fn()
+        except Exception as e:
+            print(f"Advertencia: {descripcion}: {e}")
+
+
+def _consultar():
+    """Conexiones, migraciones y consultas de la primera pantalla. False si no hay conexión."""
+    from . import repo, migrations
+    from .db import engine
+    from .client_index import shared
+    try: shared().load_cached()
+    except Exception as e: print(f"Advertencia: caché de referencia: {e}")
+    conns = []
+    try:
+        # Abrir las conexiones a la vez y devolverlas al pool: la primera consulta real ya no paga el connect
+        for _ in range(CONEXIONES):
+            c = engine.connect(); c.exec_driver_sql("SELECT 1"); conns.append(c)
+    except Exception as e:
+        print(f"Advertencia: precarga sin conexión: {e}")
+        return False
+    finally:
+        for c in conns: c.close()
+    # Cambios de esquema pendientes (tablas, índices y datos base nuevos), antes de consultar
+    try:
+        migrations.apply_migrations()
+    except Exception as e:
+        print(f"Advertencia: no se pudieron aplicar las migraciones: {e}")
+    _esquema.set()
+    for clave, consulta in _CONSULTAS.items():
+        try:
+            valor = consulta(repo)
+        except Exception as e:
+            print(f"Advertencia: precarga de {clave}: {e}")
+            continue
+        with _lock: _datos[clave] = (time.monotonic(), valor)
+    return True
+
+
+def wait(timeout):
+    """
+    Espera a que terminen las migraciones (sin límite: la pantalla principal las necesita)
+    y las consultas precargadas (como máximo 'timeout' segundos).
+    """
+    if _hilo is None: return
+    _esquema.wait()
+    _listo.wait(timeout)
+
+
+def get(clave):
+    """Dato precargado y vigente, o None para consultar normalmente."""
+    with _lock: t, valor = _datos.get(clave, (None, None))
+    return valor if t is not None and time.monotonic() - t < VIGENCIA else None
+
+
+def clear():
+    with _lock: _datos.clear()
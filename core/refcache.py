@@ -0,0 +1,157 @@
+# core/refcache.py
+"""
+Caché local de los datos de referencia: clientes, medidas predefinidas y
+piezas por bulto de cada producto (product_factors).
+
+Se guardan en un SQLite del equipo (RUTA) junto con la versión de cada tabla
+en el servidor (ref_versions, migración 0012: un contador por tabla que un
+trigger incrementa en cada alta o cambio y copia en la columna ref_version de
+la fila). Al arrancar, las pantallas leen de aquí sin esperar a la base.
+revalidate() compara las versiones con una consulta pequeña y trae solo las
+filas con ref_version mayor a la guardada. Si la versión del servidor es
+menor (se restauró un respaldo), esa tabla se vuelve a cargar completa.
+
+Las bajas en estas tablas son lógicas (is_active): llegan como un cambio más.
+"""
+import os
+import json
+import sqlite3
+import threading
+
+from .rows import ClientRow, MeasureRow
+
+RUTA = os.path.join(os.path.expanduser("~"), ".astillados", "referencias.sqlite3")
+
+CLIENTES = "clients"
+MEDIDAS = "predefined_measures"
+FACTORES = "product_factors"
+TABLAS = (CLIENTES, MEDIDAS, FACTORES)
+
+
+class RefCache:
+    """Datos de referencia en disco y en memoria. Seguro para usar desde varios hilos."""
+
+    def __init__(self, ruta=RUTA):
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        self._lock = threading.Lock()
+        self._lock_revalidar = threading.Lock()   # Una sola revalidación a la vez
+        self._conn = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS filas (
+            tabla TEXT NOT NULL,
+            id TEXT NOT NULL,
+            datos TEXT NOT NULL,
+            PRIMARY KEY (tabla, id))""")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS versiones (tabla TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+        self._versiones = dict(self._conn.execute("SELECT tabla, version FROM versiones"))
+        # tabla -> {id: fila}; cada fila son las columnas de repo.REF_TABLAS más su ref_version al final
+        self._filas = {t: {} for t in TABLAS}
+        for t, k, d in self._conn.execute("SELECT tabla, id, datos FROM filas"):
+            if t in self._filas: self._filas[t][k] = tuple(json.loads(d))
+
+    # ---------- LECTURA ----------
+    def version(self, tabla):
+        """Versión guardada de la tabla, o None si nunca se cargó."""
+        with self._lock: return self._versiones.get(tabla)
+
+    def changed_since(self, tabla, version=None):
+        """Filas (sin la versión) cambiadas después de 'version'; sin versión, todas."""
+        with self._lock: filas = list(self._filas[tabla].values())
+        return [f[:-1] for f in sorted(filas, key=lambda f: f[-1]) if version is None or f[-1] > version]
+
+    def clients(self):
+        """ClientRow activos, por nombre."""
+        res = [c for c in map(ClientRow._make, self.changed_since(CLIENTES)) if c.is_active]
+        return sorted(res, key=lambda c: (c.name.lower(), c.id))
+
+    def measures(self, ptype):
+        """MeasureRow activas del tipo de producto, en el orden en que se crearon."""
+        filas = sorted(f for f in self.changed_since(MEDIDAS) if f[1] == ptype and f[6])
+        return [MeasureRow._make(f[:6]) for f in filas]
+
+    def factors(self):
+        """{tipo_producto: piezas_por_bulto}."""
+        return {f[0]: f[1] for f in self.changed_since(FACTORES)}
+
+    # ---------- REVALIDACIÓN ----------
+    def revalidate(self):
+        """Trae del servidor lo que cambió. Devuelve {tabla: cantidad de filas actualizadas}."""
+        from . import repo
+        with self._lock_revalidar:
+            servidor = repo.ref_versions()
+            cambios = {}
+            for tabla in TABLAS:
+                v, guardada = servidor.get(tabla), self.version(tabla)
+                if v is None or v == guardada: continue
+                completa = guardada is None or v < guardada
+                filas = repo.ref_changes(tabla, None if completa else guardada)
+                # La versión leída antes ya está confirmada: todo lo anterior vino en 'filas'
+                self._guardar(tabla, filas, max([v] + [f[-1] for f in filas[-1:]]), completa)
+                cambios[tabla] = len(filas)
+            return cambios
+
+    def _guardar(self, tabla, filas, version, completa):
+        nuevas = {str(f[0]): tuple(f) for f in filas}   # id (product_name en product_factors)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                if completa: self._conn.execute("DELETE FROM filas WHERE tabla = ?", (tabla,))
+                self._conn.executemany("INSERT OR REPLACE INTO filas (tabla, id, datos) VALUES (?, ?, ?)",
+                                       [(tabla, k, json.dumps(f, default=str)) for k, f in nuevas.items()])
+                self._conn.execute("INSERT OR REPLACE INTO versiones (tabla, version) VALUES (?, ?)", (tabla, version))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK"); raise
+            if completa: self._filas[tabla] = nuevas
+            else: self._filas[tabla].update(nuevas)
+            self._versiones[tabla] = version
+
+
+_lock = threading.Lock()
+_cache = None
+
+
+def shared():
+    """Caché única de la aplicación (se abre al primer uso)."""
+    global _cache
+    with _lock:
+        if _cache is None: _cache = RefCache()
+        return _cache
+
+
+def revalidate():
+    """Revalida sin lanzar errores (sin servidor se sigue con lo guardado). Devuelve {tabla: cambios}."""
+    try:
+        return shared().revalidate()
+    except Exception as e:
+        print(f"Advertencia: datos de referencia sin revalidar: {e}")
+        return {}
+
+
+def revalidate_background(al_terminar=None):
+    """
+    Revalida en un hilo: la pantalla muestra lo guardado y la próxima lectura ya está al día.
+    al_terminar(cambios) se llama después, en ese mismo hilo.
+    """
+    def tarea():
+        cambios = revalidate()
+        if al_terminar:
+            try: al_terminar(cambios)
+            except Exception as e: print(f"Advertencia: datos de referencia: {e}")
+    threading.Thread(target=tarea, name="refcache", daemon=True).start()
+
+
+def measures(ptype):
+    """Medidas activas del tipo: de la caché si ya se cargó alguna vez, si no de la base."""
+    if shared().version(MEDIDAS) is None:
+        from . import repo
+        return repo.get_measures_by_type(ptype)
+    return shared().measures(ptype)
+
+
+def factors():
+    """Piezas por bulto: de la caché si ya se cargó alguna vez, si no de la base."""
+    if shared().version(FACTORES) is None:
+        from . import repo
+        return repo.get_conversion_factors()
+    return shared().factors()
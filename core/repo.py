@@ -1,11 +1,17 @@
 from decimal import Decimal
-from sqlalchemy import select, update, delete, and_, or_, func
-from sqlalchemy.exc import IntegrityError
-from .db import SessionLocal, create_tables
-from .models import Client, PredefinedMeasure, User, Product, Inventory, Movement, Dispatch
+from contextlib import contextmanager
+from functools import lru_cache
+from sqlalchemy import select, update, delete, insert, text, and_, or_, tuple_, func, cast, literal, null, union_all, bindparam, Float, Integer, DateTime
+from .db import SessionLocal, ReportSession, create_tables
+from . import audit, partitions
+from .cancel import QueryCancelled
+from .models import Client, PredefinedMeasure, User, Product, ProductFactor, Inventory, Movement, Dispatch, StockSnapshot, AuditLog, AppliedRequest, RefVersion
+from .rows import InventoryRow, AvailableLot, ClientRow, MeasureRow, StockBalanceRow, KardexRow, AuditRow
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import DBAPIError, IntegrityError, DataError
 import psycopg2
 import psycopg2.extras
-from datetime import datetime, date
+from datetime import datetime, date, time, timedelta
 
 # ---------- HERRAMIENTAS ----------
 def _parse_date(s):
@@ -17,88 +23,178 @@ def _parse_date(s):
         return None
     except: return None
 
+def _distinto(a, b):
+    """Comparación de valores editados (Decimal de la base contra float/str del formulario)."""
+    try: return float(a) != float(b)
+    except (TypeError, ValueError): return a != b
+
+def _num(col):
+    """Numeric -> float en la propia consulta (el driver entrega float, no Decimal)."""
+    return cast(func.coalesce(col, 0), Float)
+
+# ---------- CONVERSIÓN DE UNIDADES (tabla product_factors) ----------
+# Piezas por bulto del producto; 1 si el tipo no tiene factor cargado.
+_FACTOR = func.coalesce(ProductFactor.pieces_per_bundle, 1)
+
+def _with_factor(stmt):
+    """Une product_factors al Product ya presente en la consulta."""
+    return stmt.outerjoin(ProductFactor, ProductFactor.product_name == Product.name)
+
+def _bultos(qty_col):
+    """Bultos completos (entero) calculados en SQL."""
+    return cast(func.floor(func.coalesce(qty_col, 0) / _FACTOR), Integer)
+
+def _bultos_dec(qty_col):
+    """Bultos con decimales (para reportes)."""
+    return cast(func.coalesce(qty_col, 0), Float) / _FACTOR
+
+# Columnas proyectadas de cada fila liviana (mismo orden que los campos en core/rows.py)
+_INVENTORY_ROW_COLS = (
+    Inventory.id, Inventory.sku, func.coalesce(Inventory.nro_lote, "---"), Product.name,
+    _num(Inventory.quantity), Product.unit, _num(Inventory.largo), _num(Inventory.ancho), _num(Inventory.espesor),
+    func.coalesce(Inventory.piezas, 0), Inventory.quality, Inventory.prod_date,
+    Inventory.status, Inventory.obs, Inventory.drying, Inventory.planing, Inventory.impregnated,
+    _FACTOR, _bultos(Inventory.quantity)
+)
+_AVAILABLE_LOT_COLS = (
+    Inventory.id, Inventory.product_id, Inventory.sku, Inventory.nro_lote, Product.name,
+    _num(Inventory.quantity), Inventory.prod_date, Inventory.quality, Inventory.status,
+    _FACTOR, _bultos(Inventory.quantity)
+)
+_CLIENT_ROW_COLS = (Client.id, Client.name, Client.document_id, Client.phone, Client.email, Client.address, Client.is_active)
+_MEASURE_ROW_COLS = (
+    PredefinedMeasure.id, PredefinedMeasure.product_type, PredefinedMeasure.name,
+    _num(PredefinedMeasure.largo), _num(PredefinedMeasure.ancho), _num(PredefinedMeasure.espesor)
+)
+
+# ---------- ORDEN EN EL SERVIDOR (encabezados de las tablas) ----------
+# 'orden' es una tupla ((campo, desc), ...) armada con los encabezados de la tabla; cada
+# consulta define sus campos ordenables. Se agrega el id como desempate para que el orden
+# sea total y la paginación por clave no repita ni saltee filas.
+def _claves_orden(campos, orden, desempate):
+    """[(expresión, desc)] para ORDER BY; los campos desconocidos se ignoran."""
+    claves = [(campos[c], bool(d)) for c, d in orden if c in campos]
+    if not any(e is desempate for e, _ in claves):
+        claves.append((desempate, claves[-1][1] if claves else False))
+    return claves
+
+def _ordenar(stmt, claves):
+    return stmt.order_by(*[e.desc() if d else e.asc() for e, d in claves])
+
+def _posteriores(claves, valores):
+    """Condición de la paginación por clave: filas que siguen a 'valores' en el orden 'claves'."""
+    if len({d for _, d in claves}) == 1:
+        # Todas en el mismo sentido: comparación de filas, que recorre directo el índice compuesto
+        fila, ref = tuple_(*[e for e, _ in claves]), tuple_(*valores)
+        return fila < ref if claves[0][1] else fila > ref
+    return or_(*[and_(*[claves[j][0] == valores[j] for j in range(i)], e < valores[i] if d else e > valores[i])
+                 for i, (e, d) in enumerate(claves)])
+
 # ---------- INVENTARIO Y PRODUCTOS ----------
+# Registro de producción en una sola sentencia: resuelve el producto por tipo (lo crea si falta),
+# inserta el lote (ON CONFLICT por nro_lote único) y su movimiento IN. Si el lote ya existía,
+# la última parte devuelve la fila existente para distinguir un doble clic de un lote repetido.
+# El producto no se crea si el lote ya existe, y dos registros que crean a la vez el primer
+# producto de un tipo se encuentran en el ON CONFLICT (sku): el segundo espera y usa ese id.
+# Ese id solo se reutiliza si el nombre coincide: 'Tabla-A' y 'TablaA' dan el mismo sku y
+# el lote no debe quedar en el otro producto (no se inserta nada y _registrar lo rechaza).
+_REGISTRO_SQL = text("""
+WITH existente AS (
+    SELECT id FROM products WHERE name = :name ORDER BY id LIMIT 1
+), nuevo AS (
+    INSERT INTO products (sku, name, unit, quality, is_active)
+    SELECT :product_sku, :name, :unit, :quality, true
+    WHERE NOT EXISTS (SELECT 1 FROM existente) AND NOT EXISTS (SELECT 1 FROM inventory WHERE nro_lote = :nro_lote)
+    ON CONFLICT (sku) DO UPDATE SET sku = EXCLUDED.sku WHERE products.name = EXCLUDED.name
+    RETURNING id
+), prod AS (
+    SELECT id FROM existente UNION ALL SELECT id FROM nuevo
+), inv AS (
+    INSERT INTO inventory (product_id, sku, nro_lote, status, quantity, largo, ancho, espesor, piezas,
+                           prod_date, quality, drying, planing, impregnated, obs)
+    SELECT id, :sku, :nro_lote, 'DISPONIBLE', :quantity, :largo, :ancho, :espesor, :piezas,
+           :prod_date, :quality, :drying, :planing, :impregnated, :obs FROM prod
+    ON CONFLICT (nro_lote) DO NOTHING
+    RETURNING id, product_id, quantity
+), mov AS (
+    INSERT INTO movements (inventory_id, product_id, change_quantity, movement_type, reference, notes)
+    SELECT id, product_id, quantity, 'IN', :referencia, 'Producción inicial' FROM inv WHERE quantity <> 0
+)
+SELECT id, true AS creado, NULL AS quantity FROM inv
+UNION ALL
+SELECT e.id, false, e.quantity FROM inventory e WHERE e.nro_lote = :nro_lote AND NOT EXISTS (SELECT 1 FROM inv)
+""")
+
+def _registrar(session, data):
+    """Registro de producción dentro de la transacción 'session' (sin commit)."""
+    sku = (data.get("sku") or "").strip()
+    name = (data.get("name") or data.get("product_type") or "").strip()
+    nro_lote = (data.get("nro_lote") or "").strip()
+    if not sku or not name: raise ValueError("SKU y Nombre obligatorios.")
+    if not nro_lote: raise ValueError("El Número de Lote es obligatorio.")
+
+    dec = lambda k: Decimal(str(data.get(k))) if data.get(k) else None
+    params = {
+        "name": name, "product_sku": "".join(ch for ch in name.upper() if ch.isalnum()),
+        "unit": data.get("unit"), "quality": data.get("quality"),
+        "sku": sku, "nro_lote": nro_lote, "quantity": Decimal(str(data.get("quantity") or 0)),
+        "largo": dec("largo"), "ancho": dec("ancho"), "espesor": dec("espesor"),
+        "piezas": int(data.get("piezas")) if data.get("piezas") else None,
+        "prod_date": _parse_date(data.get("prod_date")),
+        "drying": data.get("drying"), "planing": data.get("planing"), "impregnated": data.get("impregnated"),
+        "obs": data.get("obs"), "referencia": f"Prod. Lote {nro_lote}",
+    }
+    guardado = lambda: session.execute(
+        select(Inventory.id, literal(False), Inventory.quantity).where(Inventory.nro_lote == nro_lote)).first()
+    try:
+        with session.begin_nested():
+            fila = session.execute(_REGISTRO_SQL, params).first()
+    except IntegrityError:
+        # Otra restricción única (carrera con otro registro): se decide por el lote ya guardado
+        fila = guardado()
+    else:
+        # El lote lo insertó otra transacción concurrente que confirmó después de la foto de la
+        # sentencia: una consulta nueva ya lo ve y se compara como cualquier lote existente
+        if fila is None: fila = guardado()
+    if fila is None:
+        otro = session.scalar(select(Product.name).where(Product.sku == params["product_sku"]))
+        if otro is not None and otro != name:
+            raise ValueError(f"No se pudo registrar el Lote '{nro_lote}': el código '{params['product_sku']}' "
+                             f"ya corresponde al producto '{otro}'.")
+        raise ValueError(f"No se pudo registrar el Lote '{nro_lote}': conflicto con otro registro. Intente de nuevo.")
+    inv_id, creado, existente_qty = fila
+    if creado: return {"inventory_id": inv_id, "status": "created"}
+    if abs(float(existente_qty) - float(params["quantity"])) < 0.01:
+        return {"inventory_id": inv_id, "status": "ignored_duplicate"}
+    raise ValueError(f"El Lote '{nro_lote}' ya existe con otros datos.")
+
 def create_product_with_inventory(data: dict):
     with SessionLocal() as session:
-        try:
-            sku = (data.get("sku") or "").strip()
-            name = (data.get("name") or data.get("product_type") or "").strip()
-            nro_lote = (data.get("nro_lote") or "").strip()
-            
-            if not sku or not name: raise ValueError("SKU y Nombre obligatorios.")
-            if not nro_lote: raise ValueError("El Número de Lote es obligatorio.")
-
-            existing = session.execute(select(Inventory).where(Inventory.nro_lote == nro_lote)).scalars().first()
-            
-            if existing:
-                existing_qty = float(existing.quantity)
-                new_qty = float(data.get("quantity") or 0)
-                if existing.sku == sku and abs(existing_qty - new_qty) < 0.01:
-                    return {"inventory_id": existing.id, "status": "ignored_duplicate"}
-                raise ValueError(f"El Lote '{nro_lote}' ya existe con otros datos.")
-
-            prod = session.execute(select(Product).where(Product.sku == sku)).scalars().first()
-            if not prod:
-                prod = Product(sku=sku, name=name, unit=data.get("unit"), quality=data.get("quality"))
-                session.add(prod)
-                session.flush()
-
-            inv = Inventory(
-                product_id=prod.id, sku=sku, nro_lote=nro_lote,
-                quantity=Decimal(str(data.get("quantity") or 0)),
-                largo=Decimal(str(data.get("largo"))) if data.get("largo") else None,
-                ancho=Decimal(str(data.get("ancho"))) if data.get("ancho") else None,
-                espesor=Decimal(str(data.get("espesor"))) if data.get("espesor") else None,
-                piezas=int(data.get("piezas")) if data.get("piezas") else None,
-                prod_date=_parse_date(data.get("prod_date")),
-                quality=data.get("quality"), drying=data.get("drying"),
-                planing=data.get("planing"), impregnated=data.get("impregnated"),
-                obs=data.get("obs"), status="DISPONIBLE"
-            )
-            session.add(inv)
-            session.flush()
-            
-            if inv.quantity != 0:
-                mv = Movement(
-                    inventory_id=inv.id, product_id=prod.id, change_quantity=inv.quantity,
-                    movement_type="IN", reference=f"Prod. Lote {inv.nro_lote}", notes="Producción inicial"
-                )
-                session.add(mv)
+        res = _registrar(session, data)
+        session.commit()
+    return res
 
-            session.commit()
-            return {"inventory_id": inv.id, "status": "created"}
+# Las consultas de lectura se arman en funciones _*_stmt para que core.repo_async
+# ejecute exactamente las mismas sentencias sobre el motor asyncio. Las más usadas se
+# arman una sola vez (lru_cache por combinación de filtros, valores con bindparam): cada
+# llamada solo pasa los parámetros y SQLAlchemy reutiliza la forma compilada.
+_INVENTARIO_CAMPOS = {
+    "id": Inventory.id, "created_at": Inventory.created_at, "sku": Inventory.sku, "lote": Inventory.nro_lote,
+    "product": Product.name, "quantity": Inventory.quantity, "bultos": _bultos(Inventory.quantity),
+    "prod_date": Inventory.prod_date, "status": Inventory.status, "largo": Inventory.largo,
+    "ancho": Inventory.ancho, "espesor": Inventory.espesor, "quality": Inventory.quality,
+}
+INVENTARIO_ORDEN = (("created_at", True),)
 
-        except IntegrityError:
-            session.rollback()
-            return {"status": "ignored_duplicate"}
-        except Exception:
-            session.rollback()
-            raise
+@lru_cache(maxsize=None)
+def _inventory_rows_stmt(mostrar_agotados=False, orden=INVENTARIO_ORDEN):
+    stmt = _with_factor(select(*_INVENTORY_ROW_COLS).join(Product, Product.id == Inventory.product_id))
+    if not mostrar_agotados: stmt = stmt.where(Inventory.quantity > 0)
+    return _ordenar(stmt, _claves_orden(_INVENTARIO_CAMPOS, orden, Inventory.id))
 
-def list_inventory_rows(mostrar_agotados=False):
+def list_inventory_rows(mostrar_agotados=False, orden=INVENTARIO_ORDEN):
     with SessionLocal() as session:
-        stmt = (
-            select(
-                Inventory.id, Inventory.sku, Inventory.nro_lote, Product.name,
-                Inventory.quantity, Product.unit, Inventory.largo, Inventory.ancho, Inventory.espesor,
-                Inventory.piezas, Inventory.quality, Inventory.prod_date,
-                Inventory.status, Inventory.obs, Product.name,
-                Inventory.drying, Inventory.planing, Inventory.impregnated
-            ).join(Product, Product.id == Inventory.product_id)
-        )
-        if not mostrar_agotados: stmt = stmt.where(Inventory.quantity > 0)
-        stmt = stmt.order_by(Inventory.created_at.desc())
-        rows = session.execute(stmt).all()
-        result = []
-        for r in rows:
-            result.append({
-                "id": r[0], "sku": r[1], "nro_lote": r[2] or "---", "product_name": r[3],
-                "quantity": float(r[4] or 0), "unit": r[5], "largo": float(r[6] or 0),
-                "ancho": float(r[7] or 0), "espesor": float(r[8] or 0), "piezas": int(r[9] or 0),
-                "quality": r[10], "prod_date": r[11], "status": r[12], "obs": r[13],
-                "product_type": r[14], "drying": r[15], "planing": r[16], "impregnated": r[17]
-            })
-        return result
+        return list(map(InventoryRow._make, session.execute(_inventory_rows_stmt(mostrar_agotados, tuple(map(tuple, orden))))))
     
 # --- CAMBIO: AÑADIDO PARÁMETRO 'REASON' ---
 def delete_inventory(inventory_id: int, reason: str = ""):
@@ -117,22 +213,33 @@ def delete_inventory(inventory_id: int, reason: str = ""):
             # Guardamos la justificación en las observaciones
             current_obs = inv.obs or ""
             inv.obs = f"{current_obs} | [BAJA: {reason}]".strip()
+            detalle = {"nro_lote": inv.nro_lote, "quantity": qty_to_remove, "reason": reason}
             session.commit()
+            audit.record(audit.INVENTORY_WRITE_OFF, "inventory", inventory_id, detalle)
         elif inv:
             inv.status = "BAJA"
             current_obs = inv.obs or ""
             inv.obs = f"{current_obs} | [BAJA: {reason}]".strip()
+            detalle = {"nro_lote": inv.nro_lote, "quantity": 0, "reason": reason}
             session.commit()
+            audit.record(audit.INVENTORY_WRITE_OFF, "inventory", inventory_id, detalle)
 
 # --- CAMBIO: PERMITIR CAMBIAR STATUS ---
+_CAMPOS_AUDITADOS = ("nro_lote", "quantity", "largo", "ancho", "espesor", "piezas", "prod_date", "quality", "obs", "status")
+
 def update_inventory(data: dict):
     with SessionLocal() as session:
         inv = session.get(Inventory, data["id"])
         if not inv: raise ValueError("No encontrado")
+        antes = {c: getattr(inv, c) for c in _CAMPOS_AUDITADOS}
         
         # Estos campos se actualizan pero desde la UI vendrán igual si están bloqueados
         inv.nro_lote = data.get("nro_lote")
-        inv.quantity = data.get("quantity")
+        # Todo cambio de cantidad queda en movements (stock_as_of se calcula desde ahí)
+        nueva = Decimal(str(data.get("quantity") or 0))
+        if nueva != (inv.quantity or 0):
+            session.add(Movement(inventory_id=inv.id, product_id=inv.product_id, change_quantity=nueva - (inv.quantity or 0), movement_type="ADJUSTMENT", reference="EDICIÓN MANUAL", notes="Ajuste de cantidad"))
+        inv.quantity = nueva
         inv.largo = data.get("largo")
         inv.ancho = data.get("ancho")
         inv.espesor = data.get("espesor")
@@ -144,105 +251,490 @@ def update_inventory(data: dict):
         # Si se envía un status (recuperación), lo aplicamos
         if "status" in data:
             inv.status = data["status"]
-            
+
+        cambios = {c: [antes[c], getattr(inv, c)] for c in _CAMPOS_AUDITADOS if _distinto(antes[c], getattr(inv, c))}
         session.commit()
+        if cambios: audit.record(audit.INVENTORY_EDIT, "inventory", data["id"], {"nro_lote": data.get("nro_lote"), "changes": cambios})
 
 # ---------- DESPACHOS Y SALIDAS ----------
 
+@lru_cache(maxsize=None)
+def _available_inventory_stmt():
+    return (_with_factor(select(*_AVAILABLE_LOT_COLS).join(Product, Inventory.product_id == Product.id)).where(and_(Inventory.quantity > 0, Inventory.status == 'DISPONIBLE')).order_by(Inventory.prod_date))
+
 def get_available_inventory():
     with SessionLocal() as session:
-        stmt = (select(Inventory, Product.name).join(Product, Inventory.product_id == Product.id).where(and_(Inventory.quantity > 0, Inventory.status == 'DISPONIBLE')).order_by(Inventory.prod_date))
-        results = session.execute(stmt).all()
-        data = []
-        for inv, p_name in results:
-            inv.product_name = p_name; inv.product_type = p_name; data.append(inv)
-        return data
+        return list(map(AvailableLot._make, session.execute(_available_inventory_stmt())))
+
+def _despachar(session, data):
+    """Despacho dentro de la transacción 'session' (sin commit). Devuelve (dispatch, detalle de auditoría)."""
+    inv_item = session.get(Inventory, data['inventory_id'], with_for_update=True)
+    if not inv_item: raise ValueError("Lote no encontrado.")
+    cant = Decimal(str(data['quantity']))
+    if cant > inv_item.quantity: raise ValueError(f"Stock insuficiente. Disp: {inv_item.quantity}")
+    new_d = Dispatch(inventory_id=data['inventory_id'], client_id=data['client_id'], quantity=cant, date=_parse_date(data['date']), transport_guide=data.get('guide', ''), obs=data.get('obs', ''))
+    session.add(new_d)
+    inv_item.quantity -= cant
+    if inv_item.quantity <= 0: inv_item.quantity=0; inv_item.status="AGOTADO"
+    session.add(Movement(inventory_id=inv_item.id, product_id=inv_item.product_id, change_quantity=-cant, movement_type="OUT", reference=f"Despacho {data.get('guide')}", notes="Salida"))
+    session.flush()
+    detalle = {"inventory_id": inv_item.id, "nro_lote": inv_item.nro_lote, "client_id": data['client_id'], "quantity": cant, "guide": data.get('guide', '')}
+    return new_d, detalle
 
 def create_dispatch(data: dict):
     with SessionLocal() as session:
-        inv_item = session.get(Inventory, data['inventory_id'])
-        if not inv_item: raise ValueError("Lote no encontrado.")
-        cant = Decimal(str(data['quantity']))
-        if cant > inv_item.quantity: raise ValueError(f"Stock insuficiente. Disp: {inv_item.quantity}")
-        new_d = Dispatch(inventory_id=data['inventory_id'], client_id=data['client_id'], quantity=cant, date=data['date'], transport_guide=data.get('guide', ''), obs=data.get('obs', ''))
-        session.add(new_d)
-        inv_item.quantity -= cant
-        if inv_item.quantity <= 0: inv_item.quantity=0; inv_item.status="AGOTADO"
-        session.add(Movement(inventory_id=inv_item.id, product_id=inv_item.product_id, change_quantity=-cant, movement_type="OUT", reference=f"Despacho {data.get('guide')}", notes="Salida"))
-        session.commit(); return new_d.id
-
-def list_dispatches_history():
+        new_d, detalle = _despachar(session, data)
+        session.commit()
+        audit.record(audit.DISPATCH_CREATE, "dispatch", new_d.id, detalle)
+        return new_d.id
+
+HISTORIAL_PAGINA = 200
+_HISTORIAL_CAMPOS = {
+    "id": Dispatch.id, "date": Dispatch.date, "guide": func.coalesce(Dispatch.transport_guide, ""),
+    "client": Client.name, "product": Product.name, "lote": func.coalesce(Inventory.nro_lote, ""),
+    "sku": func.coalesce(Inventory.sku, ""), "quantity": func.coalesce(Dispatch.quantity, 0), "bultos": _bultos(Dispatch.quantity),
+}
+HISTORIAL_ORDEN = (("date", True),)   # Índice ix_dispatches_date_id
+
+@lru_cache(maxsize=None)
+def _dispatches_history_stmt(con_cursor=False, con_busqueda=False, orden=HISTORIAL_ORDEN):
+    """
+    Despachos en el orden 'orden' (por defecto, del más reciente al más antiguo), paginados por clave.
+    Las claves de orden van al final de cada fila: el dict las guarda en "clave" para pedir la página siguiente.
+    """
+    claves = _claves_orden(_HISTORIAL_CAMPOS, orden, Dispatch.id)
+    stmt = _with_factor(select(Dispatch.id, Dispatch.date, Client.name, Product.name, Inventory.nro_lote, Inventory.sku, Dispatch.quantity, Dispatch.transport_guide, Dispatch.obs, Product.name, _bultos(Dispatch.quantity), *[e for e, _ in claves]).join(Inventory, Dispatch.inventory_id == Inventory.id).join(Product, Inventory.product_id == Product.id).join(Client, Dispatch.client_id == Client.id))
+    if con_busqueda:
+        p = bindparam("busqueda")
+        stmt = stmt.where(or_(Client.name.ilike(p), Dispatch.transport_guide.ilike(p), Inventory.nro_lote.ilike(p)))
+    if con_cursor:
+        stmt = stmt.where(_posteriores(claves, [bindparam(f"k{i}", type_=e.type) for i, (e, _) in enumerate(claves)]))
+    # LIMIT NULL = sin límite
+    return _ordenar(stmt, claves).limit(bindparam("limite", type_=Integer))
+
+def _dispatches_history_args(search=None, after=None, limit=HISTORIAL_PAGINA, orden=HISTORIAL_ORDEN):
+    """(argumentos de _dispatches_history_stmt, parámetros). 'after' es el último despacho de la página anterior."""
+    search = (search or "").strip()
+    params = {"busqueda": f"%{search}%", "limite": limit}
+    if after: params.update({f"k{i}": v for i, v in enumerate(after["clave"])})
+    return (after is not None, bool(search), tuple(map(tuple, orden))), params
+
+def _dispatch_history_dict(r):
+    return {"id": r[0], "date": r[1], "client": r[2], "product": r[3], "lote": r[4] or "-", "sku": r[5], "quantity": float(r[6]), "guide": r[7] or "S/G", "obs": r[8] or "", "type": r[9], "bultos": r[10], "clave": tuple(r[11:])}
+
+def list_dispatches_history(search=None, after=None, limit=HISTORIAL_PAGINA, orden=HISTORIAL_ORDEN):
+    """Una página del historial (limit=None: todo lo que sigue a 'after')."""
+    claves, params = _dispatches_history_args(search, after, limit, orden)
+    with ReportSession() as session:
+        return [_dispatch_history_dict(r) for r in session.execute(_dispatches_history_stmt(*claves), params)]
+
+# ---------- COLA LOCAL DE ESCRITURAS (core.offline) ----------
+def apply_offline_batch(pedidos):
+    """
+    Aplica en una sola transacción los pedidos [(key, kind, payload)] de la cola local.
+    Cada pedido va en su propio SAVEPOINT: un conflicto (stock insuficiente, lote con
+    otros datos, cantidad inválida o fuera de rango, cliente o lote inexistente) no deshace
+    los demás. Devuelve {key: (estado, mensaje, result_id)} con estado "done" o "conflict".
+    Solo los errores de conexión (OperationalError/InterfaceError) se propagan, para que el
+    lote se reintente: un pedido que falla siempre no debe trabar la cola.
+    """
+    resultados, eventos = {}, []
     with SessionLocal() as session:
-        stmt = (select(Dispatch.id, Dispatch.date, Client.name, Product.name, Inventory.nro_lote, Inventory.sku, Dispatch.quantity, Dispatch.transport_guide, Dispatch.obs, Product.name).join(Inventory, Dispatch.inventory_id == Inventory.id).join(Product, Inventory.product_id == Product.id).join(Client, Dispatch.client_id == Client.id).order_by(Dispatch.date.desc()))
-        rows = session.execute(stmt).all()
-        return [{"id": r[0], "date": r[1], "client": r[2], "product": r[3], "lote": r[4] or "-", "sku": r[5], "quantity": float(r[6]), "guide": r[7] or "S/G", "obs": r[8] or "", "type": r[9]} for r in rows]
+        for key, kind, payload in pedidos:
+            try:
+                with session.begin_nested():
+                    nueva = session.execute(
+                        pg_insert(AppliedRequest).values(key=key, kind=kind)
+                        .on_conflict_do_nothing().returning(AppliedRequest.key)).first()
+                    if nueva is None:
+                        # Ya se aplicó en un envío anterior (se cortó antes de marcarlo localmente)
+                        previo = session.get(AppliedRequest, key)
+                        resultados[key] = ("done", "Ya aplicado", previo.result_id if previo else None)
+                        continue
+                    if kind == "registration":
+                        res = _registrar(session, payload)
+                        result_id = res.get("inventory_id")
+                    elif kind == "dispatch":
+                        new_d, detalle = _despachar(session, payload)
+                        result_id = new_d.id
+                        eventos.append((payload.get("actor_id"), new_d.id, detalle))
+                    else:
+                        raise ValueError(f"Tipo de pedido desconocido: {kind}")
+                    session.execute(update(AppliedRequest).where(AppliedRequest.key == key).values(result_id=result_id))
+                resultados[key] = ("done", None, result_id)
+            except (ValueError, ArithmeticError, IntegrityError, DataError) as e:
+                # decimal.InvalidOperation es ArithmeticError; los de la base traen la sentencia: solo el motivo
+                motivo = str(e.orig).strip() if isinstance(e, DBAPIError) else (str(e) or type(e).__name__)
+                resultados[key] = ("conflict", motivo, None)
+        session.commit()
+    for actor_id, did, detalle in eventos:
+        audit.record(audit.DISPATCH_CREATE, "dispatch", did, detalle, actor_id=actor_id)
+    return resultados
 
 # ---------- REPORTES AVANZADOS ----------
+# Los reportes, el historial de despachos, el stock a la fecha, el kardex y la bitácora usan
+# ReportSession (db.report_engine: solo lectura, pool y statement_timeout propios).
 
-def report_production_period(start_date, end_date, product_name=None, quality=None):
-    with SessionLocal() as s:
-        stmt = (select(Inventory, Product.name).join(Product, Inventory.product_id == Product.id).where(and_(Inventory.prod_date >= start_date, Inventory.prod_date <= end_date)))
-        if product_name: stmt = stmt.where(Product.name.ilike(f"%{product_name}%"))
-        if quality and quality != "Todas": stmt = stmt.where(Inventory.quality == quality)
-        stmt = stmt.order_by(Inventory.prod_date)
-        results = s.execute(stmt).all()
-        data = []
-        for inv, pname in results:
-            data.append({"fecha": inv.prod_date, "lote": inv.nro_lote, "sku": inv.sku, "producto": pname, "cantidad": float(inv.quantity), "piezas_iniciales": inv.piezas or 0, "status": inv.status, "quality": inv.quality})
-        return data
+@contextmanager
+def _report_session(cancel=None):
+    """ReportSession; con 'cancel' (core.cancel.CancelToken) la consulta se puede interrumpir."""
+    with ReportSession() as s:
+        if cancel is None:
+            yield s
+            return
+        cancel.attach(s.connection().connection.dbapi_connection)
+        try:
+            yield s
+        except DBAPIError as e:
+            if cancel.cancelled: raise QueryCancelled() from e
+            raise
+        finally:
+            cancel.detach()
+        if cancel.cancelled: raise QueryCancelled()
 
-def report_dispatches_detailed(start_date, end_date, client_id=None, product_name=None, guide=None):
-    with SessionLocal() as s:
-        # SELECT CORREGIDO CON SKU
-        stmt = (
-            select(Dispatch.date, Dispatch.transport_guide, Client.name, Product.name, Inventory.nro_lote, Inventory.sku, Dispatch.quantity, Dispatch.obs)
-            .join(Inventory, Dispatch.inventory_id == Inventory.id)
-            .join(Product, Inventory.product_id == Product.id)
-            .join(Client, Dispatch.client_id == Client.id)
-            .where(and_(Dispatch.date >= start_date, Dispatch.date <= end_date))
-        )
-        if client_id: stmt = stmt.where(Dispatch.client_id == client_id)
-        if product_name: stmt = stmt.where(Product.name.ilike(f"%{product_name}%"))
-        if guide: stmt = stmt.where(Dispatch.transport_guide.ilike(f"%{guide}%"))
-        stmt = stmt.order_by(Dispatch.date.desc())
-        results = s.execute(stmt).all()
-        return [{"fecha": r[0], "guia": r[1], "cliente": r[2], "producto": r[3], "lote": r[4], "sku": r[5], "cantidad": float(r[6]), "obs": r[7]} for r in results]
+_REPORTE_PROD_CAMPOS = {
+    "fecha": Inventory.prod_date, "lote": Inventory.nro_lote, "sku": Inventory.sku, "producto": Product.name,
+    "quality": Inventory.quality, "piezas": Inventory.piezas, "bultos": _bultos_dec(Inventory.piezas), "status": Inventory.status,
+}
+REPORTE_PROD_ORDEN = (("fecha", False),)
 
-def report_by_lot_range(start_lote: int, end_lote: int, incluir_bajas: bool = False, product_name=None):
-    with SessionLocal() as s:
-        stmt = select(Inventory, Product.name).join(Product, Inventory.product_id == Product.id)
-        if product_name: stmt = stmt.where(Product.name.ilike(f"%{product_name}%"))
-        results = s.execute(stmt).all()
+@lru_cache(maxsize=None)
+def _report_production_stmt(con_producto, con_calidad, orden=REPORTE_PROD_ORDEN):
+    stmt = (_with_factor(select(Inventory.prod_date, Inventory.nro_lote, Inventory.sku, Product.name, _num(Inventory.quantity), func.coalesce(Inventory.piezas, 0), _bultos_dec(Inventory.piezas), Inventory.status, Inventory.quality)
+            .join(Product, Inventory.product_id == Product.id))
+            .where(and_(Inventory.prod_date >= bindparam("desde"), Inventory.prod_date <= bindparam("hasta"))))
+    if con_producto: stmt = stmt.where(Product.name.ilike(bindparam("producto")))
+    if con_calidad: stmt = stmt.where(Inventory.quality == bindparam("calidad"))
+    return _ordenar(stmt, _claves_orden(_REPORTE_PROD_CAMPOS, orden, Inventory.id))
+
+def report_production_period(start_date, end_date, product_name=None, quality=None, cancel=None, orden=REPORTE_PROD_ORDEN):
+    con_calidad = bool(quality and quality != "Todas")
+    params = {"desde": start_date, "hasta": end_date, "producto": f"%{product_name}%", "calidad": quality}
+    with _report_session(cancel) as s:
+        results = s.execute(_report_production_stmt(bool(product_name), con_calidad, tuple(map(tuple, orden))), params)
+        return [{"fecha": r[0], "lote": r[1], "sku": r[2], "producto": r[3], "cantidad": r[4], "piezas_iniciales": r[5], "bultos": r[6], "status": r[7], "quality": r[8]} for r in results]
+
+_REPORTE_DESP_CAMPOS = {
+    "fecha": Dispatch.date, "guia": Dispatch.transport_guide, "cliente": Client.name, "producto": Product.name,
+    "lote": Inventory.nro_lote, "sku": Inventory.sku, "cantidad": Dispatch.quantity, "bultos": _bultos_dec(Dispatch.quantity),
+}
+REPORTE_DESP_ORDEN = (("fecha", True),)
+
+@lru_cache(maxsize=None)
+def _report_dispatches_stmt(con_cliente, con_producto, con_guia, orden=REPORTE_DESP_ORDEN):
+    stmt = (
+        select(Dispatch.date, Dispatch.transport_guide, Client.name, Product.name, Inventory.nro_lote, Inventory.sku, _num(Dispatch.quantity), Dispatch.obs, _bultos_dec(Dispatch.quantity))
+        .join(Inventory, Dispatch.inventory_id == Inventory.id)
+        .join(Product, Inventory.product_id == Product.id)
+        .join(Client, Dispatch.client_id == Client.id)
+        .outerjoin(ProductFactor, ProductFactor.product_name == Product.name)
+        .where(and_(Dispatch.date >= bindparam("desde"), Dispatch.date <= bindparam("hasta")))
+    )
+    if con_cliente: stmt = stmt.where(Dispatch.client_id == bindparam("cliente"))
+    if con_producto: stmt = stmt.where(Product.name.ilike(bindparam("producto")))
+    if con_guia: stmt = stmt.where(Dispatch.transport_guide.ilike(bindparam("guia")))
+    return _ordenar(stmt, _claves_orden(_REPORTE_DESP_CAMPOS, orden, Dispatch.id))
+
+def report_dispatches_detailed(start_date, end_date, client_id=None, product_name=None, guide=None, cancel=None, orden=REPORTE_DESP_ORDEN):
+    params = {"desde": start_date, "hasta": end_date, "cliente": client_id, "producto": f"%{product_name}%", "guia": f"%{guide}%"}
+    with _report_session(cancel) as s:
+        results = s.execute(_report_dispatches_stmt(bool(client_id), bool(product_name), bool(guide), tuple(map(tuple, orden))), params)
+        return [{"fecha": r[0], "guia": r[1], "cliente": r[2], "producto": r[3], "lote": r[4], "sku": r[5], "cantidad": r[6], "obs": r[7], "bultos": r[8]} for r in results]
+
+@lru_cache(maxsize=None)
+def _report_lots_stmt(con_producto):
+    stmt = _with_factor(select(Inventory.nro_lote, Inventory.sku, Product.name, Inventory.prod_date, _num(Inventory.quantity), _bultos_dec(Inventory.quantity), Inventory.status)
+                        .join(Product, Inventory.product_id == Product.id))
+    if con_producto: stmt = stmt.where(Product.name.ilike(bindparam("producto")))
+    return stmt
+
+def report_by_lot_range(start_lote: int, end_lote: int, incluir_bajas: bool = False, product_name=None, cancel=None):
+    with _report_session(cancel) as s:
+        results = s.execute(_report_lots_stmt(bool(product_name)), {"producto": f"%{product_name}%"})
         data = []
-        for inv, pname in results:
+        for lote, sku, pname, fecha_prod, qty, bultos, estado in results:
             try:
-                lote_num = int(inv.nro_lote)
+                lote_num = int(lote)
                 if start_lote <= lote_num <= end_lote:
-                    if not incluir_bajas and (inv.quantity <= 0 or inv.status == "BAJA"): continue
-                    data.append({"lote": inv.nro_lote, "sku": inv.sku, "producto": pname, "fecha_prod": inv.prod_date, "stock_actual": float(inv.quantity), "estado": inv.status})
-            except ValueError: continue
+                    if not incluir_bajas and (qty <= 0 or estado == "BAJA"): continue
+                    data.append({"lote": lote, "sku": sku, "producto": pname, "fecha_prod": fecha_prod, "stock_actual": qty, "bultos": bultos, "estado": estado})
+            except (TypeError, ValueError): continue
         data.sort(key=lambda x: int(x["lote"]))
         return data
 
+def get_conversion_factors():
+    """{tipo_producto: piezas_por_bulto} desde la tabla product_factors."""
+    with SessionLocal() as s:
+        return dict(s.execute(select(ProductFactor.product_name, ProductFactor.pieces_per_bundle)).all())
+
+def set_conversion_factor(product_name: str, pieces_per_bundle: int):
+    if int(pieces_per_bundle) <= 0: raise ValueError("El factor debe ser mayor a 0.")
+    with SessionLocal() as s:
+        pf = s.get(ProductFactor, product_name)
+        if pf: pf.pieces_per_bundle = int(pieces_per_bundle)
+        else: s.add(ProductFactor(product_name=product_name, pieces_per_bundle=int(pieces_per_bundle)))
+        s.commit()
+
+# ---------- STOCK HISTÓRICO (tabla stock_snapshots) ----------
+# Una foto guarda el saldo de cada lote al instante taken_at. El saldo a otra fecha es
+# la foto más cercana más (o menos) los movimientos entre ambas, sin recorrer todo el libro.
+INTERVALOS_FOTO = ("monthly", "weekly", "daily")
+
+def _local(d):
+    """Medianoche local del día d como datetime con zona horaria."""
+    return datetime.combine(d, time.min).astimezone()
+
+def _inicio_periodo(t, intervalo):
+    d = t.date()
+    if intervalo == "monthly": d = d.replace(day=1)
+    elif intervalo == "weekly": d -= timedelta(days=d.weekday())
+    return _local(d)
+
+def _periodo_anterior(t, intervalo):
+    d = t.date()
+    if intervalo == "monthly": d = (d - timedelta(days=1)).replace(day=1)
+    else: d -= timedelta(days=7 if intervalo == "weekly" else 1)
+    return _local(d)
+
+def _foto_cercana(s, t, minimo=None):
+    """taken_at de la foto más próxima a t (antes o después) y no anterior a 'minimo', o None si no hay fotos."""
+    desde = [StockSnapshot.taken_at >= minimo] if minimo is not None else []
+    antes = s.execute(select(func.max(StockSnapshot.taken_at)).where(StockSnapshot.taken_at <= t, *desde)).scalar()
+    despues = s.execute(select(func.min(StockSnapshot.taken_at)).where(StockSnapshot.taken_at > t, *desde)).scalar()
+    if antes is None or despues is None: return antes or despues
+    return antes if t - antes <= despues - t else despues
+
+def _foto_para(s, t, exacta=True):
+    """
+    Foto desde la que se calcula el saldo a t. Si se archivaron meses de movimientos
+    (partitions.maintain) solo sirven las fotos posteriores al límite, y una fecha anterior
+    solo se calcula si hay una foto justo en t ('exacta'; el kardex necesita además los
+    movimientos desde t); si no, ValueError en lugar de un saldo incompleto.
+    """
+    limite = partitions.archived_until(s, "movements")
+    if limite is None: return _foto_cercana(s, t)
+    minimo = _local(limite)
+    if t >= minimo: return _foto_cercana(s, t, minimo)
+    if exacta and s.execute(select(StockSnapshot.id).where(StockSnapshot.taken_at == t).limit(1)).first(): return t
+    raise ValueError(f"Los movimientos anteriores al {limite:%d/%m/%Y} están archivados: "
+                     "no se puede calcular el stock ni el kardex para esas fechas.")
+
+def _saldos_stmt(hasta, foto=None):
+    """
+    (inventory_id, product_id, qty) al instante 'hasta'. Desde la foto 'foto' se suman o restan
+    los movimientos entre ambas; sin foto se parte de inventory.quantity y se descuentan los
+    movimientos posteriores a 'hasta'. El filtro por performed_at recorta las particiones.
+    """
+    if foto is None:
+        base = select(Inventory.id, Inventory.product_id, Inventory.quantity)
+        signo, delta = -1, Movement.performed_at >= hasta
+    else:
+        base = select(StockSnapshot.inventory_id, StockSnapshot.product_id, StockSnapshot.quantity).where(StockSnapshot.taken_at == foto)
+        signo = 1 if foto <= hasta else -1
+        ini, fin = sorted((foto, hasta))
+        delta = and_(Movement.performed_at >= ini, Movement.performed_at < fin)
+    movs = select(Movement.inventory_id, Movement.product_id, Movement.change_quantity * signo).where(delta)
+    u = union_all(base, movs).subquery()
+    inv_id, prod_id, qty = u.c
+    return select(inv_id.label("inventory_id"), prod_id.label("product_id"), func.sum(qty).label("qty")).group_by(inv_id, prod_id)
+
+def take_stock_snapshot(taken_at=None):
+    """Guarda el saldo de cada lote al instante taken_at (por defecto, ahora). Devuelve taken_at."""
+    with SessionLocal() as s:
+        t = taken_at or s.execute(select(func.now())).scalar()
+        if s.execute(select(StockSnapshot.id).where(StockSnapshot.taken_at == t).limit(1)).first(): return t
+        saldos = _saldos_stmt(t, _foto_para(s, t)).subquery()
+        filas = select(literal(t, DateTime(timezone=True)), saldos.c.inventory_id, saldos.c.product_id, saldos.c.qty).where(saldos.c.qty != 0)
+        s.execute(insert(StockSnapshot).from_select(["taken_at", "inventory_id", "product_id", "quantity"], filas))
+        s.commit()
+        return t
+
+def ensure_stock_snapshots(intervalo="monthly", ahora=None):
+    """
+    Toma las fotos que falten al inicio de cada período (mes, semana o día) hasta 'ahora'.
+    La primera vez solo se toma la del período actual. Devuelve los instantes guardados.
+    """
+    if intervalo not in INTERVALOS_FOTO: return []
+    with SessionLocal() as s:
+        ultima = s.execute(select(func.max(StockSnapshot.taken_at))).scalar()
+    pendientes, t = [], _inicio_periodo(ahora or datetime.now(), intervalo)
+    while ultima is None or t > ultima:
+        pendientes.append(t)
+        if ultima is None: break
+        t = _periodo_anterior(t, intervalo)
+    return [take_stock_snapshot(t) for t in reversed(pendientes)]
+
+def stock_as_of(fecha, product_name=None, por_lote=True, cancel=None):
+    """Existencias al cierre del día 'fecha', por lote o sumadas por producto (list[StockBalanceRow])."""
+    hasta = _local(_parse_date(fecha) + timedelta(days=1))
+    with _report_session(cancel) as s:
+        saldos = _saldos_stmt(hasta, _foto_para(s, hasta)).subquery()
+        if por_lote:
+            stmt = _with_factor(select(saldos.c.inventory_id, Inventory.nro_lote, Inventory.sku, Product.name, _num(saldos.c.qty), _bultos(saldos.c.qty))
+                                .select_from(saldos).join(Product, Product.id == saldos.c.product_id))
+            stmt = stmt.outerjoin(Inventory, Inventory.id == saldos.c.inventory_id).where(saldos.c.qty != 0).order_by(Product.name, Inventory.nro_lote)
+        else:
+            total = func.sum(saldos.c.qty)
+            stmt = _with_factor(select(null(), null(), null(), Product.name, _num(total), _bultos(total))
+                                .select_from(saldos).join(Product, Product.id == saldos.c.product_id))
+            stmt = stmt.group_by(Product.name, ProductFactor.pieces_per_bundle).having(total != 0).order_by(Product.name)
+        if product_name: stmt = stmt.where(Product.name.ilike(f"%{product_name}%"))
+        return list(map(StockBalanceRow._make, s.execute(stmt)))
+
+# ---------- KARDEX (historial de movimientos con saldo) ----------
+KARDEX_PAGINA = 500
+
+def _kardex_filtros(stmt, nro_lote=None, product_name=None):
+    if nro_lote: stmt = stmt.where(Inventory.nro_lote == str(nro_lote).strip())
+    if product_name: stmt = stmt.where(Product.name.ilike(f"%{product_name}%"))
+    return stmt
+
+def kardex_page(desde, hasta, nro_lote=None, product_name=None, por_producto=False, cursor=None, limit=KARDEX_PAGINA, cancel=None):
+    """
+    Una página del kardex entre las fechas desde..hasta (inclusive), ordenada por (performed_at, id).
+    El saldo se acumula por lote (o por producto) con SUM() OVER dentro de la página y se le suma
+    el saldo arrastrado en 'cursor'. Devuelve (list[KardexRow], cursor de la página siguiente o None).
+    """
+    ini, fin = _local(_parse_date(desde)), _local(_parse_date(hasta) + timedelta(days=1))
+    clave = Movement.product_id if por_producto else Movement.inventory_id
+    with _report_session(cancel) as s:
+        if cursor is None:
+            # Saldo de apertura al inicio del rango: foto más cercana + movimientos (ver stock_as_of)
+            saldos = _saldos_stmt(ini, _foto_para(s, ini, exacta=False)).subquery()
+            col = saldos.c.product_id if por_producto else saldos.c.inventory_id
+            stmt = (select(col, func.sum(saldos.c.qty)).select_from(saldos)
+                    .join(Product, Product.id == saldos.c.product_id).outerjoin(Inventory, Inventory.id == saldos.c.inventory_id).group_by(col))
+            cursor = (None, None, {k: float(v) for k, v in s.execute(_kardex_filtros(stmt, nro_lote, product_name))})
+        ultimo_t, ultimo_id, arrastre = cursor
+
+        pagina = (select(Movement.id, Movement.performed_at, Movement.movement_type, Movement.inventory_id, Inventory.nro_lote,
+                         Product.name.label("producto"), Movement.reference, Movement.notes, Movement.change_quantity, clave.label("clave"))
+                  .join(Product, Product.id == Movement.product_id).outerjoin(Inventory, Inventory.id == Movement.inventory_id)
+                  .where(Movement.performed_at >= ini, Movement.performed_at < fin))
+        pagina = _kardex_filtros(pagina, nro_lote, product_name)
+        if ultimo_t is not None: pagina = pagina.where(tuple_(Movement.performed_at, Movement.id) > tuple_(ultimo_t, ultimo_id))
+        p = pagina.order_by(Movement.performed_at, Movement.id).limit(limit).subquery()
+        acumulado = func.sum(p.c.change_quantity).over(partition_by=p.c.clave, order_by=(p.c.performed_at, p.c.id))
+        filas = s.execute(select(*p.c, acumulado).order_by(p.c.performed_at, p.c.id)).all()
+
+    arrastre = dict(arrastre)
+    res = []
+    for f in filas:
+        saldo = arrastre.get(f.clave, 0.0) + float(f[-1])
+        res.append(KardexRow(f.id, f.performed_at, f.movement_type, f.inventory_id, f.nro_lote, f.producto, f.reference, f.notes, float(f.change_quantity), saldo))
+    # El saldo arrastrado a la página siguiente es el último de cada clave en esta página
+    for f, r in zip(filas, res): arrastre[f.clave] = r.saldo
+    if len(filas) < limit: return res, None
+    return res, (filas[-1].performed_at, filas[-1].id, arrastre)
+
+# ---------- AUDITORÍA (tabla audit_logs, escrita por core.audit) ----------
+AUDITORIA_PAGINA = 200
+
+def list_audit_logs(desde, hasta, action=None, username=None, object_type=None, detalle=None, cursor=None, limit=AUDITORIA_PAGINA):
+    """
+    Eventos entre desde..hasta (inclusive), del más nuevo al más viejo. 'detalle' es un dict que
+    debe estar contenido en details (@>, usa el índice GIN). Paginado por clave (occurred_at, id):
+    devuelve (list[AuditRow], cursor de la página siguiente o None).
+    """
+    stmt = (select(AuditLog.id, AuditLog.occurred_at, User.username, AuditLog.action, AuditLog.object_type, AuditLog.object_id, AuditLog.details)
+            .outerjoin(User, User.id == AuditLog.actor_id)
+            .where(AuditLog.occurred_at >= _local(_parse_date(desde)), AuditLog.occurred_at < _local(_parse_date(hasta) + timedelta(days=1))))
+    if action: stmt = stmt.where(AuditLog.action == action)
+    if username: stmt = stmt.where(User.username.ilike(f"%{username}%"))
+    if object_type: stmt = stmt.where(AuditLog.object_type == object_type)
+    if detalle: stmt = stmt.where(AuditLog.details.contains(detalle))
+    if cursor: stmt = stmt.where(tuple_(AuditLog.occurred_at, AuditLog.id) < tuple_(*cursor))
+    with ReportSession() as s:
+        filas = [AuditRow(*r[:6], r[6] or {}) for r in s.execute(stmt.order_by(AuditLog.occurred_at.desc(), AuditLog.id.desc()).limit(limit))]
+    return filas, ((filas[-1].occurred_at, filas[-1].id) if len(filas) == limit else None)
+
 # ---------- CLIENTES / MEDIDAS / USUARIOS ----------
 def create_client(data):
-    with SessionLocal() as s: c=Client(name=data["nombre"], document_id=data["cedula_rif"], phone=data["telefono"], email=data["email"], address=data["direccion"], is_active=True); s.add(c); s.commit(); return c.id
-def list_clients(solo_activos=True):
-    with SessionLocal() as s: q=select(Client).order_by(Client.name); return s.execute(q.where(Client.is_active==True) if solo_activos else q).scalars().all()
+    with SessionLocal() as s: c=Client(name=data["nombre"], document_id=data["cedula_rif"], phone=data["telefono"], email=data["email"], address=data["direccion"], is_active=True); s.add(c); s.commit(); cid=c.id
+    audit.record(audit.CLIENT_CREATE, "client", cid, {"name": data["nombre"], "document_id": data["cedula_rif"]}); return cid
+# Orden de la lista de clientes: campo ordenable -> (columna, expresión). La expresión se aplica a la columna para el ORDER BY
+# (índices de la migración 0007/0011) y al valor de la última fila para la paginación por clave.
+CLIENT_ORDERS = {
+    "name": (Client.name, func.lower),
+    "document_id": (Client.document_id, lambda v: func.coalesce(v, "")),
+    "phone": (Client.phone, lambda v: func.coalesce(v, "")),
+    "email": (Client.email, lambda v: func.lower(func.coalesce(v, ""))),
+    "is_active": (Client.is_active, lambda v: func.coalesce(v, True)),
+}
+CLIENTES_PAGINA = 100
+
+def _like_prefijo(texto):
+    return texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def _clients_stmt(solo_activos=True, search=None, order="name", after=None, limit=None):
+    """
+    Clientes ordenados por 'order' (un campo de CLIENT_ORDERS o una tupla ((campo, desc), ...)).
+    'search' busca por prefijo en el nombre y en el documento (con o sin la letra V/J/E/G). Paginado
+    por clave: 'after' es la última ClientRow de la página anterior y 'limit' el tamaño de página (None = todos).
+    """
+    if isinstance(order, str): order = ((order, False),)
+    campos = [(CLIENT_ORDERS[c], bool(d)) for c, d in order if c in CLIENT_ORDERS]
+    claves = [(expr(col), d) for (col, expr), d in campos]
+    claves.append((Client.id, claves[-1][1] if claves else False))
+    q=_ordenar(select(*_CLIENT_ROW_COLS), claves)
+    if solo_activos: q=q.where(Client.is_active==True)
+    if search and search.strip():
+        p=_like_prefijo(search.strip().lower())
+        q=q.where(or_(func.lower(Client.name).like(p), func.lower(Client.document_id).like(p), func.split_part(Client.document_id, "-", 2).like(p)))
+    if after is not None:
+        valores = [expr(literal(getattr(after, col.key), col.type)) for (col, expr), _ in campos]
+        q=q.where(_posteriores(claves, valores + [after.id]))
+    return q.limit(limit) if limit else q
+def list_clients(solo_activos=True, search=None, order="name", after=None, limit=None):
+    with SessionLocal() as s: return list(map(ClientRow._make, s.execute(_clients_stmt(solo_activos, search, order, after, limit))))
+_CAMPOS_CLIENTE = {"nombre": "name", "cedula_rif": "document_id", "telefono": "phone", "email": "email", "direccion": "address"}
 def update_client(cid, data):
-    with SessionLocal() as s: c=s.get(Client, cid); 
-    if c: c.name=data.get("nombre",c.name); c.document_id=data.get("cedula_rif",c.document_id); c.phone=data.get("telefono",c.phone); c.email=data.get("email",c.email); c.address=data.get("direccion",c.address); s.commit()
+    with SessionLocal() as s:
+        c=s.get(Client, cid)
+        if not c: return
+        cambios={col: [getattr(c, col), data[k]] for k, col in _CAMPOS_CLIENTE.items() if k in data and getattr(c, col) != data[k]}
+        for col, (_, nuevo) in cambios.items(): setattr(c, col, nuevo)
+        s.commit()
+    if cambios: audit.record(audit.CLIENT_UPDATE, "client", cid, {"changes": cambios})
 def toggle_client_active(cid, active):
-    with SessionLocal() as s: c=s.get(Client, cid); 
-    if c: c.is_active=active; s.commit()
+    with SessionLocal() as s:
+        c=s.get(Client, cid)
+        if not c: return
+        c.is_active=active; s.commit()
+    audit.record(audit.CLIENT_TOGGLE, "client", cid, {"is_active": bool(active)})
 def create_measure(data):
     with SessionLocal() as s: m=PredefinedMeasure(product_type=data["product_type"], name=data["name"], largo=data["largo"], ancho=data["ancho"], espesor=data["espesor"], is_active=True); s.add(m); s.commit(); return m
+def _measures_stmt(ptype):
+    return select(*_MEASURE_ROW_COLS).where(and_(PredefinedMeasure.product_type==ptype, PredefinedMeasure.is_active==True))
 def get_measures_by_type(ptype):
-    with SessionLocal() as s: return s.execute(select(PredefinedMeasure).where(and_(PredefinedMeasure.product_type==ptype, PredefinedMeasure.is_active==True))).scalars().all()
+    with SessionLocal() as s: return list(map(MeasureRow._make, s.execute(_measures_stmt(ptype))))
 def delete_measure(mid):
     with SessionLocal() as s: m=s.get(PredefinedMeasure, mid); 
     if m: m.is_active=False; s.commit()
+# ---------- DATOS DE REFERENCIA (caché local, core.refcache) ----------
+# Tabla -> (modelo, columnas que guarda la caché). Las filas inactivas también se envían:
+# las bajas son lógicas y llegan a la caché como un cambio más.
+REF_TABLAS = {
+    "clients": (Client, _CLIENT_ROW_COLS),
+    "predefined_measures": (PredefinedMeasure, _MEASURE_ROW_COLS + (PredefinedMeasure.is_active,)),
+    "product_factors": (ProductFactor, (ProductFactor.product_name, ProductFactor.pieces_per_bundle)),
+}
+
+def ref_versions():
+    """{tabla: versión} de los datos de referencia (migración 0012)."""
+    with SessionLocal() as s: return dict(s.execute(select(RefVersion.tabla, RefVersion.version)).all())
+
+def ref_changes(tabla, desde=None):
+    """Filas de 'tabla' con ref_version > desde (sin 'desde', todas); el último valor de cada fila es su versión."""
+    modelo, cols = REF_TABLAS[tabla]
+    q = select(*cols, modelo.ref_version).order_by(modelo.ref_version)
+    if desde is not None: q = q.where(modelo.ref_version > desde)
+    with SessionLocal() as s: return [tuple(r) for r in s.execute(q)]
+
 def authenticate_user_plain(u, p):
     with SessionLocal() as s: us=s.execute(select(User).where(User.username==u)).scalars().first(); 
-    return {"id":us.id,"username":us.username,"role":us.role} if us and us.active and us.password_hash==p else None
+    if us and us.active and us.password_hash==p:
+        audit.record(audit.LOGIN, "user", us.id, {"username": u}, actor_id=us.id)
+        return {"id":us.id,"username":us.username,"role":us.role}
+    audit.record(audit.LOGIN_FAILED, "user", us.id if us else None, {"username": u}); return None
 def delete_inventory_logical(iid): delete_inventory(iid)
\ No newline at end of file
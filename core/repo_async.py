@@ -0,0 +1,124 @@
+# core/repo_async.py
+"""
+Variante asíncrona de las lecturas de core.repo (SQLAlchemy asyncio + asyncpg).
+
+Ejecuta las mismas sentencias que arma core.repo (_*_stmt) y devuelve las
+mismas filas (core/rows.py), así que las pantallas pueden esperar varias
+consultas a la vez con asyncio.gather sin bloquear la interfaz. Requiere
+asyncpg y un bucle asyncio integrado con Qt (qasync, ver main.py); si falta
+algo, is_enabled() devuelve False y las pantallas usan la API síncrona.
+"""
+import asyncio
+
+from core.rows import InventoryRow, AvailableLot, ClientRow, MeasureRow
+
+try:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    import asyncpg  # noqa: F401  (driver del motor asíncrono)
+    ASYNC_AVAILABLE = True
+except ImportError:
+    ASYNC_AVAILABLE = False
+
+PREPARADAS = 500          # Sentencias preparadas que asyncpg conserva por conexión
+
+_engine = None
+_Session = None
+_report_engine = None      # Lecturas pesadas (historial): db.REPORTS_DATABASE_URL, solo lectura
+_ReportSession = None
+
+
+def _repo():
+    # Se resuelve en cada llamada: los benchmarks reemplazan core.repo en sys.modules
+    import core.repo
+    return core.repo
+
+
+def async_url(url=None):
+    """URL de db.DATABASE_URL con el driver asyncpg."""
+    if url is None:
+        from core.db import DATABASE_URL as url
+    return url.replace("+psycopg2", "+asyncpg", 1) if "+psycopg2" in url else url.replace("postgresql://", "postgresql+asyncpg://", 1)
+
+
+def _con_preparadas(url):
+    """asyncpg prepara en el servidor cada sentencia y las guarda por conexión: caché más amplia."""
+    return url + ("&" if "?" in url else "?") + f"prepared_statement_cache_size={PREPARADAS}"
+
+
+def get_session():
+    global _engine, _Session
+    if _Session is None:
+        _engine = create_async_engine(_con_preparadas(async_url()), pool_size=5, max_overflow=5, pool_pre_ping=True)
+        _Session = async_sessionmaker(_engine, expire_on_commit=False)
+    return _Session()
+
+
+def get_report_session():
+    global _report_engine, _ReportSession
+    if _ReportSession is None:
+        from core.db import REPORTS_DATABASE_URL, REPORTS_TIMEOUT_MS
+        # asyncpg no acepta "options": los parámetros de la sesión van en server_settings
+        _report_engine = create_async_engine(
+            _con_preparadas(async_url(REPORTS_DATABASE_URL)), pool_size=2, max_overflow=2, pool_pre_ping=True,
+            connect_args={"server_settings": {"default_transaction_read_only": "on", "statement_timeout": str(REPORTS_TIMEOUT_MS)}})
+        _ReportSession = async_sessionmaker(_report_engine, expire_on_commit=False)
+    return _ReportSession()
+
+
+def is_enabled():
+    """True si hay motor asíncrono y un bucle asyncio corriendo (qasync)."""
+    if not ASYNC_AVAILABLE: return False
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        try:
+            return asyncio.get_event_loop().is_running()
+        except RuntimeError:
+            return False
+    return True
+
+
+def spawn(coro):
+    """Programa una corrutina en el bucle de Qt y devuelve la tarea."""
+    return asyncio.ensure_future(coro)
+
+
+async def dispose():
+    global _engine, _Session, _report_engine, _ReportSession
+    for e in (_engine, _report_engine):
+        if e is not None: await e.dispose()
+    _engine = _Session = _report_engine = _ReportSession = None
+
+
+async def _fetch(stmt, make, reporte=False, params=None):
+    async with (get_report_session() if reporte else get_session()) as session:
+        return list(map(make, await session.execute(stmt, params)))
+
+
+# ---------- INVENTARIO ----------
+async def list_inventory_rows(mostrar_agotados=False, orden=None):
+    r = _repo()
+    return await _fetch(r._inventory_rows_stmt(mostrar_agotados, tuple(map(tuple, orden or r.INVENTARIO_ORDEN))), InventoryRow._make)
+
+
+async def get_available_inventory():
+    return await _fetch(_repo()._available_inventory_stmt(), AvailableLot._make)
+
+
+_PAGINA = object()   # limit por defecto: repo.HISTORIAL_PAGINA (None = sin límite, como en core.repo)
+
+
+async def list_dispatches_history(search=None, after=None, limit=_PAGINA, orden=None):
+    r = _repo()
+    claves, params = r._dispatches_history_args(search, after, r.HISTORIAL_PAGINA if limit is _PAGINA else limit, orden or r.HISTORIAL_ORDEN)
+    return await _fetch(r._dispatches_history_stmt(*claves), r._dispatch_history_dict, reporte=True, params=params)
+
+
+# ---------- CLIENTES ----------
+async def list_clients(solo_activos=True, search=None, order="name", after=None, limit=None):
+    return await _fetch(_repo()._clients_stmt(solo_activos, search, order, after, limit), ClientRow._make)
+
+
+# ---------- MEDIDAS ----------
+async def get_measures_by_type(ptype):
+    return await _fetch(_repo()._measures_stmt(ptype), MeasureRow._make)
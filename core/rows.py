@@ -0,0 +1,107 @@
+# core/rows.py
+"""
+Filas livianas e inmutables que devuelve core.repo.
+
+Son NamedTuple (sin __dict__ por instancia) con los valores ya convertidos
+(float/int/str) desde la consulta, así que se pueden guardar en Qt.UserRole
+sin arrastrar una sesión de SQLAlchemy ni riesgo de lazy-load.
+"""
+from datetime import date, datetime
+from typing import NamedTuple, Optional
+
+
+class InventoryRow(NamedTuple):
+    id: int
+    sku: Optional[str]
+    nro_lote: str
+    product_name: str
+    quantity: float
+    unit: Optional[str]
+    largo: float
+    ancho: float
+    espesor: float
+    piezas: int
+    quality: Optional[str]
+    prod_date: Optional[date]
+    status: Optional[str]
+    obs: Optional[str]
+    drying: Optional[str]
+    planing: Optional[str]
+    impregnated: Optional[str]
+    factor: int     # Piezas por bulto (product_factors)
+    bultos: int     # Bultos completos, calculados en SQL
+
+    @property
+    def product_type(self):
+        # El tipo de producto es el nombre del producto (Tablas, Paletas, ...)
+        return self.product_name
+
+
+class AvailableLot(NamedTuple):
+    id: int
+    product_id: int
+    sku: Optional[str]
+    nro_lote: Optional[str]
+    product_name: str
+    quantity: float
+    prod_date: Optional[date]
+    quality: Optional[str]
+    status: Optional[str]
+    factor: int
+    bultos: int
+
+    @property
+    def product_type(self):
+        return self.product_name
+
+
+class ClientRow(NamedTuple):
+    id: int
+    name: str
+    document_id: Optional[str]
+    phone: Optional[str]
+    email: Optional[str]
+    address: Optional[str]
+    is_active: bool
+
+
+class MeasureRow(NamedTuple):
+    id: int
+    product_type: str
+    name: Optional[str]
+    largo: float
+    ancho: float
+    espesor: float
+
+
+class StockBalanceRow(NamedTuple):
+    """Existencia a una fecha (stock_as_of). Agrupada por producto: inventory_id/nro_lote/sku en None."""
+    inventory_id: Optional[int]
+    nro_lote: Optional[str]
+    sku: Optional[str]
+    product_name: str
+    quantity: float
+    bultos: int
+
+
+class KardexRow(NamedTuple):
+    id: int
+    performed_at: datetime
+    movement_type: str
+    inventory_id: Optional[int]
+    nro_lote: Optional[str]
+    product_name: str
+    reference: Optional[str]
+    notes: Optional[str]
+    change: float       # Positivo: entrada; negativo: salida
+    saldo: float        # Saldo acumulado del lote (o del producto) después del movimiento
+
+
+class AuditRow(NamedTuple):
+    id: int
+    occurred_at: datetime
+    username: Optional[str]
+    action: str
+    object_type: Optional[str]
+    object_id: Optional[str]
+    details: dict
@@ -0,0 +1,193 @@
+# core/snapshot.py
+"""
+Foto columnar del inventario en memoria.
+
+En vez de guardar una lista de filas (una tupla + N objetos float/str por lote),
+cada campo vive en su propia columna compacta:
+  - números en array('d') / array('q'),
+  - fechas como ordinales en array('l'),
+  - textos repetidos (producto, estado, calidad...) como códigos + tabla de categorías,
+  - textos libres (sku, lote, obs) como listas de cadenas internadas.
+
+Los bultos vienen calculados desde SQL (product_factors); el estado efectivo,
+los filtros y los totales por tipo se calculan sobre las columnas. Si NumPy está instalado se usan vistas sin copia (np.frombuffer) y
+las operaciones son vectorizadas; si no, se recorren los arrays en Python.
+"""
+import sys
+from array import array
+from datetime import date
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Tipos de columna según el nombre del campo de la fila (core/rows.py)
+_FLOAT_FIELDS = {"quantity", "largo", "ancho", "espesor"}
+_INT_FIELDS = {"id", "product_id", "piezas", "factor", "bultos"}
+_DATE_FIELDS = {"prod_date"}
+_CAT_FIELDS = {"product_name", "unit", "quality", "status", "drying", "planing", "impregnated"}
+
+ESTADO_AGOTADO = "AGOTADO"
+ESTADO_BAJA = "BAJA"
+
+
+class _Categorias:
+    """Tabla de valores distintos -> código uint16."""
+    __slots__ = ("valores", "_index", "codigos")
+
+    def __init__(self):
+        self.valores = []
+        self._index = {}
+        self.codigos = array("H")
+
+    def __len__(self):
+        return len(self.codigos)
+
+    def code(self, v):
+        """Código de v, registrándolo como categoría nueva si hace falta."""
+        code = self._index.get(v)
+        if code is None:
+            code = self._index[v] = len(self.valores)
+            self.valores.append(sys.intern(v) if isinstance(v, str) else v)
+        return code
+
+    def append(self, v):
+        self.codigos.append(self.code(v))
+
+    def code_of(self, v):
+        return self._index.get(v)
+
+    def __getitem__(self, i):
+        return self.valores[self.codigos[i]]
+
+
+class InventorySnapshot:
+    """Columnas de un listado de filas (InventoryRow o AvailableLot)."""
+
+    def __init__(self, rows, row_type=None):
+        rows = iter(rows)
+        first = next(rows, None)
+        self.row_type = row_type or (type(first) if first is not None else None)
+        self.fields = self.row_type._fields if self.row_type else ()
+        self._cols = {}
+        for f in self.fields:
+            if f in _FLOAT_FIELDS: self._cols[f] = array("d")
+            elif f in _INT_FIELDS: self._cols[f] = array("q")
+            elif f in _DATE_FIELDS: self._cols[f] = array("l")
+            elif f in _CAT_FIELDS: self._cols[f] = _Categorias()
+            else: self._cols[f] = []
+
+        if first is not None:
+            self._append(first)
+            for r in rows: self._append(r)
+
+        self._n = len(self._cols[self.fields[0]]) if self.fields else 0
+        self._calcular_derivados()
+        self._claves = None  # Claves de búsqueda (se arman al primer filtro)
+
+    def _append(self, r):
+        for f, v in zip(self.fields, r):
+            col = self._cols[f]
+            if f in _DATE_FIELDS: col.append(v.toordinal() if v else 0)
+            elif f in _FLOAT_FIELDS: col.append(v or 0.0)
+            elif f in _INT_FIELDS: col.append(v or 0)
+            elif isinstance(v, str): col.append(sys.intern(v))
+            else: col.append(v)
+
+    # ---------- Columnas derivadas ----------
+    def _calcular_derivados(self):
+        estados = self._cols.get("status")
+        qty = self._cols.get("quantity", array("d"))
+        cod_baja = estados.code_of(ESTADO_BAJA) if estados is not None else None
+        cod_agotado = estados.code(ESTADO_AGOTADO) if estados is not None else None
+
+        self._bultos = self.col("bultos") if "bultos" in self._cols else array("q", [0] * self._n)
+        if estados is None: return
+        if NUMPY_AVAILABLE and self._n:
+            q = self.col("quantity")
+            st = self.col("status").copy()
+            agotar = q == 0
+            if cod_baja is not None: agotar &= st != cod_baja
+            st[agotar] = cod_agotado
+            self._estado = st
+        else:
+            self._estado = array("H", (cod_agotado if x == 0 and c != cod_baja else c
+                                       for x, c in zip(qty, estados.codigos)))
+
+    # ---------- Acceso ----------
+    def __len__(self):
+        return self._n
+
+    def col(self, field):
+        """Columna cruda (vista NumPy si está disponible). Categóricas -> códigos."""
+        c = self._cols[field]
+        raw = c.codigos if isinstance(c, _Categorias) else c
+        if NUMPY_AVAILABLE and isinstance(raw, array):
+            return np.frombuffer(raw, dtype={"d": np.float64, "q": np.int64, "l": np.dtype("l"), "H": np.uint16}[raw.typecode])
+        return raw
+
+    def value(self, field, i):
+        c = self._cols[field]
+        if field in _DATE_FIELDS:
+            return date.fromordinal(c[i]) if c[i] else None
+        return c[i]
+
+    def row(self, i):
+        """Reconstruye la fila i con su tipo original (para diálogos y Qt.UserRole)."""
+        return self.row_type(*(self.value(f, i) for f in self.fields))
+
+    def bultos(self, i):
+        return int(self._bultos[i])
+
+    def estado(self, i):
+        """Estado efectivo: sin stock y no dado de baja -> AGOTADO."""
+        return self._cols["status"].valores[self._estado[i]]
+
+    # ---------- Filtros ----------
+    def filtrar(self, texto, campos=("sku", "nro_lote", "product_name")):
+        """Índices cuyas columnas de texto contienen 'texto' (sin distinguir mayúsculas)."""
+        t = (texto or "").lower()
+        if not t: return range(self._n)
+        if self._claves is None:
+            partes = [self._cols[f] for f in campos if f in self._cols]
+            self._claves = ["\x1f".join(str(p[i] or "") for p in partes).lower() for i in range(self._n)]
+        return [i for i, k in enumerate(self._claves) if t in k]
+
+    # ---------- Totales ----------
+    def _seleccion(self, indices):
+        if indices is None or (isinstance(indices, range) and len(indices) == self._n):
+            return None
+        return np.asarray(indices, dtype=np.int64) if NUMPY_AVAILABLE else indices
+
+    def resumen(self, indices=None):
+        """{'lotes', 'piezas', 'bultos'} del total o de los índices dados."""
+        sel = self._seleccion(indices)
+        if NUMPY_AVAILABLE and self._n:
+            q = self.col("quantity"); b = self._bultos
+            if sel is not None: q = q[sel]; b = b[sel]
+            return {"lotes": int(q.size), "piezas": float(q.sum()), "bultos": int(b.sum())}
+        q = self._cols.get("quantity", array("d"))
+        idx = range(self._n) if sel is None else sel
+        return {"lotes": len(idx), "piezas": float(sum(q[i] for i in idx)), "bultos": int(sum(self._bultos[i] for i in idx))}
+
+    def por_tipo(self, indices=None):
+        """{tipo: {'lotes', 'piezas', 'bultos'}} agrupando por producto."""
+        tipos = self._cols.get("product_name")
+        if tipos is None or not self._n: return {}
+        sel = self._seleccion(indices)
+        n_cat = len(tipos.valores)
+        if NUMPY_AVAILABLE:
+            cod = self.col("product_name").astype(np.int64); q = self.col("quantity"); b = self._bultos
+            if sel is not None: cod = cod[sel]; q = q[sel]; b = b[sel]
+            lotes = np.bincount(cod, minlength=n_cat)
+            piezas = np.bincount(cod, weights=q, minlength=n_cat)
+            bultos = np.bincount(cod, weights=b, minlength=n_cat)
+        else:
+            lotes = [0] * n_cat; piezas = [0.0] * n_cat; bultos = [0] * n_cat
+            q = self._cols["quantity"]
+            for i in (range(self._n) if sel is None else sel):
+                c = tipos.codigos[i]; lotes[c] += 1; piezas[c] += q[i]; bultos[c] += self._bultos[i]
+        return {tipos.valores[c]: {"lotes": int(lotes[c]), "piezas": float(piezas[c]), "bultos": int(bultos[c])}
+                for c in range(n_cat) if lotes[c]}
@@ -1,16 +1,30 @@
 import sys
-from PySide6 import QtWidgets
+import asyncio
+from PySide6 import QtWidgets, QtCore
 from screens.login import LoginScreen
 from screens.main_screen import MainScreen
 import core.repo as repo
+from core import partitions, audit, prefetch
 from core.theme import ThemeManager
 
+# Bucle asyncio integrado con Qt: permite que las pantallas esperen consultas de core.repo_async
+try:
+    import qasync
+    QASYNC_AVAILABLE = True
+except ImportError:
+    QASYNC_AVAILABLE = False
+
 def main():
     app = QtWidgets.QApplication(sys.argv)
 
     # Aplicar tema desde el inicio (unificado)
     ThemeManager(app)
 
+    cfg = QtCore.QSettings("TrabajoDeGradoSistemas", "OpenCode")
+
+    # Escribir los eventos de auditoría pendientes antes de salir
+    app.aboutToQuit.connect(audit.flush)
+
     # Crear la pantalla de login
     login = LoginScreen()
     w = None
@@ -20,8 +34,12 @@ def main():
         Handler llamado cuando LoginScreen emite success_signal con el usuario autenticado.
         """
         nonlocal w
+        audit.set_actor(user.get("id"))
+        # La precarga (migraciones incluidas) empezó con el login visible; normalmente ya terminó
+        prefetch.wait(3)
         # Crear la ventana principal pasando el usuario actual
         w = MainScreen(current_user=user)
+        prefetch.clear()
         
         # NOTA: MainScreen ya carga los datos automáticamente al iniciar
         # (en su constructor llama a _navigate(0) -> refresh()), 
@@ -33,9 +51,29 @@ def main():
     # Conectar la señal de login exitoso
     login.success_signal.connect(on_success)
 
-    # Mostrar login
+    # Fotos de existencias para el stock a una fecha y, después (para que ya estén tomadas antes de
+    # archivar), particiones mensuales del historial: crear las próximas y archivar las vencidas
+    intervalo = cfg.value("maintenance/snapshot_interval", "monthly")
+    retener = int(cfg.value("maintenance/retain_months", 0))
+    carpeta_archivo = cfg.value("maintenance/archive_dir", "") or None
+    mantenimiento = [
+        ("fotos de existencias", lambda: repo.ensure_stock_snapshots(intervalo)),
+        ("mantenimiento de particiones", lambda: partitions.maintain(retener_meses=retener, carpeta_archivo=carpeta_archivo)),
+    ]
+
+    # Mostrar login y, mientras el usuario escribe, abrir conexiones, aplicar las migraciones,
+    # precargar la primera pantalla y después correr el mantenimiento (todo en segundo plano)
     login.show()
+    prefetch.start(mantenimiento)
 
+    if QASYNC_AVAILABLE:
+        loop = qasync.QEventLoop(app)
+        asyncio.set_event_loop(loop)
+        app_close = asyncio.Event()
+        app.aboutToQuit.connect(app_close.set)
+        with loop:
+            loop.run_until_complete(app_close.wait())
+        sys.exit(0)
     sys.exit(app.exec())
 
 if __name__ == "__main__":
@@ -0,0 +1,108 @@
+from PySide6 import QtCore, QtWidgets
+from datetime import date, timedelta
+import json
+from core import repo, theme, audit
+
+
+class AuditoriaScreen(QtWidgets.QWidget):
+    """Visor de la bitácora de auditoría (audit_logs), filtrable y paginado."""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._filtros = None; self._cursor = None
+        self._setup_ui()
+
+    def _setup_ui(self):
+        layout = QtWidgets.QVBoxLayout(self)
+        t = QtWidgets.QLabel("AUDITORÍA")
+        t.setStyleSheet(f"font-size: 18pt; font-weight: bold; color: {theme.ACCENT_COLOR}; margin-bottom: 10px;")
+        t.setAlignment(QtCore.Qt.AlignCenter)
+        layout.addWidget(t)
+
+        h = QtWidgets.QHBoxLayout(); h.setSpacing(10)
+        self.d1 = QtWidgets.QDateEdit(date.today() - timedelta(days=7)); self.d1.setCalendarPopup(True)
+        self.d2 = QtWidgets.QDateEdit(date.today()); self.d2.setCalendarPopup(True)
+        self.cb_accion = QtWidgets.QComboBox(); self.cb_accion.addItem("Todas las acciones", None)
+        for a in audit.ACCIONES: self.cb_accion.addItem(a, a)
+        self.txt_usuario = QtWidgets.QLineEdit(); self.txt_usuario.setPlaceholderText("Usuario")
+        self.txt_detalle = QtWidgets.QLineEdit(); self.txt_detalle.setPlaceholderText("Detalle: clave=valor (ej. nro_lote=120)")
+        for w in [self.d1, self.d2, self.cb_accion, self.txt_usuario, self.txt_detalle]: self._estilizar_input(w)
+        self.txt_detalle.returnPressed.connect(self.refresh); self.txt_usuario.returnPressed.connect(self.refresh)
+
+        btn = QtWidgets.QPushButton("🔍 Buscar"); btn.clicked.connect(self.refresh)
+        btn.setStyleSheet(f"background-color: {theme.BTN_PRIMARY}; font-weight: bold; padding: 6px 15px; border-radius: 4px; color: white;")
+
+        h.addWidget(QtWidgets.QLabel("Desde:")); h.addWidget(self.d1)
+        h.addWidget(QtWidgets.QLabel("Hasta:")); h.addWidget(self.d2)
+        h.addWidget(self.cb_accion); h.addWidget(self.txt_usuario); h.addWidget(self.txt_detalle, 1); h.addWidget(btn)
+        layout.addLayout(h)
+
+        self.table = QtWidgets.QTableWidget()
+        self.table.setColumnCount(6); self.table.setHorizontalHeaderLabels(["Fecha", "Usuario", "Acción", "Objeto", "ID", "Detalle"])
+        self.table.setStyleSheet(f"QTableWidget {{ background-color: {theme.BG_SIDEBAR}; color: {theme.TEXT_PRIMARY}; gridline-color: {theme.BORDER_COLOR}; }} QHeaderView::section {{ background-color: #1b1b26; color: {theme.TEXT_SECONDARY}; padding: 8px; font-weight: bold; }}")
+        self.table.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.verticalHeader().setVisible(False); self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.table.cellDoubleClicked.connect(self._ver_detalle)
+        # Al llegar al final se trae la página siguiente
+        self.table.verticalScrollBar().valueChanged.connect(lambda v: v == self.table.verticalScrollBar().maximum() and self._mas())
+        layout.addWidget(self.table)
+
+        f = QtWidgets.QHBoxLayout()
+        self.lbl_info = QtWidgets.QLabel(""); self.lbl_info.setStyleSheet(f"color: {theme.TEXT_SECONDARY};")
+        self.btn_mas = QtWidgets.QPushButton("Cargar más"); self.btn_mas.clicked.connect(self._mas); self.btn_mas.setEnabled(False)
+        self.btn_mas.setStyleSheet("background-color: #444; color: white; padding: 6px 12px; border-radius: 4px;")
+        f.addWidget(self.lbl_info); f.addStretch(); f.addWidget(self.btn_mas)
+        layout.addLayout(f)
+
+    def _estilizar_input(self, widget):
+        widget.setStyleSheet(f"background-color: {theme.BG_INPUT}; color: white; padding: 5px; border: 1px solid {theme.BORDER_COLOR}; border-radius: 4px; min-width: 100px;")
+
+    def _detalle(self):
+        """'clave=valor, clave2=valor2' -> dict para filtrar details con @>."""
+        res = {}
+        for par in self.txt_detalle.text().split(","):
+            if "=" not in par: continue
+            k, v = (x.strip() for x in par.split("=", 1))
+            if not k: continue
+            # Los *_id se guardan como números; lotes, guías y demás como texto
+            try: res[k] = json.loads(v) if k.endswith("_id") or v in ("true", "false") else v
+            except ValueError: res[k] = v
+        return res or None
+
+    def refresh(self):
+        d1, d2 = self.d1.date().toPython(), self.d2.date().toPython()
+        if d1 > d2:
+            QtWidgets.QMessageBox.warning(self, "Error", "La fecha inicial no puede ser mayor a la final.")
+            return
+        self._filtros = dict(desde=d1, hasta=d2, action=self.cb_accion.currentData(),
+                             username=self.txt_usuario.text().strip() or None, detalle=self._detalle())
+        self._cursor = None
+        self.table.setRowCount(0)
+        self._pagina()
+
+    def _mas(self):
+        if self._filtros and self._cursor is not None: self._pagina()
+
+    def _pagina(self):
+        try:
+            filas, self._cursor = repo.list_audit_logs(**self._filtros, cursor=self._cursor)
+        except Exception as e:
+            self._cursor = None
+            QtWidgets.QMessageBox.critical(self, "Error", str(e)); return
+        t = self.table
+        t.setUpdatesEnabled(False)
+        for r in filas:
+            row = t.rowCount(); t.insertRow(row)
+            valores = [r.occurred_at.astimezone().strftime("%Y-%m-%d %H:%M:%S"), r.username or "-", r.action,
+                       r.object_type or "", r.object_id or "", json.dumps(r.details, ensure_ascii=False)]
+            for c, v in enumerate(valores): t.setItem(row, c, QtWidgets.QTableWidgetItem(v))
+            t.item(row, 0).setData(QtCore.Qt.UserRole, r)
+        t.setUpdatesEnabled(True)
+        self.btn_mas.setEnabled(self._cursor is not None)
+        self.lbl_info.setText(f"{t.rowCount()} eventos" + (" (hay más)" if self._cursor is not None else ""))
+
+    def _ver_detalle(self, row, _col):
+        r = self.table.item(row, 0).data(QtCore.Qt.UserRole)
+        QtWidgets.QMessageBox.information(self, f"{r.action} - {r.object_type or ''} {r.object_id or ''}",
+                                          json.dumps(r.details, ensure_ascii=False, indent=2))
@@ -1,5 +1,6 @@
 from PySide6 import QtCore, QtWidgets, QtGui
-from core import repo, theme
+from core import repo, prefetch, theme, client_index
+from screens.orden_tabla import OrdenColumnas
 import re
 import os
 from datetime import datetime
@@ -205,9 +206,125 @@ class ClienteDialog(QtWidgets.QDialog):
         }
 
 
+class ClienteCombo(QtWidgets.QComboBox):
+    """
+    Combo editable de clientes activos. Muestra la primera página y, al escribir,
+    busca en el servidor (por prefijo de nombre o documento) tras una pausa corta.
+    """
+    LIMITE = 50
+
+    def __init__(self, texto_todos=None, parent=None):
+        super().__init__(parent)
+        self.texto_todos = texto_todos   # Primera opción sin cliente ("Todos"), si se indica
+        self.setEditable(True)
+        self.setInsertPolicy(QtWidgets.QComboBox.NoInsert)
+        self.completer().setCompletionMode(QtWidgets.QCompleter.PopupCompletion)
+        self._timer = QtCore.QTimer(self); self._timer.setSingleShot(True); self._timer.setInterval(250)
+        self._timer.timeout.connect(self._buscar)
+        self.lineEdit().textEdited.connect(lambda _: self._timer.start())
+
+    def set_clients(self, clients):
+        self.blockSignals(True)
+        self.clear()
+        if self.texto_todos: self.addItem(self.texto_todos, None)
+        if not clients and not self.texto_todos: self.addItem("-- Sin Clientes Registrados --", None)
+        for c in clients: self.addItem(f"{c.name} ({c.document_id})" if c.document_id else c.name, c.id)
+        self.blockSignals(False)
+
+    def cargar(self):
+        """Primera página de clientes activos (sin texto de búsqueda)."""
+        self.set_clients(repo.list_clients(solo_activos=True, limit=self.LIMITE))
+
+    def _buscar(self):
+        texto = self.lineEdit().text().strip()
+        if self.currentIndex() >= 0 and texto == self.itemText(self.currentIndex()): return
+        try:
+            clientes = repo.list_clients(solo_activos=True, search=texto or None, limit=self.LIMITE)
+        except Exception:
+            return
+        self.set_clients(clientes)
+        self.setCurrentIndex(-1); self.lineEdit().setText(texto)
+        if clientes: self.showPopup()
+
+    def client_id(self):
+        """Id del cliente elegido, o None si el texto no corresponde a una opción de la lista."""
+        i = self.findText(self.currentText(), QtCore.Qt.MatchExactly)
+        return self.itemData(i) if i >= 0 else None
+
+    def es_todos(self):
+        """True solo si está elegida la opción "Todos" (sin filtro de cliente)."""
+        return bool(self.texto_todos) and self.currentText() == self.texto_todos
+
+
+class ClientePicker(QtWidgets.QLineEdit):
+    """
+    Selector de cliente con autocompletado. Cada tecla busca en el índice en memoria
+    (core.client_index); si el índice no está cargado o no encuentra nada, se
+    consulta al servidor tras una pausa corta.
+    """
+    LIMITE = 20
+    cliente_elegido = QtCore.Signal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.indice = client_index.shared()
+        self._elegido = None
+        self.setPlaceholderText("Escriba nombre o RIF/cédula...")
+        self._modelo = QtGui.QStandardItemModel(self)
+        comp = QtWidgets.QCompleter(self._modelo, self)
+        comp.setCompletionMode(QtWidgets.QCompleter.UnfilteredPopupCompletion)
+        comp.setMaxVisibleItems(12)
+        comp.activated[QtCore.QModelIndex].connect(lambda i: self.set_client(i.data(QtCore.Qt.UserRole)))
+        self.setCompleter(comp)
+        self._timer = QtCore.QTimer(self); self._timer.setSingleShot(True); self._timer.setInterval(300)
+        self._timer.timeout.connect(self._buscar_servidor)
+        self.textEdited.connect(self._buscar)
+
+    @staticmethod
+    def _texto(c):
+        return f"{c.name} ({c.document_id})" if c.document_id else c.name
+
+    def _mostrar(self, clientes):
+        self._modelo.clear()
+        for c in clientes:
+            it = QtGui.QStandardItem(self._texto(c)); it.setData(c, QtCore.Qt.UserRole)
+            self._modelo.appendRow(it)
+        if clientes: self.completer().complete()
+
+    def _buscar(self, texto):
+        self._elegido = None
+        res = self.indice.search(texto, self.LIMITE) if self.indice.cargado else []
+        self._mostrar(res)
+        if texto.strip() and not res: self._timer.start()
+        else: self._timer.stop()
+
+    def _buscar_servidor(self):
+        try:
+            self._mostrar(repo.list_clients(solo_activos=True, search=self.text().strip(), limit=self.LIMITE))
+        except Exception:
+            pass
+
+    def set_client(self, c):
+        self._elegido = c
+        self.setText(self._texto(c) if c else "")
+        self.cliente_elegido.emit(c)
+
+    def client_id(self):
+        """Id del cliente elegido, o None si el texto se modificó después de elegirlo."""
+        return self._elegido.id if self._elegido and self.text() == self._texto(self._elegido) else None
+
+    def refresh(self):
+        """Trae al índice los clientes nuevos o modificados (la primera vez, todos) sin esperar al servidor."""
+        try:
+            self.indice.refresh_background()
+        except Exception as e:
+            print(f"Advertencia: índice de clientes: {e}")
+
+
 class ClientesScreen(QtWidgets.QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
+        self._ultimo = None; self._hay_mas = False
         self._setup_ui()
         self.refresh()
 
@@ -238,6 +355,19 @@ class ClientesScreen(QtWidgets.QWidget):
         header.addWidget(btn_nuevo)
         layout.addLayout(header)
 
+        # --- Búsqueda y orden (en el servidor, por páginas) ---
+        search_layout = QtWidgets.QHBoxLayout()
+        self.txt_buscar = QtWidgets.QLineEdit(); self.txt_buscar.setPlaceholderText("🔍 Buscar por nombre o documento...")
+        self.cb_orden = QtWidgets.QComboBox(); self.cb_orden.addItem("Ordenar por Nombre", "name"); self.cb_orden.addItem("Ordenar por Documento", "document_id")
+        for w in [self.txt_buscar, self.cb_orden]:
+            w.setStyleSheet(f"background-color: {theme.BG_INPUT}; color: white; padding: 6px; border: 1px solid {theme.BORDER_COLOR}; border-radius: 4px;")
+        self._timer_buscar = QtCore.QTimer(self); self._timer_buscar.setSingleShot(True); self._timer_buscar.setInterval(300)
+        self._timer_buscar.timeout.connect(self.refresh)
+        self.txt_buscar.textChanged.connect(lambda _: self._timer_buscar.start())
+        self.cb_orden.currentIndexChanged.connect(self._orden_combo)
+        search_layout.addWidget(self.txt_buscar, 1); search_layout.addWidget(self.cb_orden)
+        layout.addLayout(search_layout)
+
         # --- Barra de Acciones ---
         actions_layout = QtWidgets.QHBoxLayout()
         btn_edit = QtWidgets.QPushButton("✎ Editar Seleccionado")
@@ -277,15 +407,43 @@ class ClientesScreen(QtWidgets.QWidget):
         self.table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
         self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
         self.table.itemSelectionChanged.connect(self._update_buttons)
+        # Clic en el encabezado: orden en el servidor (Shift+clic agrega un criterio)
+        self._orden = OrdenColumnas(self.table, {1: "name", 2: "document_id", 3: "phone", 4: "email", 5: "is_active"}, (("name", False),))
+        self._orden.cambio.connect(lambda _: self.refresh())
+        # Al llegar al final se pide la página siguiente
+        self.table.verticalScrollBar().valueChanged.connect(lambda v: v == self.table.verticalScrollBar().maximum() and self._cargar_pagina())
         layout.addWidget(self.table)
+
+        self.lbl_total = QtWidgets.QLabel("")
+        self.lbl_total.setStyleSheet(f"color: {theme.TEXT_SECONDARY};")
+        layout.addWidget(self.lbl_total)
         
         self._update_buttons()
 
     def refresh(self):
         self.table.setRowCount(0)
+        self._ultimo = None; self._hay_mas = True
+        self._cargar_pagina()
+
+    def _orden_combo(self):
+        self._orden.set_orden(((self.cb_orden.currentData(), False),))
+        self.refresh()
+
+    def _cargar_pagina(self):
+        """Agrega la página siguiente. Devuelve False si no se pudo cargar."""
+        if not self._hay_mas: return True
         ver_todos = self.chk_ver_inactivos.isChecked()
+        texto = self.txt_buscar.text().strip() or None
+        orden = self._orden.orden
         try:
-            clientes = repo.list_clients(solo_activos=not ver_todos)
+            # Primera página por defecto: ya precargada durante el login
+            inicial = self._ultimo is None and not ver_todos and not texto and self._orden.es_defecto
+            clientes = prefetch.get("clients_active") if inicial else None
+            if clientes is None:
+                clientes = repo.list_clients(solo_activos=not ver_todos, search=texto, order=orden, after=self._ultimo, limit=repo.CLIENTES_PAGINA)
+            self._hay_mas = len(clientes) == repo.CLIENTES_PAGINA
+            if clientes: self._ultimo = clientes[-1]
+            self.lbl_total.setText(f"{self.table.rowCount() + len(clientes)} clientes" + (" (desplace para ver más)" if self._hay_mas else ""))
             
             for c in clientes:
                 r = self.table.rowCount()
@@ -302,7 +460,12 @@ class ClientesScreen(QtWidgets.QWidget):
                     if i == 0: it.setData(QtCore.Qt.UserRole, c)
                     self.table.setItem(r, i, it)
                     
-        except Exception as e: print(f"Error clientes: {e}")
+        except Exception as e:
+            # Sin esto, el scroll y la exportación volverían a pedir la misma página sin fin
+            self._hay_mas = False
+            print(f"Error clientes: {e}")
+            return False
+        return True
 
     def _get_selected_client(self):
         row = self.table.currentRow()
@@ -376,6 +539,12 @@ class ClientesScreen(QtWidgets.QWidget):
         path, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Exportar Clientes", "clientes.xlsx", "Excel (*.xlsx)")
         if not path: return
 
+        # Se exporta la lista completa (con el filtro actual), no solo las páginas cargadas
+        while self._hay_mas:
+            if not self._cargar_pagina():
+                QtWidgets.QMessageBox.critical(self, "Error", "No se pudo cargar la lista completa de clientes. Intente de nuevo.")
+                return
+
         try:
             wb = openpyxl.Workbook(); ws = wb.active; ws.title = "Cartera Clientes"
             
@@ -0,0 +1,78 @@
+from PySide6 import QtCore, QtWidgets
+from core import offline, theme
+
+
+def _resumen(kind, p):
+    if kind == offline.REGISTRO:
+        return f"Registro · Lote {p.get('nro_lote')} · {p.get('name')} · {float(p.get('quantity') or 0):.0f} pzas"
+    return f"Despacho · Guía {p.get('guide')} · Lote #{p.get('inventory_id')} · {float(p.get('quantity') or 0):.0f} pzas"
+
+
+class ColaDialog(QtWidgets.QDialog):
+    """Pedidos de la cola local que el servidor rechazó (core.offline): reintentar o descartar."""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Operaciones sin sincronizar")
+        self.resize(850, 400)
+        self.setStyleSheet(f"background-color: {theme.BG_SIDEBAR}; color: white;")
+        self._build_ui()
+        self._load()
+
+    def _build_ui(self):
+        layout = QtWidgets.QVBoxLayout(self)
+        self.lbl = QtWidgets.QLabel()
+        self.lbl.setWordWrap(True)
+        layout.addWidget(self.lbl)
+
+        self.table = QtWidgets.QTableWidget()
+        self.table.setColumnCount(3)
+        self.table.setHorizontalHeaderLabels(["Fecha", "Operación", "Motivo"])
+        self.table.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Stretch)
+        self.table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.table.setStyleSheet(f"background-color: {theme.BG_INPUT}; alternate-background-color: {theme.BG_SIDEBAR};")
+        layout.addWidget(self.table)
+
+        h = QtWidgets.QHBoxLayout()
+        btn_re = QtWidgets.QPushButton("🔄 Reintentar")
+        btn_re.setStyleSheet(f"background-color: {theme.BTN_PRIMARY}; padding: 8px; font-weight: bold;")
+        btn_re.clicked.connect(self._reintentar)
+        btn_de = QtWidgets.QPushButton("🗑 Descartar")
+        btn_de.setStyleSheet(f"background-color: {theme.BTN_DANGER}; padding: 8px; font-weight: bold;")
+        btn_de.clicked.connect(self._descartar)
+        btn_ok = QtWidgets.QPushButton("Cerrar"); btn_ok.clicked.connect(self.accept)
+        h.addWidget(btn_re); h.addWidget(btn_de); h.addStretch(); h.addWidget(btn_ok)
+        layout.addLayout(h)
+
+    def _load(self):
+        j = offline.journal()
+        n = j.counts().get(offline.PENDIENTE, 0)
+        err = offline.synchronizer().ultimo_error
+        self.lbl.setText(f"⏳ Pendientes de enviar: {n}" + (f"\n✖ Servidor no disponible: {err}" if err and n else ""))
+        self.table.setRowCount(0)
+        for key, kind, payload, creado, motivo in j.conflicts():
+            r = self.table.rowCount(); self.table.insertRow(r)
+            for i, v in enumerate([creado, _resumen(kind, payload), motivo or ""]):
+                item = QtWidgets.QTableWidgetItem(str(v))
+                if i == 0: item.setData(QtCore.Qt.UserRole, key)
+                self.table.setItem(r, i, item)
+
+    def _seleccion(self):
+        row = self.table.currentRow()
+        return self.table.item(row, 0).data(QtCore.Qt.UserRole) if row >= 0 else None
+
+    def _reintentar(self):
+        key = self._seleccion()
+        if not key: return
+        offline.journal().retry(key)
+        offline.synchronizer().wake()
+        self._load()
+
+    def _descartar(self):
+        key = self._seleccion()
+        if not key: return
+        if QtWidgets.QMessageBox.question(self, "Descartar", "¿Descartar esta operación? No se aplicará en el servidor.",
+                                          QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No) != QtWidgets.QMessageBox.Yes:
+            return
+        offline.journal().discard(key)
+        self._load()
@@ -1,19 +1,15 @@
 from PySide6 import QtCore, QtWidgets, QtGui
 from datetime import date
-from core import repo, theme
-
-# Factores de conversión
-FACTORES_CONVERSION = {
-    "Tablas": 30,
-    "Tablones": 20,
-    "Paletas": 10,
-    "Machihembrado": 5
-}
+from core import repo, repo_async, prefetch, theme, offline
+from screens.clientes import ClientePicker
+from core.rows import AvailableLot
+from core.snapshot import InventorySnapshot
 
 class DespachoScreen(QtWidgets.QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.selected_inventory = None
+        self._lotes = None  # Lotes disponibles precargados para el selector
         self._setup_ui()
 
     def _setup_ui(self):
@@ -31,7 +27,7 @@ class DespachoScreen(QtWidgets.QWidget):
         form_layout.setContentsMargins(20, 20, 20, 20)
         form_layout.setSpacing(15)
 
-        self.cb_client = QtWidgets.QComboBox()
+        self.cb_client = ClientePicker()
         self.cb_client.setStyleSheet(f"background-color: {theme.BG_INPUT}; color: white; padding: 5px;")
         form_layout.addRow("Cliente / Destino:", self.cb_client)
 
@@ -83,17 +79,23 @@ class DespachoScreen(QtWidgets.QWidget):
         self.refresh_clients()
 
     def refresh_clients(self):
-        self.cb_client.clear()
+        # El índice del selector solo incorpora los clientes creados o modificados desde la última vez
+        self.cb_client.refresh()
+        lotes = prefetch.get("available_lots")
+        if lotes is not None:
+            self._lotes = lotes
+        elif repo_async.is_enabled():
+            # Los lotes disponibles quedan listos para el selector de producto
+            repo_async.spawn(self._refresh_async())
+
+    async def _refresh_async(self):
         try:
-            clients = repo.list_clients(solo_activos=True)
-            if not clients:
-                self.cb_client.addItem("-- Sin Clientes Registrados --", None)
-            else:
-                for c in clients: self.cb_client.addItem(c.name, c.id)
-        except: pass
+            self._lotes = await repo_async.get_available_inventory()
+        except Exception:
+            self._lotes = None
 
     def _open_product_selector(self):
-        dialog = ProductSelectorDialog(self)
+        dialog = ProductSelectorDialog(self, lotes=self._lotes)
         if dialog.exec_() == QtWidgets.QDialog.Accepted:
             self.selected_inventory = dialog.selected_data
             self._update_ui_with_product()
@@ -102,10 +104,8 @@ class DespachoScreen(QtWidgets.QWidget):
         if not self.selected_inventory: return
         
         inv = self.selected_inventory
-        p_name = getattr(inv, 'product_name', 'Producto')
-        
-        factor = FACTORES_CONVERSION.get(p_name, 1)
-        bultos_disponibles = float(inv.quantity) / factor
+        p_name = inv.product_name
+        bultos_disponibles = inv.bultos  # Calculado en SQL con product_factors
         
         # Formatear fecha de producción para mostrar
         f_prod = "Sin Fecha"
@@ -131,7 +131,7 @@ class DespachoScreen(QtWidgets.QWidget):
             return
         
         # 2. Validar Cliente
-        client_id = self.cb_client.currentData()
+        client_id = self.cb_client.client_id()
         if not client_id:
             QtWidgets.QMessageBox.warning(self, "Error", "Seleccione un Cliente válido.")
             self.cb_client.setFocus()
@@ -167,10 +167,9 @@ class DespachoScreen(QtWidgets.QWidget):
                 return
 
         # --- Confirmación ---
-        prod_type = getattr(self.selected_inventory, 'product_name', '')
-        factor = FACTORES_CONVERSION.get(prod_type, 1)
-        piezas_out = bultos_out * factor
-        client_name = self.cb_client.currentText()
+        prod_type = self.selected_inventory.product_name
+        piezas_out = bultos_out * self.selected_inventory.factor
+        client_name = self.cb_client.text()
 
         confirm = QtWidgets.QMessageBox.question(
             self, "Confirmar Despacho",
@@ -192,7 +191,9 @@ class DespachoScreen(QtWidgets.QWidget):
                     "guide": nro_guia,
                     "obs": f"Salida de {bultos_out} bultos"
                 }
-                repo.create_dispatch(data)
+                # Cola local (core.offline): si al sincronizar falta stock, queda como operación rechazada
+                offline.enqueue(offline.DESPACHO, data)
+                self._lotes = None  # La existencia cambió: el selector vuelve a consultar
                 
                 QtWidgets.QMessageBox.information(self, "Éxito", "Despacho registrado correctamente.")
                 
@@ -208,14 +209,14 @@ class DespachoScreen(QtWidgets.QWidget):
                 QtWidgets.QMessageBox.critical(self, "Error", str(e))
 
 class ProductSelectorDialog(QtWidgets.QDialog):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, lotes=None):
         super().__init__(parent)
         self.setWindowTitle("Seleccionar Lote Disponible")
         self.resize(800, 450)
         self.setStyleSheet(f"background-color: {theme.BG_SIDEBAR}; color: white;")
         self.selected_data = None
         self._build_ui()
-        self._load_data()
+        self._load_data(lotes)
 
     def _build_ui(self):
         layout = QtWidgets.QVBoxLayout(self)
@@ -242,47 +243,38 @@ class ProductSelectorDialog(QtWidgets.QDialog):
         btn.clicked.connect(self._select)
         layout.addWidget(btn)
 
-    def _load_data(self):
-        self.inventory_items = repo.get_available_inventory()
-        self._populate(self.inventory_items)
+    def _load_data(self, lotes=None):
+        self.snapshot = InventorySnapshot(repo.get_available_inventory() if lotes is None else lotes, AvailableLot)
+        self._populate()
 
-    def _populate(self, data):
+    def _populate(self, indices=None):
+        snap = self.snapshot
+        if indices is None: indices = range(len(snap))
         self.table.setRowCount(0)
-        for inv in data:
+        for idx in indices:
             r = self.table.rowCount()
             self.table.insertRow(r)
-            
-            p_name = getattr(inv, 'product_name', '---')
-            factor = FACTORES_CONVERSION.get(p_name, 1)
-            bultos = float(inv.quantity) / factor
+            inv = snap.row(idx)
 
             vals = [
-                p_name,
+                inv.product_name,
                 inv.nro_lote or "-", 
                 inv.sku, 
                 f"{inv.quantity:.0f}", 
-                f"{int(bultos)}", 
+                f"{snap.bultos(idx)}", 
                 str(inv.prod_date) # Ya muestra la fecha aquí
             ]
             
             for i, v in enumerate(vals):
                 item = QtWidgets.QTableWidgetItem(str(v))
-                if i == 0: item.setData(QtCore.Qt.UserRole, inv)
+                if i == 0: item.setData(QtCore.Qt.UserRole, idx)
                 self.table.setItem(r, i, item)
 
     def _filter(self, text):
-        text = text.lower()
-        filtered = []
-        for inv in self.inventory_items:
-            p_name = getattr(inv, 'product_name', '').lower()
-            sku = (inv.sku or '').lower()
-            lote = (inv.nro_lote or '').lower()
-            if text in p_name or text in sku or text in lote:
-                filtered.append(inv)
-        self._populate(filtered)
+        self._populate(self.snapshot.filtrar(text))
 
     def _select(self):
         row = self.table.currentRow()
         if row >= 0:
-            self.selected_data = self.table.item(row, 0).data(QtCore.Qt.UserRole)
+            self.selected_data = self.snapshot.row(self.table.item(row, 0).data(QtCore.Qt.UserRole))
             self.accept()
\ No newline at end of file
@@ -1,18 +1,17 @@
 import os
+import asyncio
 from PySide6 import QtCore, QtWidgets, QtGui
-from core import repo, theme
+from core import repo, repo_async, prefetch, theme
+from core.snapshot import InventorySnapshot
+from screens.orden_tabla import OrdenColumnas
 from datetime import datetime
 
-FACTORES_CONVERSION = {
-    "Tablas": 30, "Tablones": 20, "Paletas": 10, "Machihembrado": 5
-}
-
 class EditarProductoDialog(QtWidgets.QDialog):
     def __init__(self, data, parent=None):
         super().__init__(parent)
         self.data = data
         self.recover_status = None # Control de recuperación
-        self.setWindowTitle(f"Visualizar Lote {data.get('nro_lote', '')}")
+        self.setWindowTitle(f"Visualizar Lote {data.nro_lote}")
         self.setModal(True); self.resize(500, 650)
         self.setStyleSheet(f"background-color: {theme.BG_SIDEBAR}; color: {theme.TEXT_PRIMARY};")
         self._build_ui()
@@ -31,29 +30,29 @@ class EditarProductoDialog(QtWidgets.QDialog):
         content = QtWidgets.QWidget(); form = QtWidgets.QFormLayout(content); form.setSpacing(12)
         
         # --- CAMPOS BLOQUEADOS (READ ONLY) ---
-        self.inp_lote = QtWidgets.QLineEdit(self.data.get('nro_lote', ''))
+        self.inp_lote = QtWidgets.QLineEdit(self.data.nro_lote)
         self.inp_lote.setReadOnly(True)
         self.inp_lote.setStyleSheet(f"background-color: {theme.BG_INPUT}; border: 1px solid {theme.BORDER_COLOR}; color: #888; padding: 4px;")
         
-        self.inp_qty = self._spinbox(float(self.data.get('quantity', 0)), locked=True)
-        self.inp_l = self._spinbox(float(self.data.get('largo', 0)), locked=True)
-        self.inp_a = self._spinbox(float(self.data.get('ancho', 0)), locked=True)
-        self.inp_e = self._spinbox(float(self.data.get('espesor', 0)), locked=True)
+        self.inp_qty = self._spinbox(self.data.quantity, locked=True)
+        self.inp_l = self._spinbox(self.data.largo, locked=True)
+        self.inp_a = self._spinbox(self.data.ancho, locked=True)
+        self.inp_e = self._spinbox(self.data.espesor, locked=True)
         
         self.inp_date = QtWidgets.QDateEdit(calendarPopup=True)
         try:
-            d = str(self.data.get('prod_date')).split("T")[0]
+            d = str(self.data.prod_date).split("T")[0]
             self.inp_date.setDate(QtCore.QDate.fromString(d, "yyyy-MM-dd"))
         except: self.inp_date.setDate(QtCore.QDate.currentDate())
         self.inp_date.setReadOnly(True); self.inp_date.setDisabled(True)
         self.inp_date.setStyleSheet(f"background-color: {theme.BG_INPUT}; color: #888; padding: 4px;")
 
-        self.inp_calidad = QtWidgets.QLineEdit(self.data.get('quality', ''))
+        self.inp_calidad = QtWidgets.QLineEdit(self.data.quality or '')
         self.inp_calidad.setReadOnly(True)
         self.inp_calidad.setStyleSheet(f"background-color: {theme.BG_INPUT}; color: #888; padding: 4px;")
 
         # --- OBSERVACIONES (EDITABLE) ---
-        self.inp_obs = QtWidgets.QPlainTextEdit(str(self.data.get('obs') or "")); self.inp_obs.setFixedHeight(80)
+        self.inp_obs = QtWidgets.QPlainTextEdit(str(self.data.obs or "")); self.inp_obs.setFixedHeight(80)
         self.inp_obs.setStyleSheet(f"background-color: {theme.BG_INPUT}; color: white; border: 1px solid {theme.ACCENT_COLOR};")
 
         form.addRow("Nro. Lote:", self.inp_lote); form.addRow("Cantidad (Piezas):", self.inp_qty)
@@ -64,7 +63,7 @@ class EditarProductoDialog(QtWidgets.QDialog):
         scroll.setWidget(content); layout.addWidget(scroll)
 
         # --- SECCIÓN RECUPERAR BAJA ---
-        if self.data.get('status') == 'BAJA':
+        if self.data.status == 'BAJA':
             rec_frame = QtWidgets.QFrame()
             rec_frame.setStyleSheet("background-color: #3a1c1c; border-radius: 6px; padding: 10px; margin-top: 10px;")
             rl = QtWidgets.QVBoxLayout(rec_frame)
@@ -108,7 +107,7 @@ class EditarProductoDialog(QtWidgets.QDialog):
 
     def get_data(self):
         d = {
-            "id": self.data["id"], 
+            "id": self.data.id, 
             "nro_lote": self.inp_lote.text(), 
             "quantity": self.inp_qty.value(),
             "largo": self.inp_l.value(), 
@@ -124,8 +123,9 @@ class EditarProductoDialog(QtWidgets.QDialog):
 class InventarioScreen(QtWidgets.QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.data_existencias = []
+        self.snapshot = InventorySnapshot([])
         self.data_historial = []
+        self._hist_ultimo = None; self._hist_hay_mas = False   # Historial por páginas (keyset)
         self._setup_ui()
         self.refresh()
 
@@ -192,8 +192,18 @@ class InventarioScreen(QtWidgets.QWidget):
         self.table_exist.setColumnCount(len(cols))
         self.table_exist.setHorizontalHeaderLabels(cols)
         self._estilizar_tabla(self.table_exist)
+        # Clic en el encabezado: se reordena en el servidor (Shift+clic agrega un criterio)
+        self._orden_exist = OrdenColumnas(self.table_exist, {
+            0: "id", 1: "sku", 2: "lote", 3: "product", 4: "quantity", 5: "bultos", 6: "prod_date",
+            7: "status", 8: "largo", 9: "ancho", 10: "espesor", 11: "quality"}, repo.INVENTARIO_ORDEN)
+        self._orden_exist.cambio.connect(lambda _: self._recargar_existencias())
         layout.addWidget(self.table_exist)
 
+        # Resumen (calculado sobre la foto columnar, no sobre la tabla)
+        self.lbl_resumen = QtWidgets.QLabel("")
+        self.lbl_resumen.setStyleSheet(f"color: {theme.TEXT_SECONDARY}; font-weight: bold; padding: 4px;")
+        layout.addWidget(self.lbl_resumen)
+
     def _setup_tab_historial(self, parent):
         layout = QtWidgets.QVBoxLayout(parent)
         top_bar = QtWidgets.QHBoxLayout()
@@ -201,6 +211,10 @@ class InventarioScreen(QtWidgets.QWidget):
         self.search_hist.setPlaceholderText("🔍 Buscar por Cliente, Guía...")
         self.search_hist.setStyleSheet(f"background-color: {theme.BG_INPUT}; color: white; padding: 6px; border-radius: 4px;")
         self.search_hist.textChanged.connect(self._filtrar_historial)
+        # Lo cargado se filtra al instante; después se busca en el servidor (despachos más antiguos)
+        self._timer_hist = QtCore.QTimer(self); self._timer_hist.setSingleShot(True); self._timer_hist.setInterval(300)
+        self._timer_hist.timeout.connect(self._recargar_historial)
+        self.search_hist.textEdited.connect(lambda _: self._timer_hist.start())
         
         btn_refresh = QtWidgets.QPushButton("🔄 Actualizar"); btn_refresh.clicked.connect(self.refresh)
         btn_xls = QtWidgets.QPushButton("📊 Excel Historial"); btn_xls.clicked.connect(lambda: self._exportar_excel("historial"))
@@ -218,8 +232,17 @@ class InventarioScreen(QtWidgets.QWidget):
         self.table_hist.setColumnCount(len(cols))
         self.table_hist.setHorizontalHeaderLabels(cols)
         self._estilizar_tabla(self.table_hist)
+        self._orden_hist = OrdenColumnas(self.table_hist, {
+            0: "id", 1: "date", 2: "guide", 3: "client", 4: "product", 5: "lote", 6: "sku", 7: "quantity", 8: "bultos"}, repo.HISTORIAL_ORDEN)
+        self._orden_hist.cambio.connect(lambda _: self._recargar_historial())
+        # Al llegar al final se piden los despachos anteriores
+        self.table_hist.verticalScrollBar().valueChanged.connect(lambda v: v == self.table_hist.verticalScrollBar().maximum() and self._mas_historial())
         layout.addWidget(self.table_hist)
 
+        self.lbl_hist_total = QtWidgets.QLabel("")
+        self.lbl_hist_total.setStyleSheet(f"color: {theme.TEXT_SECONDARY}; padding: 4px;")
+        layout.addWidget(self.lbl_hist_total)
+
     def _estilizar_tabla(self, table):
         table.setStyleSheet(f"""
             QTableWidget {{ background-color: {theme.BG_SIDEBAR}; color: {theme.TEXT_PRIMARY}; gridline-color: {theme.BORDER_COLOR}; border: 1px solid {theme.BORDER_COLOR}; }}
@@ -233,49 +256,114 @@ class InventarioScreen(QtWidgets.QWidget):
         table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
 
     def refresh(self):
+        mostrar_todo = self.chk_show_exhausted.isChecked()
+        # Al abrir la ventana principal los datos ya vienen precargados durante el login
+        busca = bool(self.search_hist.text().strip())
+        rows = None if mostrar_todo or not self._orden_exist.es_defecto else prefetch.get("inventory_rows")
+        historial = None if busca or not self._orden_hist.es_defecto else prefetch.get("dispatches_history")
+        if rows is not None and historial is not None:
+            self._mostrar_datos(rows, historial)
+            return
+        if repo_async.is_enabled():
+            # Existencias e historial se piden a la vez sin bloquear la interfaz
+            repo_async.spawn(self._refresh_async(mostrar_todo))
+            return
         try:
-            mostrar_todo = self.chk_show_exhausted.isChecked()
-            self.data_existencias = repo.list_inventory_rows(mostrar_agotados=mostrar_todo)
-            self._llenar_existencias(self.data_existencias)
-            self.data_historial = repo.list_dispatches_history()
-            self._llenar_historial(self.data_historial)
+            self._mostrar_datos(repo.list_inventory_rows(mostrar_agotados=mostrar_todo, orden=self._orden_exist.orden),
+                                repo.list_dispatches_history(search=self.search_hist.text(), orden=self._orden_hist.orden))
         except Exception as e:
             QtWidgets.QMessageBox.critical(self, "Error", f"Error cargando datos: {e}")
 
-    def _llenar_existencias(self, data):
+    async def _refresh_async(self, mostrar_todo):
+        try:
+            rows, historial = await asyncio.gather(
+                repo_async.list_inventory_rows(mostrar_agotados=mostrar_todo, orden=self._orden_exist.orden),
+                repo_async.list_dispatches_history(search=self.search_hist.text(), orden=self._orden_hist.orden))
+            self._mostrar_datos(rows, historial)
+        except Exception as e:
+            QtWidgets.QMessageBox.critical(self, "Error", f"Error cargando datos: {e}")
+
+    def _mostrar_datos(self, rows, historial):
+        self._poner_existencias(rows)
+        self._poner_historial(historial)
+
+    def _poner_existencias(self, rows):
+        self.snapshot = InventorySnapshot(rows)
+        self._filtrar_existencias(self.search_exist.text())
+
+    def _recargar_existencias(self):
+        try: self._poner_existencias(repo.list_inventory_rows(mostrar_agotados=self.chk_show_exhausted.isChecked(), orden=self._orden_exist.orden))
+        except Exception as e: QtWidgets.QMessageBox.critical(self, "Error", f"Error cargando existencias: {e}")
+
+    # ---------- HISTORIAL POR PÁGINAS ----------
+    def _poner_historial(self, pagina, agregar=False, completo=False):
+        self.data_historial = (self.data_historial + pagina) if agregar else pagina
+        self._hist_hay_mas = not completo and len(pagina) == repo.HISTORIAL_PAGINA
+        if pagina: self._hist_ultimo = pagina[-1]
+        elif not agregar: self._hist_ultimo = None
+        self.lbl_hist_total.setText(f"{len(self.data_historial)} despachos" + (" (desplace para ver anteriores)" if self._hist_hay_mas else ""))
+        self._filtrar_historial(self.search_hist.text())
+
+    def _pagina_historial(self):
+        return repo.list_dispatches_history(search=self.search_hist.text(), after=self._hist_ultimo, orden=self._orden_hist.orden)
+
+    def _mas_historial(self):
+        if not self._hist_hay_mas: return
+        try:
+            pos = self.table_hist.verticalScrollBar().value()
+            self._poner_historial(self._pagina_historial(), agregar=True)
+            self.table_hist.verticalScrollBar().setValue(pos)
+        except Exception as e:
+            self._hist_hay_mas = False
+            QtWidgets.QMessageBox.critical(self, "Error", f"Error cargando historial: {e}")
+
+    def _recargar_historial(self):
+        self._hist_ultimo = None
+        try: self._poner_historial(self._pagina_historial())
+        except Exception as e: QtWidgets.QMessageBox.critical(self, "Error", f"Error cargando historial: {e}")
+
+    def _llenar_existencias(self, indices=None):
+        snap = self.snapshot
+        if indices is None: indices = range(len(snap))
         self.table_exist.setRowCount(0)
-        for r in data:
+        for idx in indices:
             row = self.table_exist.rowCount(); self.table_exist.insertRow(row)
-            
-            tipo = str(r.get("product_type", "")); qty = float(r.get("quantity", 0))
-            factor = FACTORES_CONVERSION.get(tipo, 1)
-            bultos = int(qty / factor) if factor else 0
-            
-            status = r.get("status")
-            if qty == 0 and status != "BAJA": status = "AGOTADO"
+            r = snap.row(idx)
+            qty = r.quantity; bultos = snap.bultos(idx); status = snap.estado(idx)
 
-            vals = [str(r.get("id")), r.get("sku"), r.get("nro_lote"), tipo, f"{qty:.0f}", f"{bultos}", str(r.get("prod_date")), status, str(r.get("largo")), str(r.get("ancho")), str(r.get("espesor")), r.get("quality"), r.get("drying"), r.get("planing"), r.get("impregnated"), r.get("obs")]
+            vals = [str(r.id), r.sku, r.nro_lote, r.product_type, f"{qty:.0f}", f"{bultos}", str(r.prod_date), status, str(r.largo), str(r.ancho), str(r.espesor), r.quality, r.drying, r.planing, r.impregnated, r.obs]
             for i, v in enumerate(vals):
                 it = QtWidgets.QTableWidgetItem(str(v or ""))
-                if i==0: it.setData(QtCore.Qt.UserRole, r)
+                if i==0: it.setData(QtCore.Qt.UserRole, idx)
                 if status == "BAJA": it.setForeground(QtGui.QColor("#ff6b6b"))
                 elif qty == 0: it.setForeground(QtGui.QColor("gray"))
                 self.table_exist.setItem(row, i, it)
 
     def _llenar_historial(self, data):
+        # Vaciar la tabla lleva la barra a 0: que no se lea como "llegó al final"
+        sb = self.table_hist.verticalScrollBar(); sb.blockSignals(True)
+        try: self._llenar_filas_historial(data)
+        finally: sb.blockSignals(False)
+
+    def _llenar_filas_historial(self, data):
         self.table_hist.setRowCount(0)
         for r in data:
             row = self.table_hist.rowCount(); self.table_hist.insertRow(row)
-            tipo = str(r.get("type", "")); qty = float(r.get("quantity", 0))
-            factor = FACTORES_CONVERSION.get(tipo, 1); bultos = int(qty / factor) if factor else 0
-            vals = [str(r.get("id")), str(r.get("date")), r.get("guide"), r.get("client"), r.get("product"), r.get("lote"), r.get("sku"), f"{qty:.0f}", f"{bultos}", r.get("obs")]
+            qty = float(r.get("quantity", 0))
+            vals = [str(r.get("id")), str(r.get("date")), r.get("guide"), r.get("client"), r.get("product"), r.get("lote"), r.get("sku"), f"{qty:.0f}", f"{r.get('bultos', 0)}", r.get("obs")]
             for i, v in enumerate(vals):
                 self.table_hist.setItem(row, i, QtWidgets.QTableWidgetItem(str(v or "")))
 
     def _filtrar_existencias(self, text):
-        t = text.lower()
-        res = [x for x in self.data_existencias if t in str(x.get("sku")).lower() or t in str(x.get("nro_lote")).lower() or t in str(x.get("product_type")).lower()]
-        self._llenar_existencias(res)
+        indices = self.snapshot.filtrar(text)
+        self._llenar_existencias(indices)
+        self._actualizar_resumen(indices)
+
+    def _actualizar_resumen(self, indices=None):
+        tot = self.snapshot.resumen(indices)
+        partes = [f"{tipo}: {t['bultos']} bultos" for tipo, t in sorted(self.snapshot.por_tipo(indices).items())]
+        self.lbl_resumen.setText(f"Lotes: {tot['lotes']}  |  Piezas: {tot['piezas']:.0f}  |  Bultos: {tot['bultos']}"
+                                 + ("  —  " + "  ·  ".join(partes) if partes else ""))
 
     def _filtrar_historial(self, text):
         t = text.lower()
@@ -285,31 +373,31 @@ class InventarioScreen(QtWidgets.QWidget):
     def _get_selected_existencia(self):
         row = self.table_exist.currentRow()
         if row < 0: return None
-        return self.table_exist.item(row, 0).data(QtCore.Qt.UserRole)
+        return self.snapshot.row(self.table_exist.item(row, 0).data(QtCore.Qt.UserRole))
 
     # --- CAMBIO: AÑADIDA JUSTIFICACIÓN DE BAJA ---
     def _dar_baja_producto(self):
         data = self._get_selected_existencia()
         if not data: return
         
-        if data.get("status") == "BAJA":
+        if data.status == "BAJA":
              QtWidgets.QMessageBox.warning(self, "Aviso", "Este producto ya está dado de BAJA.")
              return
         
-        if float(data['quantity']) == 0:
+        if data.quantity == 0:
             QtWidgets.QMessageBox.information(self, "Info", "Este producto ya está agotado.")
             return
 
         # Input Dialog para la razón
         reason, ok = QtWidgets.QInputDialog.getText(
             self, "Justificación de Baja", 
-            f"Está a punto de dar de baja el Lote {data['nro_lote']}.\n\n"
+            f"Está a punto de dar de baja el Lote {data.nro_lote}.\n\n"
             "Por favor, ingrese el motivo (Obligatorio):",
             QtWidgets.QLineEdit.Normal
         )
 
         if ok and reason.strip():
-            repo.delete_inventory(data['id'], reason.strip())
+            repo.delete_inventory(data.id, reason.strip())
             self.refresh()
             QtWidgets.QMessageBox.information(self, "Listo", "Producto dado de baja correctamente.")
         elif ok:
@@ -335,6 +423,11 @@ class InventarioScreen(QtWidgets.QWidget):
         path, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Guardar", filename, "Excel (*.xlsx)")
         if not path: return
 
+        if tipo == "historial" and self._hist_hay_mas:
+            # Se exporta todo el historial (con la búsqueda actual), no solo las páginas cargadas
+            try: self._poner_historial(repo.list_dispatches_history(search=self.search_hist.text(), after=self._hist_ultimo, limit=None, orden=self._orden_hist.orden), agregar=True, completo=True)
+            except Exception as e: QtWidgets.QMessageBox.critical(self, "Error", str(e)); return
+
         try:
             wb = openpyxl.Workbook(); ws = wb.active; ws.title = "Reporte"
             header_fill = PatternFill(start_color="1b1b26", end_color="1b1b26", fill_type="solid")
@@ -2,12 +2,31 @@ from PySide6 import QtCore, QtGui, QtWidgets
 from core import repo, theme
 import os
 
+AUTH_TIMEOUT_MS = 10000  # Sin respuesta de la base en este tiempo se cancela el intento
+
+
+class _Autenticar(QtCore.QThread):
+    """Valida las credenciales fuera del hilo de la interfaz."""
+    listo = QtCore.Signal(int, object, str)   # intento, usuario (o None), error
+
+    def __init__(self, intento, username, password, parent=None):
+        super().__init__(parent)
+        self.intento, self.username, self.password = intento, username, password
+
+    def run(self):
+        try:
+            self.listo.emit(self.intento, repo.authenticate_user_plain(self.username, self.password), "")
+        except Exception as e:
+            self.listo.emit(self.intento, None, str(e))
+
+
 class LoginScreen(QtWidgets.QWidget):
     # Señal de éxito al loguearse (pasa los datos del usuario)
     success_signal = QtCore.Signal(dict)
 
     def __init__(self, parent=None):
         super().__init__(parent)
+        self._intento = 0; self._hilos = []
         self._build_ui()
 
     def _build_ui(self):
@@ -137,22 +156,38 @@ class LoginScreen(QtWidgets.QWidget):
             self.user_input.setFocus()
             return
 
-        # Bloquear botón momentáneamente
+        # Bloquear botón mientras se verifica (la interfaz sigue respondiendo)
         self.btn_login.setEnabled(False)
         self.btn_login.setText("Verificando...")
-        QtWidgets.QApplication.processEvents()
-
-        try:
-            user = repo.authenticate_user_plain(username, password)
-            if user:
-                # Login Exitoso
-                self.success_signal.emit(user)
-            else:
-                QtWidgets.QMessageBox.critical(self, "Acceso Denegado", "Usuario o contraseña incorrectos.")
-                self.pass_input.clear()
-                self.pass_input.setFocus()
-        except Exception as e:
-            QtWidgets.QMessageBox.critical(self, "Error de Conexión", f"No se pudo conectar a la base de datos.\nDetalle: {str(e)}")
-        finally:
-            self.btn_login.setEnabled(True)
-            self.btn_login.setText("INGRESAR AL SISTEMA")
\ No newline at end of file
+        self._intento += 1
+        hilo = _Autenticar(self._intento, username, password, self)
+        hilo.listo.connect(self._autenticado)
+        hilo.finished.connect(lambda: self._hilos.remove(hilo) or hilo.deleteLater())
+        self._hilos.append(hilo)
+        hilo.start()
+        intento = self._intento
+        QtCore.QTimer.singleShot(AUTH_TIMEOUT_MS, lambda: self._sin_respuesta(intento))
+
+    def _reactivar(self):
+        self.btn_login.setEnabled(True)
+        self.btn_login.setText("INGRESAR AL SISTEMA")
+
+    def _sin_respuesta(self, intento):
+        if intento != self._intento: return
+        self._intento += 1   # La respuesta tardía se descarta
+        self._reactivar()
+        QtWidgets.QMessageBox.critical(self, "Error de Conexión", "La base de datos no respondió a tiempo. Intente de nuevo.")
+
+    def _autenticado(self, intento, user, error):
+        if intento != self._intento: return
+        self._intento += 1
+        self._reactivar()
+        if error:
+            QtWidgets.QMessageBox.critical(self, "Error de Conexión", f"No se pudo conectar a la base de datos.\nDetalle: {error}")
+        elif user:
+            # Login Exitoso
+            self.success_signal.emit(user)
+        else:
+            QtWidgets.QMessageBox.critical(self, "Acceso Denegado", "Usuario o contraseña incorrectos.")
+            self.pass_input.clear()
+            self.pass_input.setFocus()
@@ -6,9 +6,14 @@ from screens.clientes import ClientesScreen
 from screens.manual import ManualScreen
 from screens.respaldo import RespaldoScreen
 from screens.despacho import DespachoScreen
-from core import theme
+from screens.auditoria import AuditoriaScreen
+from screens.cola import ColaDialog
+from core import theme, offline
+from core.backup_scheduler import BackupScheduler, last_result
 
 class MainScreen(QtWidgets.QWidget):
+    cola_cambio = QtCore.Signal(dict)   # Emitida desde el hilo de core.offline
+
     def __init__(self, current_user=None):
         super().__init__()
         self.current_user = current_user
@@ -43,6 +48,7 @@ class MainScreen(QtWidgets.QWidget):
         self.btn_cli = self._create_nav_button("👥 Clientes")
         self.btn_res = self._create_nav_button("💾 Respaldo")
         self.btn_man = self._create_nav_button("❓ Manual")
+        self.btn_aud = self._create_nav_button("🛡 Auditoría")
         
         
         # Añadir al menú
@@ -53,8 +59,25 @@ class MainScreen(QtWidgets.QWidget):
         menu_layout.addWidget(self.btn_cli)
         menu_layout.addWidget(self.btn_res)
         menu_layout.addWidget(self.btn_man)
+        menu_layout.addWidget(self.btn_aud)
         menu_layout.addStretch()
 
+        # Resultado del último respaldo automático
+        self.lbl_respaldo = QtWidgets.QLabel()
+        self.lbl_respaldo.setWordWrap(True)
+        self.lbl_respaldo.setStyleSheet(f"font-size: 8pt; color: {theme.TEXT_SECONDARY};")
+        menu_layout.addWidget(self.lbl_respaldo)
+        self.scheduler = BackupScheduler(self)
+        self.scheduler.resultado.connect(lambda ok, msg: self._mostrar_respaldo())
+        self._mostrar_respaldo()
+
+        # Registros y despachos en la cola local (core.offline)
+        self.btn_cola = QtWidgets.QPushButton()
+        self.btn_cola.setFlat(True)
+        self.btn_cola.setCursor(QtCore.Qt.PointingHandCursor)
+        self.btn_cola.clicked.connect(self._ver_cola)
+        menu_layout.addWidget(self.btn_cola)
+
         main_layout.addWidget(self.side_menu)
 
         # --- 2. CONTENIDO (STACK) ---
@@ -68,6 +91,7 @@ class MainScreen(QtWidgets.QWidget):
         self.cli_screen = ClientesScreen()     # Índice 4
         self.res_screen = RespaldoScreen()     # Índice 5
         self.man_screen = ManualScreen()       # Índice 6
+        self.aud_screen = AuditoriaScreen()    # Índice 7
 
         # Conectar señal de registro exitoso
         self.reg_screen.saved_signal.connect(self._on_product_registered)
@@ -80,6 +104,7 @@ class MainScreen(QtWidgets.QWidget):
         self.stack.addWidget(self.cli_screen)
         self.stack.addWidget(self.res_screen)
         self.stack.addWidget(self.man_screen)
+        self.stack.addWidget(self.aud_screen)
 
         main_layout.addWidget(self.stack)
 
@@ -91,10 +116,15 @@ class MainScreen(QtWidgets.QWidget):
         self.btn_cli.clicked.connect(lambda: self._navigate(4, self.btn_cli))
         self.btn_res.clicked.connect(lambda: self._navigate(5, self.btn_res))
         self.btn_man.clicked.connect(lambda: self._navigate(6, self.btn_man))
+        self.btn_aud.clicked.connect(lambda: self._navigate(7, self.btn_aud))
 
         # Iniciar en inventario
         self._navigate(0, self.btn_inv)
 
+        self.cola_cambio.connect(self._on_cola)
+        self._pendientes = self._mostrar_cola(offline.journal().counts())
+        offline.start(self.cola_cambio.emit)
+
     def _create_nav_button(self, text):
         btn = QtWidgets.QPushButton(text)
         btn.setCheckable(True)
@@ -122,7 +152,7 @@ class MainScreen(QtWidgets.QWidget):
         # 1. Limpiar estilo de TODOS los botones
         all_buttons = [
             self.btn_inv, self.btn_reg, self.btn_desp, 
-            self.btn_rep, self.btn_cli, self.btn_res, self.btn_man
+            self.btn_rep, self.btn_cli, self.btn_res, self.btn_man, self.btn_aud
         ]
         
         for btn in all_buttons:
@@ -147,10 +177,45 @@ class MainScreen(QtWidgets.QWidget):
                 self.desp_screen.refresh_clients()
             elif index == 4: # Clientes
                 self.cli_screen.refresh()
+            elif index == 7: # Auditoría
+                self.aud_screen.refresh()
         except Exception as e:
             print(f"Advertencia al refrescar pantalla {index}: {e}")
             # No mostramos popup para no interrumpir la navegación
 
+    def _mostrar_respaldo(self):
+        res = last_result()
+        if not res:
+            self.lbl_respaldo.setText("💾 Sin respaldos automáticos")
+            return
+        cuando, ok, msg = res
+        self.lbl_respaldo.setText(f"💾 Último respaldo automático: {cuando.replace('T', ' ')}\n{'✔' if ok else '✖'} {msg}")
+        self.lbl_respaldo.setStyleSheet(f"font-size: 8pt; color: {theme.TEXT_SECONDARY if ok else theme.BTN_DANGER};")
+
+    def _mostrar_cola(self, counts):
+        """Actualiza el botón de la cola local. Devuelve los pedidos pendientes."""
+        pendientes, conflictos = counts.get(offline.PENDIENTE, 0), counts.get(offline.CONFLICTO, 0)
+        self.btn_cola.setVisible(bool(pendientes or conflictos))
+        texto = f"⏳ {pendientes} por sincronizar"
+        if conflictos: texto += f"\n⚠ {conflictos} rechazadas (ver)"
+        self.btn_cola.setText(texto)
+        self.btn_cola.setStyleSheet(f"font-size: 8pt; text-align: left; border: none; color: {theme.BTN_DANGER if conflictos else theme.TEXT_SECONDARY};")
+        return pendientes
+
+    def _on_cola(self, counts):
+        pendientes, antes = self._mostrar_cola(counts), self._pendientes
+        self._pendientes = pendientes
+        # Solo si el sincronizador aplicó algo (bajaron los pendientes) cambió la existencia en el servidor
+        if pendientes >= antes: return
+        self.desp_screen._lotes = None
+        if self.stack.currentIndex() == 0:
+            try: self.inv_screen.refresh()
+            except Exception as e: print(f"Advertencia al refrescar inventario: {e}")
+
+    def _ver_cola(self):
+        ColaDialog(self).exec()
+        self._on_cola(offline.journal().counts())
+
     def _on_product_registered(self, data):
         """Al guardar un producto, volvemos al inventario."""
         self._navigate(0, self.btn_inv)
\ No newline at end of file
@@ -0,0 +1,62 @@
+from PySide6 import QtCore, QtWidgets
+
+
+class OrdenColumnas(QtCore.QObject):
+    """
+    Orden en el servidor desde los encabezados de una tabla.
+
+    Clic en un encabezado: ordena por esa columna (otro clic invierte el sentido).
+    Shift+clic: la agrega como criterio secundario (o invierte su sentido).
+    'cambio' emite la tupla ((campo, desc), ...) que reciben las funciones de core.repo;
+    la tabla no ordena nada en memoria, se vuelve a pedir la primera página.
+    """
+    cambio = QtCore.Signal(object)
+
+    def __init__(self, table, campos, orden, parent=None):
+        super().__init__(parent or table)
+        self.table = table
+        self.campos = campos                      # {columna: campo de core.repo}
+        self._columnas = {c: col for col, c in campos.items()}
+        self.defecto = self.orden = tuple(orden)
+        h = table.horizontalHeader()
+        h.setSectionsClickable(True); h.setSortIndicatorShown(True)
+        h.sectionClicked.connect(self._clic)
+        self._indicador()
+
+    @property
+    def es_defecto(self):
+        return self.orden == self.defecto
+
+    def set_orden(self, orden):
+        """Cambia el orden sin emitir 'cambio' (p. ej. desde otro control de la pantalla)."""
+        self.orden = tuple(orden)
+        self._indicador()
+
+    def _clic(self, col):
+        campo = self.campos.get(col)
+        if campo is None:
+            QtCore.QTimer.singleShot(0, self._indicador); return
+        orden = list(self.orden)
+        pos = next((i for i, (c, _) in enumerate(orden) if c == campo), None)
+        if QtWidgets.QApplication.keyboardModifiers() & QtCore.Qt.ShiftModifier and orden:
+            if pos is None: orden.append((campo, False))
+            else: orden[pos] = (campo, not orden[pos][1])
+        else:
+            orden = [(campo, not orden[0][1] if pos == 0 else False)]
+        self.orden = tuple(orden)
+        # El encabezado invierte su propio indicador al hacer clic: se corrige después
+        QtCore.QTimer.singleShot(0, self._indicador)
+        self.cambio.emit(self.orden)
+
+    def _indicador(self):
+        h = self.table.horizontalHeader()
+        principal = self._columnas.get(self.orden[0][0]) if self.orden else None
+        if principal is None: h.setSortIndicator(-1, QtCore.Qt.AscendingOrder)
+        else: h.setSortIndicator(principal, QtCore.Qt.DescendingOrder if self.orden[0][1] else QtCore.Qt.AscendingOrder)
+        # Los criterios secundarios se ven en la ayuda del encabezado
+        for col in range(self.table.columnCount()):
+            item = self.table.horizontalHeaderItem(col)
+            if item is None: continue
+            pos = next((i for i, (c, _) in enumerate(self.orden) if c == self.campos.get(col)), None)
+            item.setToolTip("" if pos is None else f"Orden {pos + 1}: {'descendente' if self.orden[pos][1] else 'ascendente'}"
+                            + ("" if pos else "  (Shift+clic en otra columna agrega un criterio)"))
@@ -1,15 +1,7 @@
 import random
 import time
 from PySide6 import QtCore, QtWidgets, QtGui
-from core import theme, repo
-
-# Factores de conversión
-FACTORES_CONVERSION = {
-    "Tablas": 30,
-    "Tablones": 20,
-    "Paletas": 10,
-    "Machihembrado": 5
-}
+from core import theme, repo, offline, refcache
 
 class MedidasManagerDialog(QtWidgets.QDialog):
     """Ventana para gestionar y seleccionar medidas favoritas"""
@@ -23,6 +15,7 @@ class MedidasManagerDialog(QtWidgets.QDialog):
         self.setStyleSheet(f"background-color: {theme.BG_SIDEBAR}; color: {theme.TEXT_PRIMARY};")
         self._build_ui()
         self._load_measures()
+        refcache.revalidate_background()
 
     def _build_ui(self):
         layout = QtWidgets.QVBoxLayout(self)
@@ -86,11 +79,12 @@ class MedidasManagerDialog(QtWidgets.QDialog):
 
     def _load_measures(self):
         self.list_widget.clear()
-        measures = repo.get_measures_by_type(self.product_type)
+        # Desde la caché local: se muestra enseguida y se revalida en segundo plano al abrir
+        measures = refcache.measures(self.product_type)
         for m in measures:
-            label = f"{m.name or 'Sin Nombre'} | {m.largo}m x {m.ancho}cm"
-            if m.espesor and m.espesor > 0:
-                label += f" x {m.espesor}cm"
+            label = f"{m.name or 'Sin Nombre'} | {m.largo:.2f}m x {m.ancho:.2f}cm"
+            if m.espesor > 0:
+                label += f" x {m.espesor:.2f}cm"
             
             item = QtWidgets.QListWidgetItem(label)
             item.setData(QtCore.Qt.UserRole, m) 
@@ -110,6 +104,7 @@ class MedidasManagerDialog(QtWidgets.QDialog):
             "espesor": self.inp_e.value()
         }
         repo.create_measure(data)
+        refcache.revalidate()
         self._load_measures()
         self.inp_name.clear()
 
@@ -122,6 +117,7 @@ class MedidasManagerDialog(QtWidgets.QDialog):
             QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No) == QtWidgets.QMessageBox.Yes:
             
             repo.delete_measure(m.id)
+            refcache.revalidate()
             self._load_measures()
 
     def _usar_medida(self, item):
@@ -141,6 +137,7 @@ class RegistrarForm(QtWidgets.QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.is_saving = False  # SEMÁFORO DE SEGURIDAD
+        self._factores = None   # Piezas por bulto (tabla product_factors), se cargan al guardar
         self._build_ui()
 
     def _build_ui(self):
@@ -413,7 +410,8 @@ class RegistrarForm(QtWidgets.QWidget):
             if not self._validate_input(tipo): 
                 return 
 
-            factor = FACTORES_CONVERSION.get(tipo, 1)
+            if self._factores is None: self._factores = refcache.factors()
+            factor = self._factores.get(tipo, 1)
             cant_bultos = self.piezas.value()
             total_piezas = cant_bultos * factor
 
@@ -445,18 +443,12 @@ class RegistrarForm(QtWidgets.QWidget):
                 "obs": self.obs.toPlainText() + f" (Entrada: {cant_bultos} Bultos)"
             }
 
-            result = repo.create_product_with_inventory(data)
-            
-            # --- MANEJO SILENCIOSO ---
-            if result.get("status") == "ignored_duplicate":
-                # Es un duplicado exacto (doble clic), mostramos éxito sin duplicar
-                QtWidgets.QMessageBox.information(self, "Éxito", "Producto registrado correctamente.")
-                self._clear_form()
-            else:
-                # Registro normal
-                self.saved_signal.emit(data)
-                QtWidgets.QMessageBox.information(self, "Éxito", "Producto registrado correctamente.")
-                self._clear_form()
+            # Se guarda en la cola local y se envía en segundo plano (core.offline):
+            # un lote repetido con otros datos aparece luego como operación rechazada.
+            offline.enqueue(offline.REGISTRO, data)
+            self.saved_signal.emit(data)
+            QtWidgets.QMessageBox.information(self, "Éxito", "Producto registrado correctamente.")
+            self._clear_form()
 
         except Exception as e:
             # Solo mostramos alerta si es un error real
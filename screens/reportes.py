@@ -1,11 +1,11 @@
 from PySide6 import QtCore, QtWidgets, QtGui
 from datetime import date, timedelta
-from core import repo, theme
+from core import repo, prefetch, theme
+from core.cancel import CancelToken, QueryCancelled
+from screens.clientes import ClienteCombo
+from screens.orden_tabla import OrdenColumnas
 import sys
 
-# Factores
-FACTORES_CONVERSION = { "Tablas": 30, "Tablones": 20, "Paletas": 10, "Machihembrado": 5 }
-
 # --- MATPLOTLIB ---
 try:
     import matplotlib
@@ -64,10 +64,31 @@ def exportar_tabla_excel(parent, table_widget, filename_base):
         wb.save(path); QtWidgets.QMessageBox.information(parent, "Éxito", f"Guardado: {path}")
     except Exception as e: QtWidgets.QMessageBox.critical(parent, "Error", str(e))
 
+class _Consulta(QtCore.QThread):
+    """Corre un reporte fuera del hilo de la interfaz; token.cancel() lo interrumpe en el servidor."""
+    listo = QtCore.Signal(int, object, str)   # número de consulta, datos (o None), error
+
+    def __init__(self, num, consulta, parent=None):
+        super().__init__(parent)
+        self.num, self.consulta, self.token = num, consulta, CancelToken()
+
+    def run(self):
+        try:
+            self.listo.emit(self.num, self.consulta(self.token), "")
+        except QueryCancelled:
+            pass
+        except Exception as e:
+            self.listo.emit(self.num, None, str(e))
+
+
 class ReportesScreen(QtWidgets.QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
+        self._num = 0; self._consultas = {}; self._botones = {}   # pestaña -> consulta en curso / (buscar, cancelar)
+        self._cancelados = []   # Hilos cancelados que todavía no terminaron
         self._setup_ui()
+        app = QtWidgets.QApplication.instance()
+        if app: app.aboutToQuit.connect(self._detener)
 
     def _setup_ui(self):
         layout = QtWidgets.QVBoxLayout(self)
@@ -92,6 +113,12 @@ class ReportesScreen(QtWidgets.QWidget):
         self.tab_lote = QtWidgets.QWidget(); self._setup_lote_tab(self.tab_lote)
         self.tabs.addTab(self.tab_lote, "🔢 Por Lotes")
 
+        self.tab_stock = QtWidgets.QWidget(); self._setup_stock_tab(self.tab_stock)
+        self.tabs.addTab(self.tab_stock, "📅 Stock a la Fecha")
+
+        self.tab_kardex = QtWidgets.QWidget(); self._setup_kardex_tab(self.tab_kardex)
+        self.tabs.addTab(self.tab_kardex, "📒 Kardex")
+
         layout.addWidget(self.tabs)
 
     def _estilizar_input(self, widget):
@@ -110,6 +137,58 @@ class ReportesScreen(QtWidgets.QWidget):
             start = date(2000, 1, 1); end = date(2030, 12, 31)
         d1_widget.setDate(start); d2_widget.setDate(end)
 
+    # ---------------- CONSULTAS CANCELABLES ----------------
+    def _boton_cancelar(self, clave, btn_buscar):
+        btn = QtWidgets.QPushButton("✖ Cancelar"); btn.setVisible(False)
+        btn.setStyleSheet(f"background-color: {theme.BTN_DANGER}; font-weight: bold; padding: 6px 15px; border-radius: 4px; color: white;")
+        btn.clicked.connect(lambda: self._cancelar(clave))
+        self._botones[clave] = (btn_buscar, btn)
+        return btn
+
+    def _ocupado(self, clave, si):
+        btn_buscar, btn_cancelar = self._botones[clave]
+        btn_buscar.setEnabled(not si); btn_cancelar.setVisible(si)
+
+    def _ejecutar(self, clave, consulta, mostrar):
+        """Corre consulta(token) en un hilo; al terminar, mostrar(datos) llena la pestaña."""
+        self._cancelar(clave)
+        self._num += 1
+        hilo = _Consulta(self._num, consulta, self)
+        hilo.listo.connect(lambda num, datos, error: self._terminado(clave, num, datos, error, mostrar))
+        hilo.finished.connect(self._liberar)   # Slot de la pantalla: corre en el hilo de la interfaz
+        self._consultas[clave] = hilo
+        self._ocupado(clave, True)
+        hilo.start()
+
+    def _cancelar(self, clave):
+        hilo = self._consultas.pop(clave, None)
+        if hilo is None: return
+        hilo.token.cancel()   # El servidor interrumpe la consulta y la conexión vuelve al pool
+        # Se conserva hasta que el hilo termine: destruirlo antes cerraría la app con el hilo corriendo
+        self._cancelados.append(hilo)
+        self._ocupado(clave, False)
+
+    def _liberar(self):
+        hilo = self.sender()
+        if hilo in self._cancelados: self._cancelados.remove(hilo)
+        hilo.deleteLater()
+
+    def _detener(self):
+        """Al salir: cancela las consultas en curso y espera a que sus hilos terminen."""
+        for clave in list(self._consultas): self._cancelar(clave)
+        for hilo in list(self._cancelados): hilo.wait()
+
+    def _terminado(self, clave, num, datos, error, mostrar):
+        hilo = self._consultas.get(clave)
+        if hilo is None or hilo.num != num: return   # Cancelada o reemplazada: se descarta
+        del self._consultas[clave]
+        self._ocupado(clave, False)
+        if error:
+            QtWidgets.QMessageBox.critical(self, "Error", error)
+            return
+        try: mostrar(datos)
+        except Exception as e: QtWidgets.QMessageBox.critical(self, "Error", str(e))
+
     # ---------------- TAB 1: PRODUCCIÓN ----------------
     def _setup_prod_tab(self, parent):
         l = QtWidgets.QVBoxLayout(parent)
@@ -142,7 +221,7 @@ class ReportesScreen(QtWidgets.QWidget):
 
         r2.addWidget(QtWidgets.QLabel("Prod:")); r2.addWidget(self.cb_prod_filter)
         r2.addWidget(QtWidgets.QLabel("Calidad:")); r2.addWidget(self.cb_qual_filter)
-        r2.addWidget(btn_s); r2.addStretch()
+        r2.addWidget(btn_s); r2.addWidget(self._boton_cancelar("prod", btn_s)); r2.addStretch()
 
         fl.addLayout(r1); fl.addLayout(r2); l.addWidget(filter_box)
 
@@ -150,6 +229,10 @@ class ReportesScreen(QtWidgets.QWidget):
         self.table_prod = QtWidgets.QTableWidget()
         self.table_prod.setColumnCount(8); self.table_prod.setHorizontalHeaderLabels(["Fecha", "Lote", "SKU", "Producto", "Calidad", "Cant.", "Bultos", "Estado"])
         self._style_table(self.table_prod)
+        # Clic en el encabezado: el reporte se vuelve a pedir ordenado en el servidor
+        self._orden_prod = OrdenColumnas(self.table_prod, {
+            0: "fecha", 1: "lote", 2: "sku", 3: "producto", 4: "quality", 5: "piezas", 6: "bultos", 7: "status"}, repo.REPORTE_PROD_ORDEN)
+        self._orden_prod.cambio.connect(lambda _: self.table_prod.rowCount() and self._search_prod())
         spl.addWidget(self.table_prod)
 
         if MATPLOTLIB_AVAILABLE:
@@ -172,25 +255,25 @@ class ReportesScreen(QtWidgets.QWidget):
         pname = self.cb_prod_filter.currentText(); pname = "" if "Todos" in pname else pname
         qual = self.cb_qual_filter.currentText()
 
-        try:
-            data = repo.report_production_period(d1, d2, pname, qual)
-            self.table_prod.setRowCount(0); stats = {}
-            for r in data:
-                row = self.table_prod.rowCount(); self.table_prod.insertRow(row)
-                tipo = r['producto']; pzas = r['piezas_iniciales']
-                factor = FACTORES_CONVERSION.get(tipo, 1)
-                
-                self.table_prod.setItem(row, 0, QtWidgets.QTableWidgetItem(str(r['fecha'])))
-                self.table_prod.setItem(row, 1, QtWidgets.QTableWidgetItem(str(r['lote'])))
-                self.table_prod.setItem(row, 2, QtWidgets.QTableWidgetItem(str(r['sku'])))
-                self.table_prod.setItem(row, 3, QtWidgets.QTableWidgetItem(str(tipo)))
-                self.table_prod.setItem(row, 4, QtWidgets.QTableWidgetItem(str(r.get('quality', '-'))))
-                self.table_prod.setItem(row, 5, QtWidgets.QTableWidgetItem(f"{pzas:.0f}"))
-                self.table_prod.setItem(row, 6, QtWidgets.QTableWidgetItem(f"{pzas/factor:.1f}" if factor else "0"))
-                self.table_prod.setItem(row, 7, QtWidgets.QTableWidgetItem(str(r['status'])))
-                stats[tipo] = stats.get(tipo, 0) + pzas
-            if MATPLOTLIB_AVAILABLE: self._update_chart(self.chart_prod, stats, "Producción (Piezas)")
-        except Exception as e: QtWidgets.QMessageBox.critical(self, "Error", str(e))
+        orden = self._orden_prod.orden
+        self._ejecutar("prod", lambda token: repo.report_production_period(d1, d2, pname, qual, cancel=token, orden=orden), self._mostrar_prod)
+
+    def _mostrar_prod(self, data):
+        self.table_prod.setRowCount(0); stats = {}
+        for r in data:
+            row = self.table_prod.rowCount(); self.table_prod.insertRow(row)
+            tipo = r['producto']; pzas = r['piezas_iniciales']
+
+            self.table_prod.setItem(row, 0, QtWidgets.QTableWidgetItem(str(r['fecha'])))
+            self.table_prod.setItem(row, 1, QtWidgets.QTableWidgetItem(str(r['lote'])))
+            self.table_prod.setItem(row, 2, QtWidgets.QTableWidgetItem(str(r['sku'])))
+            self.table_prod.setItem(row, 3, QtWidgets.QTableWidgetItem(str(tipo)))
+            self.table_prod.setItem(row, 4, QtWidgets.QTableWidgetItem(str(r.get('quality', '-'))))
+            self.table_prod.setItem(row, 5, QtWidgets.QTableWidgetItem(f"{pzas:.0f}"))
+            self.table_prod.setItem(row, 6, QtWidgets.QTableWidgetItem(f"{r['bultos']:.1f}"))
+            self.table_prod.setItem(row, 7, QtWidgets.QTableWidgetItem(str(r['status'])))
+            stats[tipo] = stats.get(tipo, 0) + pzas
+        if MATPLOTLIB_AVAILABLE: self._update_chart(self.chart_prod, stats, "Producción (Piezas)")
 
     # ---------------- TAB 2: DESPACHOS ----------------
     def _setup_disp_tab(self, parent):
@@ -213,8 +296,10 @@ class ReportesScreen(QtWidgets.QWidget):
         r1.addWidget(btn_w); r1.addWidget(btn_m); r1.addWidget(btn_a); r1.addStretch()
 
         r2 = QtWidgets.QHBoxLayout()
-        self.cb_client = QtWidgets.QComboBox(); self.cb_client.addItem("Todos", None)
-        for c in repo.list_clients(): self.cb_client.addItem(c.name, c.id)
+        self.cb_client = ClienteCombo(texto_todos="Todos")
+        clientes = prefetch.get("clients_active")
+        if clientes is None: self.cb_client.cargar()
+        else: self.cb_client.set_clients(clientes)
         self.cb_disp_prod = QtWidgets.QComboBox(); self.cb_disp_prod.addItems(["Todos los Productos", "Tablas", "Machihembrado", "Tablones", "Paletas"])
         self.txt_guide = QtWidgets.QLineEdit(); self.txt_guide.setPlaceholderText("Nro. Guía"); self._estilizar_input(self.txt_guide)
         self._estilizar_input(self.cb_client); self._estilizar_input(self.cb_disp_prod)
@@ -225,7 +310,7 @@ class ReportesScreen(QtWidgets.QWidget):
         r2.addWidget(QtWidgets.QLabel("Cliente:")); r2.addWidget(self.cb_client)
         r2.addWidget(QtWidgets.QLabel("Prod:")); r2.addWidget(self.cb_disp_prod)
         r2.addWidget(QtWidgets.QLabel("Guía:")); r2.addWidget(self.txt_guide)
-        r2.addWidget(btn_s); r2.addStretch()
+        r2.addWidget(btn_s); r2.addWidget(self._boton_cancelar("disp", btn_s)); r2.addStretch()
 
         fl.addLayout(r1); fl.addLayout(r2); l.addWidget(filter_box)
 
@@ -233,6 +318,9 @@ class ReportesScreen(QtWidgets.QWidget):
         self.table_disp = QtWidgets.QTableWidget()
         self.table_disp.setColumnCount(9); self.table_disp.setHorizontalHeaderLabels(["Fecha", "Guía", "Cliente", "Producto", "Lote", "SKU", "Cant.", "Bultos", "Obs"])
         self._style_table(self.table_disp)
+        self._orden_disp = OrdenColumnas(self.table_disp, {
+            0: "fecha", 1: "guia", 2: "cliente", 3: "producto", 4: "lote", 5: "sku", 6: "cantidad", 7: "bultos"}, repo.REPORTE_DESP_ORDEN)
+        self._orden_disp.cambio.connect(lambda _: self.table_disp.rowCount() and self._search_disp())
         spl.addWidget(self.table_disp)
 
         if MATPLOTLIB_AVAILABLE:
@@ -252,31 +340,35 @@ class ReportesScreen(QtWidgets.QWidget):
             return
         # ------------------
 
-        cid = self.cb_client.currentData()
+        cid = self.cb_client.client_id()
+        # Un texto que no es una opción de la lista no filtra: sin esto saldrían todos los clientes
+        if cid is None and not self.cb_client.es_todos():
+            QtWidgets.QMessageBox.warning(self, "Cliente", "Seleccione un cliente de la lista, o 'Todos' para no filtrar.")
+            self.cb_client.setFocus()
+            return
         pname = self.cb_disp_prod.currentText(); pname = "" if "Todos" in pname else pname
         guide = self.txt_guide.text().strip()
 
-        try:
-            data = repo.report_dispatches_detailed(d1, d2, cid, pname, guide)
-            self.table_disp.setRowCount(0); stats = {}
-            for r in data:
-                row = self.table_disp.rowCount(); self.table_disp.insertRow(row)
-                tipo = str(r['producto']); pzas = r['cantidad']
-                factor = FACTORES_CONVERSION.get(tipo, 1)
-                bultos = pzas / factor if factor else 0
-
-                self.table_disp.setItem(row, 0, QtWidgets.QTableWidgetItem(str(r['fecha'])))
-                self.table_disp.setItem(row, 1, QtWidgets.QTableWidgetItem(str(r['guia'])))
-                self.table_disp.setItem(row, 2, QtWidgets.QTableWidgetItem(str(r['cliente'])))
-                self.table_disp.setItem(row, 3, QtWidgets.QTableWidgetItem(tipo))
-                self.table_disp.setItem(row, 4, QtWidgets.QTableWidgetItem(str(r['lote'])))
-                self.table_disp.setItem(row, 5, QtWidgets.QTableWidgetItem(str(r['sku'])))
-                self.table_disp.setItem(row, 6, QtWidgets.QTableWidgetItem(f"{pzas:.0f}"))
-                self.table_disp.setItem(row, 7, QtWidgets.QTableWidgetItem(f"{bultos:.1f}"))
-                self.table_disp.setItem(row, 8, QtWidgets.QTableWidgetItem(str(r['obs'])))
-                stats[tipo] = stats.get(tipo, 0) + pzas
-            if MATPLOTLIB_AVAILABLE: self._update_chart(self.chart_disp, stats, "Despachos (Piezas)")
-        except Exception as e: QtWidgets.QMessageBox.critical(self, "Error", str(e))
+        orden = self._orden_disp.orden
+        self._ejecutar("disp", lambda token: repo.report_dispatches_detailed(d1, d2, cid, pname, guide, cancel=token, orden=orden), self._mostrar_disp)
+
+    def _mostrar_disp(self, data):
+        self.table_disp.setRowCount(0); stats = {}
+        for r in data:
+            row = self.table_disp.rowCount(); self.table_disp.insertRow(row)
+            tipo = str(r['producto']); pzas = r['cantidad']; bultos = r['bultos']
+
+            self.table_disp.setItem(row, 0, QtWidgets.QTableWidgetItem(str(r['fecha'])))
+            self.table_disp.setItem(row, 1, QtWidgets.QTableWidgetItem(str(r['guia'])))
+            self.table_disp.setItem(row, 2, QtWidgets.QTableWidgetItem(str(r['cliente'])))
+            self.table_disp.setItem(row, 3, QtWidgets.QTableWidgetItem(tipo))
+            self.table_disp.setItem(row, 4, QtWidgets.QTableWidgetItem(str(r['lote'])))
+            self.table_disp.setItem(row, 5, QtWidgets.QTableWidgetItem(str(r['sku'])))
+            self.table_disp.setItem(row, 6, QtWidgets.QTableWidgetItem(f"{pzas:.0f}"))
+            self.table_disp.setItem(row, 7, QtWidgets.QTableWidgetItem(f"{bultos:.1f}"))
+            self.table_disp.setItem(row, 8, QtWidgets.QTableWidgetItem(str(r['obs'])))
+            stats[tipo] = stats.get(tipo, 0) + pzas
+        if MATPLOTLIB_AVAILABLE: self._update_chart(self.chart_disp, stats, "Despachos (Piezas)")
 
     # ---------------- TAB 3: LOTES ----------------
     def _setup_lote_tab(self, parent):
@@ -296,7 +388,7 @@ class ReportesScreen(QtWidgets.QWidget):
         
         h.addWidget(QtWidgets.QLabel("Desde:")); h.addWidget(self.s_l1)
         h.addWidget(QtWidgets.QLabel("Hasta:")); h.addWidget(self.s_l2)
-        h.addWidget(self.cb_lote_prod); h.addWidget(self.chk_agotados); h.addWidget(btn); h.addStretch()
+        h.addWidget(self.cb_lote_prod); h.addWidget(self.chk_agotados); h.addWidget(btn); h.addWidget(self._boton_cancelar("lote", btn)); h.addStretch()
         l.addLayout(h)
 
         self.table_lote = QtWidgets.QTableWidget()
@@ -315,23 +407,164 @@ class ReportesScreen(QtWidgets.QWidget):
         incluir = self.chk_agotados.isChecked()
         pname = self.cb_lote_prod.currentText(); pname = None if "Todos" in pname else pname
 
-        try:
-            data = repo.report_by_lot_range(l1, l2, incluir, pname)
-            self.table_lote.setRowCount(0)
-            for r in data:
-                row = self.table_lote.rowCount(); self.table_lote.insertRow(row)
-                tipo = str(r['producto']); stock = r['stock_actual']
-                factor = FACTORES_CONVERSION.get(tipo, 1)
-                bultos = stock / factor if factor else 0
-
-                self.table_lote.setItem(row, 0, QtWidgets.QTableWidgetItem(str(r['lote'])))
-                self.table_lote.setItem(row, 1, QtWidgets.QTableWidgetItem(str(r['sku'])))
-                self.table_lote.setItem(row, 2, QtWidgets.QTableWidgetItem(tipo))
-                self.table_lote.setItem(row, 3, QtWidgets.QTableWidgetItem(str(r['fecha_prod'])))
-                self.table_lote.setItem(row, 4, QtWidgets.QTableWidgetItem(f"{stock:.0f}"))
-                self.table_lote.setItem(row, 5, QtWidgets.QTableWidgetItem(f"{bultos:.1f}"))
-                self.table_lote.setItem(row, 6, QtWidgets.QTableWidgetItem(str(r['estado'])))
-        except Exception as e: QtWidgets.QMessageBox.critical(self, "Error", str(e))
+        self._ejecutar("lote", lambda token: repo.report_by_lot_range(l1, l2, incluir, pname, cancel=token), self._mostrar_lotes)
+
+    def _mostrar_lotes(self, data):
+        self.table_lote.setRowCount(0)
+        for r in data:
+            row = self.table_lote.rowCount(); self.table_lote.insertRow(row)
+            tipo = str(r['producto']); stock = r['stock_actual']; bultos = r['bultos']
+
+            self.table_lote.setItem(row, 0, QtWidgets.QTableWidgetItem(str(r['lote'])))
+            self.table_lote.setItem(row, 1, QtWidgets.QTableWidgetItem(str(r['sku'])))
+            self.table_lote.setItem(row, 2, QtWidgets.QTableWidgetItem(tipo))
+            self.table_lote.setItem(row, 3, QtWidgets.QTableWidgetItem(str(r['fecha_prod'])))
+            self.table_lote.setItem(row, 4, QtWidgets.QTableWidgetItem(f"{stock:.0f}"))
+            self.table_lote.setItem(row, 5, QtWidgets.QTableWidgetItem(f"{bultos:.1f}"))
+            self.table_lote.setItem(row, 6, QtWidgets.QTableWidgetItem(str(r['estado'])))
+
+    # ---------------- TAB 4: STOCK A LA FECHA ----------------
+    def _setup_stock_tab(self, parent):
+        l = QtWidgets.QVBoxLayout(parent)
+        h = QtWidgets.QHBoxLayout(); h.setSpacing(15)
+
+        # Por defecto: cierre del mes anterior
+        self.d_stock = QtWidgets.QDateEdit(date.today().replace(day=1) - timedelta(days=1)); self.d_stock.setCalendarPopup(True)
+        self.cb_stock_prod = QtWidgets.QComboBox(); self.cb_stock_prod.addItems(["Todos los Productos", "Tablas", "Machihembrado", "Tablones", "Paletas"])
+        self._estilizar_input(self.d_stock); self._estilizar_input(self.cb_stock_prod)
+        self.rb_stock_lote = QtWidgets.QRadioButton("Por Lote"); self.rb_stock_lote.setChecked(True)
+        self.rb_stock_prod = QtWidgets.QRadioButton("Por Producto")
+        for rb in [self.rb_stock_lote, self.rb_stock_prod]: rb.setStyleSheet("color: white; font-weight: bold;")
+
+        btn = QtWidgets.QPushButton("🔍 Buscar"); btn.clicked.connect(self._search_stock)
+        btn.setStyleSheet(f"background-color: {theme.BTN_PRIMARY}; font-weight: bold; padding: 6px 15px; border-radius: 4px; color: white;")
+
+        h.addWidget(QtWidgets.QLabel("Al cierre del:")); h.addWidget(self.d_stock)
+        h.addWidget(self.cb_stock_prod); h.addWidget(self.rb_stock_lote); h.addWidget(self.rb_stock_prod); h.addWidget(btn); h.addWidget(self._boton_cancelar("stock", btn)); h.addStretch()
+        l.addLayout(h)
+
+        self.table_stock = QtWidgets.QTableWidget()
+        self.table_stock.setColumnCount(5); self.table_stock.setHorizontalHeaderLabels(["Lote", "SKU", "Producto", "Stock (Pzas)", "Bultos"])
+        self._style_table(self.table_stock); l.addWidget(self.table_stock)
+
+        self.lbl_stock_total = QtWidgets.QLabel(""); self.lbl_stock_total.setStyleSheet(f"color: {theme.ACCENT_COLOR}; font-weight: bold;")
+        l.addWidget(self.lbl_stock_total)
+
+        btn_xls = QtWidgets.QPushButton("📊 Exportar Excel"); btn_xls.clicked.connect(lambda: exportar_tabla_excel(self, self.table_stock, f"stock_{self.d_stock.date().toPython()}"))
+        btn_xls.setStyleSheet("background-color: #217346; color: white; padding: 8px; font-weight: bold;"); l.addWidget(btn_xls)
+
+    def _search_stock(self):
+        pname = self.cb_stock_prod.currentText(); pname = None if "Todos" in pname else pname
+        fecha, por_lote = self.d_stock.date().toPython(), self.rb_stock_lote.isChecked()
+        self._ejecutar("stock", lambda token: repo.stock_as_of(fecha, pname, por_lote, cancel=token), self._mostrar_stock)
+
+    def _mostrar_stock(self, data):
+        self.table_stock.setRowCount(0)
+        for r in data:
+            row = self.table_stock.rowCount(); self.table_stock.insertRow(row)
+            self.table_stock.setItem(row, 0, QtWidgets.QTableWidgetItem(r.nro_lote or "-"))
+            self.table_stock.setItem(row, 1, QtWidgets.QTableWidgetItem(r.sku or "-"))
+            self.table_stock.setItem(row, 2, QtWidgets.QTableWidgetItem(r.product_name))
+            self.table_stock.setItem(row, 3, QtWidgets.QTableWidgetItem(f"{r.quantity:.0f}"))
+            self.table_stock.setItem(row, 4, QtWidgets.QTableWidgetItem(str(r.bultos)))
+        self.lbl_stock_total.setText(f"Total: {sum(r.quantity for r in data):,.0f} piezas | {sum(r.bultos for r in data):,} bultos")
+
+    # ---------------- TAB 5: KARDEX ----------------
+    def _setup_kardex_tab(self, parent):
+        l = QtWidgets.QVBoxLayout(parent)
+        self._kardex_args = None; self._kardex_cursor = None
+
+        r1 = QtWidgets.QHBoxLayout()
+        self.d1_kdx = QtWidgets.QDateEdit(date.today().replace(day=1)); self.d1_kdx.setCalendarPopup(True)
+        self.d2_kdx = QtWidgets.QDateEdit(date.today()); self.d2_kdx.setCalendarPopup(True)
+        self.txt_kdx_lote = QtWidgets.QLineEdit(); self.txt_kdx_lote.setPlaceholderText("Nro. Lote (opcional)")
+        self.cb_kdx_prod = QtWidgets.QComboBox(); self.cb_kdx_prod.addItems(["Todos los Productos", "Tablas", "Machihembrado", "Tablones", "Paletas"])
+        for w in [self.d1_kdx, self.d2_kdx, self.txt_kdx_lote, self.cb_kdx_prod]: self._estilizar_input(w)
+        btn_m = QtWidgets.QPushButton("Mes"); btn_m.clicked.connect(lambda: self._set_date_range(self.d1_kdx, self.d2_kdx, "month"))
+        btn_m.setStyleSheet("background-color: #444; color: white; padding: 4px 8px; border-radius: 4px;")
+        self.rb_kdx_lote = QtWidgets.QRadioButton("Saldo por Lote"); self.rb_kdx_lote.setChecked(True)
+        self.rb_kdx_prod = QtWidgets.QRadioButton("Saldo por Producto")
+        for rb in [self.rb_kdx_lote, self.rb_kdx_prod]: rb.setStyleSheet("color: white; font-weight: bold;")
+        btn = QtWidgets.QPushButton("🔍 Buscar"); btn.clicked.connect(self._search_kardex)
+        btn.setStyleSheet(f"background-color: {theme.BTN_PRIMARY}; font-weight: bold; padding: 6px 15px; border-radius: 4px; color: white;")
+
+        r1.addWidget(QtWidgets.QLabel("Desde:")); r1.addWidget(self.d1_kdx)
+        r1.addWidget(QtWidgets.QLabel("Hasta:")); r1.addWidget(self.d2_kdx); r1.addWidget(btn_m)
+        r1.addWidget(self.txt_kdx_lote); r1.addWidget(self.cb_kdx_prod)
+        r1.addWidget(self.rb_kdx_lote); r1.addWidget(self.rb_kdx_prod); r1.addWidget(btn); r1.addWidget(self._boton_cancelar("kardex", btn)); r1.addStretch()
+        l.addLayout(r1)
+
+        self.table_kdx = QtWidgets.QTableWidget()
+        self.table_kdx.setColumnCount(9); self.table_kdx.setHorizontalHeaderLabels(["Fecha", "Tipo", "Lote", "Producto", "Referencia", "Entrada", "Salida", "Saldo", "Notas"])
+        self._style_table(self.table_kdx); l.addWidget(self.table_kdx)
+        # Al llegar al final de la tabla se trae la página siguiente
+        self.table_kdx.verticalScrollBar().valueChanged.connect(lambda v: v == self.table_kdx.verticalScrollBar().maximum() and self._kardex_mas())
+
+        h = QtWidgets.QHBoxLayout()
+        self.lbl_kdx = QtWidgets.QLabel(""); self.lbl_kdx.setStyleSheet(f"color: {theme.TEXT_SECONDARY};")
+        self.btn_kdx_mas = QtWidgets.QPushButton("Cargar más"); self.btn_kdx_mas.clicked.connect(self._kardex_mas); self.btn_kdx_mas.setEnabled(False)
+        self.btn_kdx_mas.setStyleSheet("background-color: #444; color: white; padding: 6px 12px; border-radius: 4px;")
+        h.addWidget(self.lbl_kdx); h.addStretch(); h.addWidget(self.btn_kdx_mas)
+        l.addLayout(h)
+
+        btn_xls = QtWidgets.QPushButton("📊 Exportar Excel"); btn_xls.clicked.connect(self._export_kardex)
+        btn_xls.setStyleSheet("background-color: #217346; color: white; padding: 8px; font-weight: bold;"); l.addWidget(btn_xls)
+
+    def _search_kardex(self):
+        d1, d2 = self.d1_kdx.date().toPython(), self.d2_kdx.date().toPython()
+        if d1 > d2:
+            QtWidgets.QMessageBox.warning(self, "Error", "La fecha inicial no puede ser mayor a la final.")
+            return
+        pname = self.cb_kdx_prod.currentText(); pname = None if "Todos" in pname else pname
+        self._kardex_args = (d1, d2, self.txt_kdx_lote.text().strip() or None, pname, self.rb_kdx_prod.isChecked())
+        self._kardex_cursor = None
+        self.table_kdx.setRowCount(0)
+        self._kardex_pagina(primera=True)
+
+    def _kardex_mas(self):
+        if self._kardex_args and self._kardex_cursor is not None: self._kardex_pagina()
+
+    def _kardex_pagina(self, primera=False):
+        args, cursor = self._kardex_args, None if primera else self._kardex_cursor
+        # Sin cursor mientras carga: el scroll no vuelve a pedir la misma página
+        self._kardex_cursor = None; self.btn_kdx_mas.setEnabled(False)
+        self._ejecutar("kardex", lambda token: repo.kardex_page(*args, cursor=cursor, cancel=token), self._kardex_recibida)
+
+    def _kardex_recibida(self, datos):
+        filas, self._kardex_cursor = datos
+        self._kardex_agregar(filas)
+
+    def _kardex_agregar(self, filas):
+        t = self.table_kdx
+        t.setUpdatesEnabled(False)
+        for r in filas:
+            row = t.rowCount(); t.insertRow(row)
+            valores = [r.performed_at.strftime("%Y-%m-%d %H:%M"), r.movement_type, r.nro_lote or "-", r.product_name, r.reference or "",
+                       f"{r.change:.0f}" if r.change > 0 else "", f"{-r.change:.0f}" if r.change < 0 else "", f"{r.saldo:.0f}", r.notes or ""]
+            for c, v in enumerate(valores): t.setItem(row, c, QtWidgets.QTableWidgetItem(v))
+        t.setUpdatesEnabled(True)
+        self.btn_kdx_mas.setEnabled(self._kardex_cursor is not None)
+        self.lbl_kdx.setText(f"{t.rowCount()} movimientos" + (" (hay más)" if self._kardex_cursor is not None else ""))
+
+    def _export_kardex(self):
+        # Se exporta el rango completo, no solo las páginas cargadas
+        if not self._kardex_args or self._kardex_cursor is None:
+            exportar_tabla_excel(self, self.table_kdx, "kardex"); return
+        args, cursor = self._kardex_args, self._kardex_cursor
+        self._kardex_cursor = None; self.btn_kdx_mas.setEnabled(False)
+
+        def consulta(token):
+            filas, c = [], cursor
+            while c is not None:
+                pagina, c = repo.kardex_page(*args, cursor=c, cancel=token)
+                filas += pagina
+            return filas, None
+
+        self._ejecutar("kardex", consulta, self._kardex_exportar)
+
+    def _kardex_exportar(self, datos):
+        self._kardex_recibida(datos)
+        exportar_tabla_excel(self, self.table_kdx, "kardex")
 
     def _style_table(self, t):
         t.setStyleSheet(f"QTableWidget {{ background-color: {theme.BG_SIDEBAR}; color: {theme.TEXT_PRIMARY}; gridline-color: {theme.BORDER_COLOR}; }} QHeaderView::section {{ background-color: #1b1b26; color: {theme.TEXT_SECONDARY}; padding: 8px; font-weight: bold; }} QTableWidget::item {{ padding: 5px; }}")
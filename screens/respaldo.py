@@ -1,13 +1,47 @@
 import os
-import sys
-import subprocess
+import shutil
 from datetime import datetime
 from PySide6 import QtWidgets, QtCore
-from core import theme
+from core import theme, backup, incremental, copy_backup
+from core.models import Base
+
+
+class TareaRespaldo(QtCore.QThread):
+    """Ejecuta fn(progress) fuera del hilo de la interfaz; cancelar() la corta en el siguiente paso."""
+    progreso = QtCore.Signal(str, int, int)
+    terminado = QtCore.Signal(object)
+    fallo = QtCore.Signal(str)
+
+    class Cancelado(Exception):
+        pass
+
+    def __init__(self, fn, parent=None):
+        super().__init__(parent)
+        self.fn = fn
+        self._cancelado = False
+
+    def cancelar(self):
+        self._cancelado = True
+
+    def _progress(self, paso, i, total):
+        if self._cancelado: raise TareaRespaldo.Cancelado()
+        self.progreso.emit(paso, i, total)
+
+    def run(self):
+        try:
+            self.terminado.emit(self.fn(self._progress))
+        except TareaRespaldo.Cancelado:
+            self.fallo.emit("")
+        except Exception as e:
+            self.fallo.emit(str(e))
+
 
 class RespaldoScreen(QtWidgets.QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.settings = QtCore.QSettings("TrabajoDeGradoSistemas", "OpenCode")
+        self.proc = None
+        self.tarea = None
         self._build_ui()
 
     def _build_ui(self):
@@ -24,12 +58,37 @@ class RespaldoScreen(QtWidgets.QWidget):
         # Descripción
         desc = QtWidgets.QLabel(
             "Guarda una copia completa de tu base de datos (Productos, Clientes, Inventario).\n"
-            "El archivo generado (.sql) puede usarse para restaurar el sistema en otra PC."
+            "El respaldo generado puede usarse para restaurar el sistema en otra PC."
         )
         desc.setAlignment(QtCore.Qt.AlignCenter)
         desc.setStyleSheet(f"font-size: 12pt; color: {theme.TEXT_SECONDARY};")
         layout.addWidget(desc)
 
+        # Opciones de formato
+        opts = QtWidgets.QFormLayout()
+        self.cb_modo = QtWidgets.QComboBox()
+        self.cb_modo.addItem("Completo (pg_dump)", "full")
+        self.cb_modo.addItem("Incremental (cambios desde el último respaldo)", "incremental")
+        self.cb_modo.currentIndexChanged.connect(self._actualizar_opciones)
+        self.cb_formato = QtWidgets.QComboBox()
+        self.cb_formato.addItem("Personalizado (.dump, comprimido)", "custom")
+        self.cb_formato.addItem("Directorio (paralelo)", "directory")
+        self.cb_formato.addItem("SQL plano (.sql)", "plain")
+        self.cb_formato.addItem("Copia interna por COPY (sin pg_dump)", "copy")
+        self.cb_formato.setCurrentIndex(max(0, self.cb_formato.findData(self.settings.value("backup/format", "custom"))))
+        self.cb_formato.currentIndexChanged.connect(self._actualizar_opciones)
+        self.spin_jobs = QtWidgets.QSpinBox(); self.spin_jobs.setRange(1, max(1, os.cpu_count() or 1))
+        self.spin_jobs.setValue(int(self.settings.value("backup/jobs", min(4, os.cpu_count() or 1))))
+        self.spin_comp = QtWidgets.QSpinBox(); self.spin_comp.setRange(0, 9)
+        self.spin_comp.setValue(int(self.settings.value("backup/compression", 6)))
+        opts.addRow("Tipo:", self.cb_modo)
+        opts.addRow("Formato:", self.cb_formato)
+        opts.addRow("Procesos paralelos (-j):", self.spin_jobs)
+        opts.addRow("Compresión (0-9):", self.spin_comp)
+        opts_box = QtWidgets.QWidget(); opts_box.setLayout(opts); opts_box.setMaximumWidth(480)
+        layout.addWidget(opts_box, alignment=QtCore.Qt.AlignCenter)
+        self._actualizar_opciones()
+
         # Contenedor del Botón
         btn_container = QtWidgets.QWidget()
         btn_layout = QtWidgets.QHBoxLayout(btn_container)
@@ -51,96 +110,421 @@ class RespaldoScreen(QtWidgets.QWidget):
             QPushButton:pressed {{ background-color: #0a58ca; }}
         """)
         self.btn_backup.clicked.connect(self._generar_respaldo)
+
+        self.btn_cancel = QtWidgets.QPushButton("Cancelar")
+        self.btn_cancel.setMinimumHeight(60)
+        self.btn_cancel.setStyleSheet(f"background-color: {theme.BTN_DANGER}; color: white; font-weight: bold; border-radius: 8px; padding: 10px 20px;")
+        self.btn_cancel.setEnabled(False)
+        self.btn_cancel.clicked.connect(self._cancelar)
         
+        self.btn_restore = QtWidgets.QPushButton("Restaurar...")
+        self.btn_restore.setCursor(QtCore.Qt.PointingHandCursor)
+        self.btn_restore.setMinimumHeight(60)
+        self.btn_restore.setStyleSheet(f"background-color: {theme.BG_INPUT}; color: white; font-weight: bold; border-radius: 8px; padding: 10px 20px;")
+        self.btn_restore.clicked.connect(self._restaurar)
+
         btn_layout.addStretch()
         btn_layout.addWidget(self.btn_backup)
+        btn_layout.addWidget(self.btn_restore)
+        btn_layout.addWidget(self.btn_cancel)
         btn_layout.addStretch()
         
         layout.addWidget(btn_container)
+
+        # Progreso (pg_dump -v informa cada tabla que empieza a volcar)
+        self.progress = QtWidgets.QProgressBar()
+        self.progress.setMaximumWidth(480); self.progress.setVisible(False)
+        layout.addWidget(self.progress, alignment=QtCore.Qt.AlignCenter)
+        self.lbl_estado = QtWidgets.QLabel("")
+        self.lbl_estado.setAlignment(QtCore.Qt.AlignCenter)
+        self.lbl_estado.setStyleSheet(f"color: {theme.TEXT_SECONDARY};")
+        layout.addWidget(self.lbl_estado)
+
+        # Respaldo automático (lo ejecuta core.backup_scheduler desde la ventana principal)
+        auto = QtWidgets.QGroupBox("Respaldo automático")
+        auto.setMaximumWidth(480)
+        auto_form = QtWidgets.QFormLayout(auto)
+        self.chk_auto = QtWidgets.QCheckBox("Activado")
+        self.chk_auto.setChecked(self.settings.value("backup/auto_enabled", "false") == "true")
+        self.inp_horas = QtWidgets.QLineEdit(str(self.settings.value("backup/auto_times", "02:00")))
+        self.inp_horas.setPlaceholderText("HH:MM, separadas por coma")
+        self.inp_carpeta = QtWidgets.QLineEdit(str(self.settings.value("backup/auto_dir", "")))
+        btn_carpeta = QtWidgets.QPushButton("...")
+        btn_carpeta.clicked.connect(self._elegir_carpeta_auto)
+        fila_carpeta = QtWidgets.QHBoxLayout(); fila_carpeta.addWidget(self.inp_carpeta); fila_carpeta.addWidget(btn_carpeta)
+        self.spin_diarios = QtWidgets.QSpinBox(); self.spin_diarios.setRange(1, 60)
+        self.spin_diarios.setValue(int(self.settings.value("backup/keep_daily", 7)))
+        self.spin_semanales = QtWidgets.QSpinBox(); self.spin_semanales.setRange(0, 52)
+        self.spin_semanales.setValue(int(self.settings.value("backup/keep_weekly", 4)))
+        auto_form.addRow(self.chk_auto)
+        auto_form.addRow("Horas:", self.inp_horas)
+        auto_form.addRow("Carpeta:", fila_carpeta)
+        auto_form.addRow("Copias diarias:", self.spin_diarios)
+        auto_form.addRow("Copias semanales:", self.spin_semanales)
+        self.chk_auto.toggled.connect(self._guardar_auto)
+        self.inp_horas.editingFinished.connect(self._guardar_auto)
+        self.inp_carpeta.editingFinished.connect(self._guardar_auto)
+        self.spin_diarios.valueChanged.connect(self._guardar_auto)
+        self.spin_semanales.valueChanged.connect(self._guardar_auto)
+        layout.addWidget(auto, alignment=QtCore.Qt.AlignCenter)
         layout.addStretch()
 
+    def _elegir_carpeta_auto(self):
+        carpeta = QtWidgets.QFileDialog.getExistingDirectory(self, "Carpeta de respaldos automáticos", self.inp_carpeta.text())
+        if carpeta:
+            self.inp_carpeta.setText(carpeta); self._guardar_auto()
+
+    def _guardar_auto(self):
+        self.settings.setValue("backup/auto_enabled", "true" if self.chk_auto.isChecked() else "false")
+        self.settings.setValue("backup/auto_times", self.inp_horas.text().strip() or "02:00")
+        self.settings.setValue("backup/auto_dir", self.inp_carpeta.text().strip())
+        self.settings.setValue("backup/keep_daily", self.spin_diarios.value())
+        self.settings.setValue("backup/keep_weekly", self.spin_semanales.value())
+
+    def _actualizar_opciones(self):
+        fmt = self.cb_formato.currentData()
+        completo = self.cb_modo.currentData() == "full"
+        self.cb_formato.setEnabled(completo)
+        self.spin_jobs.setEnabled(completo and fmt == "directory")
+        self.spin_comp.setEnabled(not completo or fmt != "plain")
+
+    def _ocupado(self, si):
+        self.btn_backup.setEnabled(not si); self.btn_restore.setEnabled(not si); self.btn_cancel.setEnabled(si)
+        self.progress.setVisible(si)
+
     def _find_pg_dump(self):
-        """Intenta localizar el ejecutable pg_dump en el sistema."""
-        # 1. Si está en el PATH global
-        #return "pg_dump"
-        
-        # NOTA: Si sigue fallando, descomenta estas líneas y pon TU ruta real:
-        return r"C:\Program Files\PostgreSQL\14\bin\pg_dump.exe"
+        """Localiza pg_dump: ruta configurada (backup/pg_bin), PG_BIN, PATH o instalación estándar."""
+        return backup.find_pg_tool("pg_dump", self.settings.value("backup/pg_bin", ""))
 
     def _generar_respaldo(self):
-        DB_NAME = "astillados_db"
-        DB_USER = "postgres"
+        if self.proc is not None or self.tarea is not None: return
+        if self.cb_modo.currentData() == "incremental":
+            self._generar_incremental()
+            return
+        fmt = self.cb_formato.currentData()
         
-        # Nombre sugerido
-        fecha = datetime.now().strftime("%Y-%m-%d_%H-%M")
-        nombre_archivo = f"respaldo_astillados_{fecha}.sql"
+        # Nombre sugerido (con segundos: dos respaldos en el mismo minuto no chocan)
+        fecha = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        nombre_archivo = f"respaldo_astillados_{fecha}{backup.EXTENSIONES[fmt]}"
         
-        path, _ = QtWidgets.QFileDialog.getSaveFileName(
-            self, "Guardar Respaldo SQL", nombre_archivo, "SQL Files (*.sql)"
-        )
+        if fmt in ("directory", "copy"):
+            # pg_dump crea la carpeta: se elige dónde y se usa un nombre nuevo
+            base = QtWidgets.QFileDialog.getExistingDirectory(self, "Carpeta donde guardar el respaldo")
+            path = os.path.join(base, nombre_archivo) if base else ""
+        else:
+            filtro = "Respaldo PostgreSQL (*.dump)" if fmt == "custom" else "SQL Files (*.sql)"
+            path, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Guardar Respaldo", nombre_archivo, filtro)
         
         if not path: return
 
-        # Preparar comando
-        pg_dump_cmd = self._find_pg_dump()
-        
-        # Configurar entorno (Password vacía para evitar prompt)
-        env = os.environ.copy()
-        env["PGPASSWORD"] = "" # Asumiendo acceso confiable local
-
-        comando = [
-            pg_dump_cmd,
-            "-h", "localhost",
-            "-U", DB_USER,
-            "-F", "p", # Formato plano (Plain Text)
-            "-f", path,
-            DB_NAME
-        ]
-
-        # Ejecutar
+        pg_dump_cmd = self._find_pg_dump() if fmt != "copy" else None
+        if fmt != "copy" and not pg_dump_cmd:
+            resp = QtWidgets.QMessageBox.question(
+                self, "pg_dump no encontrado", 
+                "No se encontró el comando 'pg_dump'.\n"
+                "Asegúrate de que PostgreSQL está instalado y la carpeta 'bin' está en el PATH,\n"
+                "o configura la ruta en la clave 'backup/pg_bin'.\n\n"
+                "¿Generar el respaldo con la copia interna (COPY) en su lugar?"
+            )
+            if resp != QtWidgets.QMessageBox.Yes: return
+            fmt = "copy"
+            path = os.path.join(os.path.dirname(path), f"respaldo_astillados_{fecha}")
+        if fmt == "copy":
+            self._generar_copia(path)
+            return
+
+        self.settings.setValue("backup/format", fmt)
+        self.settings.setValue("backup/jobs", self.spin_jobs.value())
+        self.settings.setValue("backup/compression", self.spin_comp.value())
+
+        self._path = path; self._propia = not os.path.isdir(path); self._formato = fmt; self._dump_fin = None; self._stats = {}; self._stats_tarea = None
+        # Foto exportada: pg_dump vuelca exactamente lo que ven la marca de agua y los conteos del manifest
         try:
-            # Ocultar ventana de consola en Windows
-            startupinfo = None
-            if os.name == 'nt':
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-
-            process = subprocess.Popen(
-                comando, 
-                env=env, 
-                startupinfo=startupinfo,
-                stderr=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stdin=subprocess.PIPE # Evitar bloqueo si pide input
+            self._snap = backup.SnapshotExportado()
+            self._watermark = incremental.watermark_from_cursor(self._snap.cur)
+        except Exception:
+            self._snap = None
+            try: self._watermark = incremental.current_watermark()
+            except Exception: self._watermark = None
+
+        programa, args, env = backup.pg_dump_command(pg_dump_cmd, path, fmt, self.spin_jobs.value(), self.spin_comp.value(),
+                                                     snapshot=self._snap.id if self._snap else None)
+        self._iniciar_proceso(programa, args, env, self._respaldo_terminado, len(Base.metadata.tables))
+        self.lbl_estado.setText("Iniciando respaldo...")
+
+        if self._snap:
+            # Conteos y sumas de verificación en paralelo con pg_dump, sobre la misma foto
+            snap = self._snap
+            self._stats_tarea = TareaRespaldo(lambda progress: backup.table_stats(snap.cur, progress=progress), self)
+            self._stats_tarea.terminado.connect(self._stats_listos)
+            self._stats_tarea.fallo.connect(self._stats_listos)
+            self._stats_tarea.start(QtCore.QThread.LowPriority)
+
+    def _iniciar_proceso(self, programa, args, env, al_terminar, pasos):
+        self._stderr = []; self._tablas = 0; self._cancelado = False; self._al_terminar = al_terminar
+        self.proc = QtCore.QProcess(self)
+        penv = QtCore.QProcessEnvironment()
+        for k, v in env.items(): penv.insert(k, v)
+        self.proc.setProcessEnvironment(penv)
+        self.proc.readyReadStandardError.connect(self._leer_progreso)
+        self.proc.finished.connect(al_terminar)
+        self.proc.errorOccurred.connect(self._error_proceso)
+        self.progress.setRange(0, pasos); self.progress.setValue(0)
+        self._ocupado(True)
+        self.proc.start(programa, args)
+
+    def _stats_listos(self, stats):
+        self._stats = stats if isinstance(stats, dict) else {}
+        self._stats_tarea.deleteLater(); self._stats_tarea = None
+        if self._dump_fin is not None: self._finalizar_respaldo()
+
+    def _generar_copia(self, path):
+        self._path = path; self._propia = not os.path.exists(path)
+        comp = self.spin_comp.value()
+        self.settings.setValue("backup/compression", comp)
+        self.tarea = TareaRespaldo(lambda progress: copy_backup.export_full(path, compresion=comp, progress=progress), self)
+        self.tarea.progreso.connect(self._progreso_tarea)
+        self.tarea.terminado.connect(self._copia_terminada)
+        self.tarea.fallo.connect(self._tarea_fallida)
+        self.progress.setRange(0, len(Base.metadata.tables)); self.progress.setValue(0)
+        self.lbl_estado.setText("Iniciando copia interna...")
+        self._ocupado(True)
+        self.tarea.start(QtCore.QThread.LowPriority)
+
+    def _copia_terminada(self, manifest):
+        self._fin_tarea()
+        self.lbl_estado.setText(f"Último respaldo: {datetime.now():%d/%m/%Y %H:%M}")
+        QtWidgets.QMessageBox.information(
+            self, "Respaldo Exitoso",
+            f"La base de datos se ha guardado correctamente en:\n\n{self._path}"
+        )
+
+    def _generar_incremental(self):
+        base = QtWidgets.QFileDialog.getExistingDirectory(self, "Carpeta donde guardar el incremental")
+        if not base: return
+        # Con segundos: dos incrementales en el mismo minuto no chocan
+        fecha = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        self._path = os.path.join(base, f"incremental_astillados_{fecha}")
+        self._propia = not os.path.exists(self._path)
+        comp = self.spin_comp.value()
+        self.tarea = TareaRespaldo(lambda progress: incremental.export_incremental(self._path, compresion=comp, progress=progress), self)
+        self.tarea.progreso.connect(self._progreso_tarea)
+        self.tarea.terminado.connect(self._incremental_terminado)
+        self.tarea.fallo.connect(self._tarea_fallida)
+        self.progress.setRange(0, len(incremental.TABLAS)); self.progress.setValue(0)
+        self.lbl_estado.setText("Buscando cambios desde el último respaldo...")
+        self._ocupado(True)
+        self.tarea.start(QtCore.QThread.LowPriority)
+
+    def _progreso_tarea(self, paso, i, total):
+        self.progress.setRange(0, total); self.progress.setValue(i)
+        self.lbl_estado.setText(f"Procesando {paso}...")
+
+    def _fin_tarea(self):
+        self.tarea.deleteLater(); self.tarea = None
+        self._ocupado(False)
+
+    def _incremental_terminado(self, manifest):
+        self._fin_tarea()
+        filas = sum(t["rows"] for t in manifest["tables"].values())
+        self.lbl_estado.setText(f"Último respaldo (incremental): {datetime.now():%d/%m/%Y %H:%M}")
+        QtWidgets.QMessageBox.information(
+            self, "Respaldo Exitoso",
+            f"Incremental guardado en:\n\n{self._path}\n\nFilas nuevas o modificadas: {filas}"
+        )
+
+    def _tarea_fallida(self, msg):
+        self._fin_tarea()
+        # Solo se borra la carpeta que creó esta tarea, nunca un respaldo que ya existía
+        if self._propia and self._path and os.path.isdir(self._path): shutil.rmtree(self._path, ignore_errors=True)
+        if not msg:
+            self.lbl_estado.setText("Operación cancelada.")
+            return
+        self.lbl_estado.setText("La operación falló.")
+        QtWidgets.QMessageBox.critical(self, "Error de Respaldo", msg)
+
+    def _leer_progreso(self):
+        texto = bytes(self.proc.readAllStandardError()).decode("utf-8", errors="ignore")
+        for linea in texto.splitlines():
+            self._stderr.append(linea)
+            tabla = backup.parse_progress(linea)
+            if tabla:
+                self._tablas += 1
+                if self._tablas > self.progress.maximum(): self.progress.setMaximum(self._tablas)
+                self.progress.setValue(self._tablas)
+                self.lbl_estado.setText(f"Copiando {tabla}...")
+
+    def _cancelar(self):
+        if self.tarea is not None:
+            self.tarea.cancelar(); return
+        if getattr(self, "_stats_tarea", None) is not None: self._stats_tarea.cancelar()
+        if self.proc is None: return
+        self._cancelado = True
+        self.proc.kill()
+
+    def _error_proceso(self, error):
+        if error == QtCore.QProcess.FailedToStart:
+            # Qt no emite finished si el programa no llegó a arrancar
+            self._stderr.append(self.proc.errorString())
+            self._al_terminar(-1, QtCore.QProcess.CrashExit)
+
+    def _limpiar_parcial(self):
+        if os.path.isdir(self._path):
+            if self._propia: shutil.rmtree(self._path, ignore_errors=True)
+        elif os.path.exists(self._path): os.remove(self._path)
+
+    def _respaldo_terminado(self, code=-1, status=None):
+        if self.proc is None: return
+        self.proc.deleteLater(); self.proc = None
+        self._dump_fin = (code, status)
+        if self._stats_tarea is not None:
+            self.lbl_estado.setText("Calculando sumas de verificación...")
+            return
+        self._finalizar_respaldo()
+
+    def _finalizar_respaldo(self):
+        code, status = self._dump_fin
+        if self._snap: self._snap.cerrar(); self._snap = None
+        self._ocupado(False)
+        err_msg = "\n".join(l for l in self._stderr if not backup.parse_progress(l))
+
+        if self._cancelado:
+            self._limpiar_parcial()
+            self.lbl_estado.setText("Respaldo cancelado.")
+            return
+
+        if code == 0 and status == QtCore.QProcess.NormalExit:
+            if self._watermark:
+                incremental.write_full_manifest(self._path, self._watermark, self._formato, self._stats)
+                incremental.save_watermark(self._watermark)
+            self.lbl_estado.setText(f"Último respaldo: {datetime.now():%d/%m/%Y %H:%M}")
+            QtWidgets.QMessageBox.information(
+                self, "Respaldo Exitoso", 
+                f"La base de datos se ha guardado correctamente en:\n\n{self._path}"
             )
-            
-            _, stderr = process.communicate()
-
-            if process.returncode == 0:
-                QtWidgets.QMessageBox.information(
-                    self, "Respaldo Exitoso", 
-                    f"La base de datos se ha guardado correctamente en:\n\n{path}"
-                )
-            else:
-                err_msg = stderr.decode('utf-8', errors='ignore')
-                # Filtramos advertencias comunes que no son errores fatales
-                if "version mismatch" in err_msg and os.path.exists(path) and os.path.getsize(path) > 0:
-                     QtWidgets.QMessageBox.information(
-                        self, "Aviso", 
-                        f"El respaldo se creó, pero hubo advertencias de versión:\n{path}"
-                    )
-                else:
-                    QtWidgets.QMessageBox.critical(
-                        self, "Error de Respaldo", 
-                        f"El proceso falló. Detalles técnicos:\n\n{err_msg}\n\n"
-                        "Posible solución: Verifica que PostgreSQL esté corriendo y no tengas tablas bloqueadas."
-                    )
-
-        except FileNotFoundError:
+        elif "version mismatch" in err_msg and os.path.exists(self._path):
+            self.lbl_estado.setText("Respaldo creado con advertencias.")
+            QtWidgets.QMessageBox.information(
+                self, "Aviso", 
+                f"El respaldo se creó, pero hubo advertencias de versión:\n{self._path}"
+            )
+        else:
+            self.lbl_estado.setText("El respaldo falló.")
             QtWidgets.QMessageBox.critical(
-                self, "Error: pg_dump no encontrado", 
-                "No se encontró el comando 'pg_dump'.\n"
-                "Asegúrate de que PostgreSQL está instalado y la carpeta 'bin' está en el PATH de Windows."
+                self, "Error de Respaldo", 
+                f"El proceso falló. Detalles técnicos:\n\n{err_msg[-2000:]}\n\n"
+                "Posible solución: Verifica que PostgreSQL esté corriendo y no tengas tablas bloqueadas."
             )
-        except Exception as e:
-            QtWidgets.QMessageBox.critical(self, "Error Inesperado", str(e))
\ No newline at end of file
+
+    # ---------- RESTAURACIÓN ----------
+    def _restaurar(self):
+        if self.proc is not None or self.tarea is not None: return
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(
+            self, "Seleccionar Respaldo", "", "Manifiesto de respaldo (*.manifest.json manifest.json);;Respaldo PostgreSQL (*.dump)"
+        )
+        if not path: return
+        manifest = incremental.read_manifest(path)
+        if path.endswith(".manifest.json"): path = path[:-len(".manifest.json")]
+        elif os.path.basename(path) == "manifest.json": path = os.path.dirname(path)
+        if manifest and manifest["kind"] != "full":
+            QtWidgets.QMessageBox.warning(self, "Aviso", "Seleccione el respaldo completo; los incrementales se eligen después.")
+            return
+        if manifest is None and path.endswith(".dump"): manifest = incremental.read_manifest(path)
+
+        if (manifest and manifest.get("dump_format") == "plain") or path.lower().endswith(".sql"):
+            QtWidgets.QMessageBox.warning(self, "Aviso", "Los respaldos en SQL plano se restauran con psql.\nGenere respaldos en formato personalizado o directorio.")
+            return
+
+        cadena = []
+        if manifest and QtWidgets.QMessageBox.question(
+                self, "Incrementales", "¿Aplicar también los respaldos incrementales posteriores?") == QtWidgets.QMessageBox.Yes:
+            carpeta = QtWidgets.QFileDialog.getExistingDirectory(self, "Carpeta con los incrementales")
+            if carpeta: cadena = incremental.find_chain(manifest, carpeta)
+
+        aviso = f"Se reemplazarán TODOS los datos actuales con el respaldo:\n\n{path}"
+        if cadena: aviso += f"\n\nmás {len(cadena)} incremental(es)."
+        if not manifest: aviso += "\n\nEl respaldo no tiene manifiesto: no se podrá verificar."
+        if QtWidgets.QMessageBox.warning(self, "Confirmar Restauración", aviso + "\n\n¿Continuar?",
+                                         QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No) != QtWidgets.QMessageBox.Yes:
+            return
+
+        from core.db import engine, report_engine
+        if manifest and manifest.get("dump_format") == copy_backup.DUMP_FORMAT:
+            # Copia interna: se restaura con COPY FROM STDIN, sin pg_restore
+            engine.dispose(); report_engine.dispose()
+            self._path = None; self._cadena = cadena; self._advertencias = False
+            self._iniciar_tarea_restauracion(lambda progress: self._restaurar_copia(path, manifest, cadena, progress))
+            self.lbl_estado.setText("Restaurando copia interna...")
+            return
+
+        pg_restore = backup.find_pg_tool("pg_restore", self.settings.value("backup/pg_bin", ""))
+        if not pg_restore:
+            QtWidgets.QMessageBox.critical(self, "Error", "No se encontró el comando 'pg_restore'.")
+            return
+
+        engine.dispose(); report_engine.dispose()  # Sin conexiones abiertas de la app mientras se reemplazan las tablas
+        self._path = None; self._restore_manifest = manifest; self._cadena = cadena
+        programa, args, env = backup.pg_restore_command(pg_restore, path, self.spin_jobs.value())
+        pasos = len(manifest.get("tables") or {}) if manifest else 0
+        self._iniciar_proceso(programa, args, env, self._restauracion_terminada, pasos or len(Base.metadata.tables))
+        self.lbl_estado.setText("Restaurando respaldo...")
+
+    def _restauracion_terminada(self, code=-1, status=None):
+        if self.proc is None: return
+        self.proc.deleteLater(); self.proc = None
+        if self._cancelado:
+            self._ocupado(False)
+            self.lbl_estado.setText("Restauración cancelada: la base puede haber quedado incompleta.")
+            return
+        if status != QtCore.QProcess.NormalExit or (code != 0 and not self._restore_manifest):
+            self._ocupado(False)
+            self.lbl_estado.setText("La restauración falló.")
+            err_msg = "\n".join(l for l in self._stderr if not backup.parse_progress(l))
+            QtWidgets.QMessageBox.critical(self, "Error de Restauración", err_msg[-2000:])
+            return
+
+        # pg_restore puede terminar con código 1 por advertencias: la verificación decide
+        self._advertencias = code != 0
+        manifest, cadena = self._restore_manifest, self._cadena
+        self._iniciar_tarea_restauracion(lambda progress: self._verificar_y_aplicar(manifest, cadena, progress))
+        self.lbl_estado.setText("Verificando respaldo...")
+
+    def _iniciar_tarea_restauracion(self, fn):
+        self.tarea = TareaRespaldo(fn, self)
+        self.tarea.progreso.connect(self._progreso_tarea)
+        self.tarea.terminado.connect(self._verificacion_terminada)
+        self.tarea.fallo.connect(self._tarea_fallida)
+        self._ocupado(True)
+        self.tarea.start(QtCore.QThread.LowPriority)
+
+    @classmethod
+    def _restaurar_copia(cls, path, manifest, cadena, progress):
+        copy_backup.restore_full(path, progress)
+        return cls._verificar_y_aplicar(manifest, cadena, progress)
+
+    @staticmethod
+    def _verificar_y_aplicar(manifest, cadena, progress):
+        from core.db import engine
+        diferencias = backup.verify_stats(manifest["tables"], progress) if manifest and manifest.get("tables") else None
+        if diferencias: return diferencias
+        if manifest: incremental.save_watermark(manifest["until"])  # Los próximos incrementales parten de este respaldo
+        for ruta, _ in cadena:
+            incremental.apply_incremental(ruta, progress=progress)
+        with engine.connect() as conn:
+            conn.execution_options(isolation_level="AUTOCOMMIT").exec_driver_sql("ANALYZE")
+        return diferencias
+
+    def _verificacion_terminada(self, diferencias):
+        self._fin_tarea()
+        if diferencias:
+            detalle = "\n".join(f"{t}: esperado {e['rows']} filas, encontrado {a['rows'] if a else 'sin tabla'}"
+                                for t, (e, a) in diferencias.items())
+            self.lbl_estado.setText("Restauración con diferencias.")
+            QtWidgets.QMessageBox.critical(self, "Verificación Fallida",
+                                           f"Los datos restaurados no coinciden con el manifiesto:\n\n{detalle}")
+            return
+        estado = "verificada" if diferencias is not None else "sin verificar (no hay manifiesto)"
+        if self._cadena: estado += f", {len(self._cadena)} incremental(es) aplicado(s)"
+        if self._advertencias: estado += ", pg_restore informó advertencias"
+        self.lbl_estado.setText(f"Restauración {estado}: {datetime.now():%d/%m/%Y %H:%M}")
+        QtWidgets.QMessageBox.information(self, "Restauración Exitosa", f"La base de datos se restauró correctamente ({estado}).")